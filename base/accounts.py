@@ -0,0 +1,115 @@
+import os
+import threading
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .cache import account_cache
+from .models import ZohoAccount
+from .timing import timed
+
+_MISSING = object()
+_PRIMARY_KEY = ('primary',)
+
+_lock = threading.Lock()
+# Bumped by every local invalidation, so a lookup that raced one doesn't cache what it read
+_generation = 0
+# Identity of the shared version file when the cache was last known to be current
+_seen_version = None
+
+
+def _version_path():
+    lock_dir = getattr(settings, 'ZOHO_LOCK_DIR', None)
+    return os.path.join(lock_dir, 'zoho_accounts.version') if lock_dir else None
+
+
+def _read_version():
+    path = _version_path()
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def _clear_local():
+    global _generation
+    with _lock:
+        _generation += 1
+        account_cache.clear()
+
+
+def invalidate_accounts():
+    """
+    Drop cached accounts in this process and tell other workers on the host to do the same.
+    The version file is replaced rather than rewritten, so its inode changes on every bump.
+    """
+    global _seen_version
+    _clear_local()
+
+    path = _version_path()
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}"
+        with open(tmp_path, 'w') as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp_path, path)
+    _seen_version = _read_version()
+
+
+def _check_version():
+    global _seen_version
+    version = _read_version()
+    if version != _seen_version:
+        _clear_local()
+        _seen_version = version
+
+
+def _cache_key(tenant_id):
+    return ('tenant', tenant_id) if tenant_id else _PRIMARY_KEY
+
+
+def _cached(tenant_id):
+    _check_version()
+    return account_cache.get(_cache_key(tenant_id), _MISSING)
+
+
+def _load(tenant_id):
+    with _lock:
+        generation = _generation
+    if not tenant_id:
+        # Fallback to primary account if tenant_id not specified
+        account = ZohoAccount.objects.filter(is_active=True, is_primary=True).first()
+    else:
+        account = ZohoAccount.objects.filter(tenant_id=tenant_id, is_active=True).first()
+
+    with _lock:
+        if generation == _generation:
+            # Unknown tenants are cached too (as None); creating an account invalidates them
+            account_cache.set(_cache_key(tenant_id), account)
+    return account
+
+
+@timed('resolve')
+def resolve_account(tenant_id=None):
+    """
+    The active account for tenant_id, or the primary account when tenant_id is empty.
+    Returns None when there is no such account. Served from the in-process cache, so the
+    common case costs no query.
+    """
+    account = _cached(tenant_id)
+    if account is _MISSING:
+        account = _load(tenant_id)
+    return account
+
+
+@timed('resolve')
+async def aresolve_account(tenant_id=None):
+    """Async twin of resolve_account; only leaves the event loop on a cache miss."""
+    account = _cached(tenant_id)
+    if account is _MISSING:
+        account = await sync_to_async(_load)(tenant_id)
+    return account
@@ -0,0 +1,152 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from . import breaker, ratelimit, timing
+from .upstream import BACKOFF, CONNECT_TIMEOUT, IDEMPOTENT_METHODS, READ_TIMEOUT, RETRIES
+
+try:
+    import httpx
+except ImportError:  # Only the async views need it
+    httpx = None
+
+# What async callers catch, mirroring requests.RequestException on the sync path
+HTTPError = httpx.HTTPError if httpx is not None else OSError
+
+ASYNC_POOL_SIZE = getattr(settings, 'ZOHO_ASYNC_POOL_SIZE', 200)
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# One client per (event loop, origin). Under uvicorn that is a single loop per worker; under
+# WSGI, async_to_sync runs each request on a loop of its own. Either way the loop's clients
+# are closed, and its entry dropped, when the loop shuts down.
+# {loop: ({origin: client}, closer)}
+_clients = {}
+
+
+def _build_client():
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=ASYNC_POOL_SIZE, max_keepalive_connections=ASYNC_POOL_SIZE),
+        transport=httpx.AsyncHTTPTransport(retries=RETRIES),
+    )
+
+
+async def _close_with_loop(clients):
+    """
+    Parked at its yield for the life of the loop. asyncio.run() (uvicorn, async_to_sync)
+    finalizes pending async generators before closing the loop, which runs the finally.
+    """
+    try:
+        yield
+    finally:
+        await asyncio.gather(*(client.aclose() for client in clients.values()), return_exceptions=True)
+        _clients.pop(asyncio.get_running_loop(), None)
+
+
+def _loop_clients():
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(loop)
+    if entry is None:
+        clients = {}
+        closer = _close_with_loop(clients)
+        asyncio.ensure_future(closer.__anext__())
+        entry = _clients[loop] = (clients, closer)
+    return entry[0]
+
+
+def get_client(url):
+    if httpx is None:
+        raise ImproperlyConfigured("The async views need httpx: pip install httpx")
+    parts = urlsplit(url)
+    origin = f"{parts.scheme}://{parts.netloc}"
+    loop_clients = _loop_clients()
+    client = loop_clients.get(origin)
+    if client is None:
+        client = loop_clients[origin] = _build_client()
+    return client
+
+
+class RateLimitExceeded(HTTPError):
+    """Async counterpart of ratelimit.RateLimitExceeded, catchable as HTTPError."""
+
+
+class CircuitOpen(HTTPError):
+    """Async counterpart of breaker.CircuitOpen, catchable as HTTPError."""
+
+    def __init__(self, origin, retry_after):
+        super().__init__(f"Zoho at {origin} is unavailable (circuit open); retry in {retry_after:.0f}s")
+        self.origin = origin
+        self.retry_after = retry_after
+
+
+def _admit(circuit, probe_slot=True):
+    try:
+        return circuit.admit() if probe_slot else circuit.check()
+    except breaker.CircuitOpen as e:
+        raise CircuitOpen(e.origin, e.retry_after)
+
+
+async def _reserve(account):
+    try:
+        wait = ratelimit.reserve(account)
+    except ratelimit.RateLimitExceeded as e:
+        raise RateLimitExceeded(str(e))
+    if wait:
+        await asyncio.sleep(wait)
+        timing.record_wait(wait)
+
+
+async def _send(client, method, url, account=None, **kwargs):
+    circuit = breaker.breaker_for(url)
+    probe = _admit(circuit)
+    attempts = RETRIES + 1 if method in IDEMPOTENT_METHODS else 1
+    # Retries included, the call counts once towards the breaker, as on the sync path
+    call_started = time.perf_counter()
+    failed = True
+    try:
+        for attempt in range(attempts):
+            started = time.perf_counter()
+            status = 'error'
+            try:
+                resp = await client.request(method, url, **kwargs)
+                status = resp.status_code
+            finally:
+                timing.record_upstream(url, time.perf_counter() - started, account, status)
+            if resp.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                failed = resp.status_code >= 500
+                return resp
+            await asyncio.sleep(BACKOFF * (2 ** attempt))
+    except asyncio.CancelledError:
+        # The client went away; that says nothing about Zoho
+        failed = False
+        raise
+    finally:
+        circuit.record(failed, time.perf_counter() - call_started, probe)
+
+
+async def request(method, url, account=None, **kwargs):
+    """Async twin of upstream.request: pooled, with timeouts, retries and per-account pacing."""
+    client = get_client(url)
+    if account is None:
+        return await _send(client, method, url, **kwargs)
+
+    for attempt in range(ratelimit.RETRIES_ON_429 + 1):
+        _admit(breaker.breaker_for(url), probe_slot=False)
+        await _reserve(account)
+        resp = await _send(client, method, url, account, **kwargs)
+        ratelimit.observe(account, resp.status_code, resp.headers)
+        if resp.status_code != 429:
+            break
+    return resp
+
+
+async def get(url, **kwargs):
+    return await request('GET', url, **kwargs)
+
+
+async def post(url, **kwargs):
+    return await request('POST', url, **kwargs)
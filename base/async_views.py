@@ -0,0 +1,270 @@
+"""
+Async (ASGI) versions of the proxy endpoints. They share parsing and validation with
+views.py but talk to Zoho through async_upstream, so one worker can keep many Zoho
+calls in flight. Enabled with ZOHO_ASYNC_VIEWS = True (see base/urls.py).
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+
+from . import async_upstream, breaker, fingerprints
+from .accounts import aresolve_account
+from .bookings import (
+    BookingRequestError, afetch_service_fields, afind_alternative_slots, aget_portal_id, aget_slot_days,
+    booking_failure, cache_service_fields, cached_service_fields, invalidate_slots, parse_bookings_list,
+    prepare_booking, slot_days_response, slot_query, slot_search_response, summarize_services, summarize_staff,
+)
+from .crm import DUPLICATE_CHECK_FIELDS, aensure_fields_exist, alookup_lead, invalidate_leads, summarize_upsert
+from .idempotency import idempotent
+from .lead_mirror import lookup_mirrored_lead, mirror_upserted
+from .lead_queue import enqueue_lead
+from .models import ZohoAccount
+from .timing import phase
+from .tokens import aget_valid_token
+from .views import (
+    circuit_open_response, lead_queued_response, mirrored_lead_response, unchanged_lead_response, wants_async,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def async_csrf_exempt(view):
+    # django's csrf_exempt only keeps coroutine views async from Django 5.0 on
+    view.csrf_exempt = True
+    return view
+
+
+async def _get_account_or_404(pk):
+    account = await ZohoAccount.objects.filter(pk=pk).afirst()
+    if not account:
+        raise Http404("No ZohoAccount matches the given query.")
+    return account
+
+
+@async_csrf_exempt
+@idempotent('proxy_lead')
+async def proxy_lead(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST allowed'}, status=405)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    tenant_id = payload.get('tenant_id')
+    account = await aresolve_account(tenant_id)
+    if not account:
+        return JsonResponse({'error': f'Zoho account not found for tenant: {tenant_id or "Primary"}'}, status=400)
+
+    if 'Last_Name' not in payload and 'last_name' not in payload:
+        payload['Last_Name'] = 'Unknown' # Default for Zoho mandatory field
+
+    if wants_async(request):
+        return lead_queued_response(await sync_to_async(enqueue_lead)(account, payload))
+
+    key, fingerprint = await sync_to_async(fingerprints.find)(account, payload)
+    if fingerprints.is_unchanged(fingerprint, payload):
+        return unchanged_lead_response(account, fingerprint)
+
+    if breaker.is_open(account.api_domain):
+        return lead_queued_response(await sync_to_async(enqueue_lead)(account, payload), reason='circuit_open')
+
+    await aensure_fields_exist(account, 'Leads', payload.keys())
+
+    token = await aget_valid_token(account)
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+    upsert_data = {
+        "data": [fingerprints.changed_fields(fingerprint, payload)],
+        "duplicate_check_fields": DUPLICATE_CHECK_FIELDS
+    }
+    try:
+        with phase('upsert'):
+            resp = await async_upstream.post(f"{account.api_domain}/crm/v2/Leads/upsert", account=account,
+                                             headers=headers, json=upsert_data)
+        resp_json = resp.json()
+    except async_upstream.RateLimitExceeded:
+        return lead_queued_response(await sync_to_async(enqueue_lead)(account, payload), reason='rate_limited')
+    except async_upstream.CircuitOpen:
+        return lead_queued_response(await sync_to_async(enqueue_lead)(account, payload), reason='circuit_open')
+    except (async_upstream.HTTPError, ValueError) as e:
+        return JsonResponse({'error': f'Zoho upsert failed: {e}', 'account': account.account_name}, status=502)
+
+    lead_id, action = summarize_upsert(resp.status_code, resp_json)
+    invalidate_leads(account, [payload], [lead_id])
+    if account.lead_mirror_enabled:
+        await sync_to_async(mirror_upserted)(account, [payload], [lead_id])
+    await sync_to_async(fingerprints.remember)(account, key, payload, lead_id, action, fingerprint)
+    return JsonResponse({
+        'lead_id': lead_id,
+        'action': action,
+        'account': account.account_name,
+        'status': resp.status_code,
+        'response': resp_json
+    })
+
+
+@async_csrf_exempt
+async def get_lead(request):
+    """
+    Search for a lead by ID, Email, or Phone.
+    """
+    params = request.GET if request.method == 'GET' else json.loads(request.body or '{}')
+
+    account = await aresolve_account(params.get('tenant_id'))
+    if not account:
+        return JsonResponse({'error': 'Zoho account not found'}, status=400)
+
+    if params.get('source') != 'zoho' and account.lead_mirror_enabled:
+        try:
+            max_age = int(params['max_age']) if params.get('max_age') not in (None, '') else None
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'max_age must be a number of seconds'}, status=400)
+        answered, lead_data = await sync_to_async(lookup_mirrored_lead)(
+            account, params.get('id'), params.get('email'), params.get('phone'), max_age)
+        if answered:
+            return mirrored_lead_response(account, lead_data)
+
+    try:
+        lead_data = await alookup_lead(account, params.get('id'), params.get('email'), params.get('phone'))
+    except async_upstream.CircuitOpen as e:
+        return circuit_open_response(e)
+    except (async_upstream.HTTPError, ValueError) as e:
+        return JsonResponse({'error': f'Zoho lookup failed: {e}'}, status=502)
+
+    if lead_data:
+        return JsonResponse({
+            'status': 'success',
+            'account': account.account_name,
+            'data': lead_data
+        })
+    return JsonResponse({
+        'status': 'not_found',
+        'message': 'No lead found matching the provided criteria'
+    }, status=404)
+
+
+@async_csrf_exempt
+@idempotent('proxy_booking')
+async def proxy_booking(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST allowed'}, status=405)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    account = await aresolve_account(payload.get('tenant_id'))
+    if not account:
+        return JsonResponse({'error': 'Zoho account not found for this tenant'}, status=400)
+
+    try:
+        booking = prepare_booking(payload, account)
+    except BookingRequestError as e:
+        return JsonResponse(e.body, status=e.status)
+
+    token = await aget_valid_token(account)
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+    try:
+        with phase('book'):
+            resp = await async_upstream.post(f"{account.api_domain}/bookings/v1/json/appointment",
+                                             account=account, headers=headers, data=booking['post_data'])
+    except async_upstream.CircuitOpen as e:
+        return circuit_open_response(e)
+    except async_upstream.HTTPError as e:
+        return JsonResponse({'error': f'Zoho booking request failed: {e}'}, status=502)
+
+    raw_zoho_resp = resp.text
+    try:
+        res_data = resp.json().get("response", {}).get("returnvalue", {})
+    except ValueError:
+        return JsonResponse({'error': 'Invalid response from Zoho', 'raw': raw_zoho_resp}, status=500)
+
+    if res_data.get("booking_id"):
+        invalidate_slots(account, booking['date_obj'], booking['staff_id'])
+        return JsonResponse({
+            'status': 'booking done',
+            'booking_id': res_data.get("booking_id"),
+            'details': res_data
+        })
+
+    failure = booking_failure(res_data, raw_zoho_resp)
+    if failure:
+        body, status = failure
+        return JsonResponse(body, status=status)
+
+    # Zoho says the slot is gone, so cached availability for that day is stale
+    invalidate_slots(account, booking['date_obj'], booking['staff_id'])
+    found = await afind_alternative_slots(account, booking, token)
+    body, status = slot_search_response(booking, res_data, raw_zoho_resp, found)
+    return JsonResponse(body, status=status)
+
+
+async def available_slots(request):
+    """Free booking slots for one or more days, served from the slot cache where possible."""
+    account = await aresolve_account(request.GET.get('tenant_id'))
+    if not account:
+        return JsonResponse({'error': 'Zoho account not found for this tenant'}, status=400)
+
+    try:
+        service_id, staff_id, date_obj, days = slot_query(request.GET, account)
+    except BookingRequestError as e:
+        return JsonResponse(e.body, status=e.status)
+
+    slot_days = await aget_slot_days(account, date_obj, days, service_id, staff_id)
+    return JsonResponse(slot_days_response(account, service_id, staff_id, slot_days))
+
+
+async def get_bookings_metadata(request, pk):
+    """Fetch all services and staff for this account with data-center awareness."""
+    account = await _get_account_or_404(pk)
+    token = await aget_valid_token(account)
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+    bookings_base = f"{account.api_domain}/bookings/v1/json"
+
+    try:
+        services_resp, staff_resp = await asyncio.gather(
+            async_upstream.get(f"{bookings_base}/services", account=account, headers=headers),
+            async_upstream.get(f"{bookings_base}/staffs", account=account, headers=headers),
+        )
+        return JsonResponse({
+            'services': summarize_services(parse_bookings_list(services_resp.json())),
+            'staff': summarize_staff(parse_bookings_list(staff_resp.json()))
+        })
+    except Exception as e:
+        logger.exception("Metadata fetch failed for account %s", account.pk)
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def get_service_fields(request, pk):
+    """Fetch mandatory fields for a specific service using a flexible deep-search."""
+    service_id = request.GET.get('service_id')
+    if not service_id:
+        return JsonResponse({'error': 'service_id required'}, status=400)
+
+    account = await _get_account_or_404(pk)
+    result = cached_service_fields(account, service_id)
+    if result is not None:
+        return JsonResponse(result)
+
+    token = await aget_valid_token(account)
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+    await aget_portal_id(account, headers)
+    data, last_error = await afetch_service_fields(account, headers, service_id)
+
+    if not data:
+        return JsonResponse({
+            'error': 'Failed to fetch fields from Zoho',
+            'detail': last_error,
+            'advice': 'Check your terminal console for the raw Zoho error response.'
+        }, status=200)
+
+    try:
+        return JsonResponse(cache_service_fields(account, service_id, data))
+    except Exception as e:
+        logger.exception("Parsing service fields failed for account %s", account.pk)
+        return JsonResponse({'error': str(e)}, status=500)
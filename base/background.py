@@ -0,0 +1,31 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Small pool for work taken off the request path (token persistence, refreshes)
+_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'ZOHO_BACKGROUND_WORKERS', 2),
+                               thread_name_prefix='zoho-background')
+
+
+def _run(fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", fn.__name__)
+    finally:
+        # Each pool thread holds its own DB connection; don't leave it open between tasks
+        connection.close()
+
+
+def pending():
+    """Tasks queued behind the busy workers."""
+    return _executor._work_queue.qsize()
+
+
+def submit(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) on the background pool; errors are logged, not raised."""
+    return _executor.submit(_run, fn, args, kwargs)
@@ -0,0 +1,684 @@
+import asyncio
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from django.conf import settings
+
+from . import async_upstream, upstream
+from .cache import SingleFlight, bookings_meta_cache, slot_cache
+from .log import BodyPreview, LazyJson
+from .timing import timed
+from .tokens import aget_valid_token, get_valid_token
+
+logger = logging.getLogger(__name__)
+
+# Payload keys the proxy consumes itself; everything else is forwarded as a custom field
+BOOKING_INTERNAL_FIELDS = {'date', 'time', 'name', 'email', 'phone', 'tenant_id', 'service_id', 'staff_id',
+                           'search_days', 'return_days'}
+TAKEN_KEYWORDS = ["taken", "available", "booked", "busy", "exists"]
+
+# Alternative-slot search when the requested slot is taken
+SLOT_SEARCH_DAYS = getattr(settings, 'ZOHO_SLOT_SEARCH_DAYS', 7)
+SLOT_SEARCH_MAX_DAYS = getattr(settings, 'ZOHO_SLOT_SEARCH_MAX_DAYS', 31)
+SLOT_SEARCH_CONCURRENCY = getattr(settings, 'ZOHO_SLOT_SEARCH_CONCURRENCY', 4)
+
+# Shared by all requests; each search keeps at most SLOT_SEARCH_CONCURRENCY days in flight
+_slot_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'ZOHO_SLOT_SEARCH_WORKERS', 16),
+                                    thread_name_prefix='slot-search')
+# Concurrent misses for the same slot cache key share one Zoho call
+_slot_flight = SingleFlight()
+
+# get_service_fields: which of Zoho's fields endpoints answer differs per data center, so the
+# working (endpoint, method, with service_id) probe is remembered per api_domain
+FIELDS_ENDPOINTS = ["/bookings/v1/json/getfields", "/bookings/v1/json/fields"]
+FIELDS_PROBES = [(endpoint, method, with_service_id)
+                 for endpoint in FIELDS_ENDPOINTS for method in ['GET', 'POST'] for with_service_id in (True, False)]
+SERVICE_FIELDS_CACHE_TTL = getattr(settings, 'ZOHO_SERVICE_FIELDS_CACHE_TTL', 600)
+FIELDS_PROBE_TTL = getattr(settings, 'ZOHO_FIELDS_PROBE_TTL', 86400)
+FIELDS_PROBE_FAILURE_TTL = getattr(settings, 'ZOHO_FIELDS_PROBE_FAILURE_TTL', 600)
+# A probe answered with a 5xx is skipped for less long: the endpoint may well work once Zoho recovers
+FIELDS_PROBE_ERROR_TTL = getattr(settings, 'ZOHO_FIELDS_PROBE_ERROR_TTL', 60)
+# Statuses that say the endpoint/method/params combination itself doesn't work for the
+# api_domain; anything else (auth, rate limits, outages) is about the call, not the probe
+FIELDS_PROBE_UNSUPPORTED = {400, 404, 405}
+
+
+class BookingRequestError(Exception):
+    """The booking payload can't be sent to Zoho as-is; `body` is returned to the client."""
+
+    def __init__(self, body, status=400):
+        super().__init__(body.get('error'))
+        self.body = body
+        self.status = status
+
+
+def format_date_for_zoho(date_obj):
+    return date_obj.strftime("%d-%b-%Y")
+
+
+def format_datetime_for_zoho(date_obj, time_24h):
+    return f"{date_obj.strftime('%d-%b-%Y')} {time_24h}:00"
+
+
+def slots_request(account, date_obj, service_id, staff_id):
+    """URL and query params for Zoho's availableslots endpoint."""
+    url = f"{account.api_domain}/bookings/v1/json/availableslots"
+    params = {
+        "service_id": service_id,
+        "staff_id": staff_id,
+        "selected_date": format_date_for_zoho(date_obj),
+        "time_zone": account.timezone
+    }
+    return url, params
+
+
+def parse_slots_response(data):
+    return_value = data.get("response", {}).get("returnvalue", {})
+
+    # Zoho's response structure is notoriously inconsistent.
+    # We check both the top-level status and the internal 'reponse' flag.
+    outer_status = data.get("response", {}).get("status")
+    inner_status = return_value.get("response") or return_value.get("reponse")
+    slot_data = return_value.get("data")
+
+    # It's a success if outer status is success AND inner_status is either 'success' or True
+    is_success = outer_status == "success" and (inner_status == "success" or inner_status is True)
+
+    if is_success and isinstance(slot_data, list):
+        logger.debug("Found %d slots", len(slot_data))
+        return slot_data
+    logger.debug("No valid slots in response (inner status %s, data type %s)", inner_status, type(slot_data).__name__)
+    return []
+
+
+def slot_cache_key(account, date_obj, service_id, staff_id):
+    return (account.pk, str(service_id), str(staff_id), format_date_for_zoho(date_obj), account.timezone)
+
+
+def invalidate_slots(account, date_obj, staff_id):
+    """Forget cached availability for a staff member's day, across services and timezones."""
+    day = format_date_for_zoho(date_obj)
+    slot_cache.delete_where(lambda key: key[0] == account.pk and key[2] == str(staff_id) and key[3] == day)
+
+
+def _fetch_available_slots(account, date_obj, service_id, staff_id, token):
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+    url, params = slots_request(account, date_obj, service_id, staff_id)
+
+    logger.debug("Fetching slots from %s with params %s", url, params)
+    try:
+        resp = upstream.get(url, account=account, headers=headers, params=params)
+    except requests.RequestException as e:
+        logger.warning("Slots request failed for account %s: %s", account.pk, e)
+        return None
+
+    if resp.status_code == 200:
+        data = resp.json()
+        logger.debug("Slots response: %s", LazyJson(data), extra={'sampled': True})
+        return parse_slots_response(data)
+    return None
+
+
+def get_available_slots(account, date_obj, service_id, staff_id, token=None):
+    key = slot_cache_key(account, date_obj, service_id, staff_id)
+    slots = slot_cache.get(key)
+    if slots is not None:
+        return slots
+
+    token = token or get_valid_token(account)
+    slots = _slot_flight.do(key, _fetch_available_slots, account, date_obj, service_id, staff_id, token)
+    if slots is None:
+        # Failed lookups aren't cached
+        return []
+    slot_cache.set(key, slots)
+    return slots
+
+
+async def aget_available_slots(account, date_obj, service_id, staff_id, token=None):
+    key = slot_cache_key(account, date_obj, service_id, staff_id)
+    slots = slot_cache.get(key)
+    if slots is not None:
+        return slots
+
+    token = token or await aget_valid_token(account)
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+    url, params = slots_request(account, date_obj, service_id, staff_id)
+
+    try:
+        resp = await async_upstream.get(url, account=account, headers=headers, params=params)
+    except async_upstream.HTTPError as e:
+        logger.warning("Slots request failed for account %s: %s", account.pk, e)
+        return []
+
+    if resp.status_code != 200:
+        return []
+    slots = parse_slots_response(resp.json())
+    slot_cache.set(key, slots)
+    return slots
+
+
+def get_slot_days(account, start_date, days, service_id, staff_id, token=None):
+    """[(day, slots)] for `days` consecutive days, fetched in parallel."""
+    dates = [start_date + timedelta(days=i) for i in range(days)]
+    token = token or get_valid_token(account)
+    fetch = lambda day: get_available_slots(account, day, service_id, staff_id, token)
+    slots = []
+    for i in range(0, len(dates), SLOT_SEARCH_CONCURRENCY):
+        slots.extend(_slot_executor.map(fetch, dates[i:i + SLOT_SEARCH_CONCURRENCY]))
+    return list(zip(dates, slots))
+
+
+async def aget_slot_days(account, start_date, days, service_id, staff_id, token=None):
+    """Async twin of get_slot_days."""
+    dates = [start_date + timedelta(days=i) for i in range(days)]
+    token = token or await aget_valid_token(account)
+    semaphore = asyncio.Semaphore(SLOT_SEARCH_CONCURRENCY)
+
+    async def fetch(day):
+        async with semaphore:
+            return await aget_available_slots(account, day, service_id, staff_id, token)
+
+    return list(zip(dates, await asyncio.gather(*(fetch(day) for day in dates))))
+
+
+def slot_query(params, account):
+    """Validate the query of GET /api/bookings/slots/; returns (service_id, staff_id, date_obj, days)."""
+    service_id = params.get('service_id') or account.bookings_service_id
+    staff_id = params.get('staff_id') or account.bookings_staff_id
+    if not service_id or not staff_id:
+        raise BookingRequestError({'error': 'Bookings Service ID or Staff ID not configured'})
+
+    try:
+        date_obj = datetime.strptime(params.get('date') or datetime.now().strftime("%Y-%m-%d"), "%Y-%m-%d")
+        days = int(params.get('days') or 1)
+    except ValueError:
+        raise BookingRequestError({'error': 'date must be YYYY-MM-DD and days an integer'})
+    if not 1 <= days <= SLOT_SEARCH_MAX_DAYS:
+        raise BookingRequestError({'error': f'days must be 1-{SLOT_SEARCH_MAX_DAYS}'})
+    return service_id, staff_id, date_obj, days
+
+
+def slot_days_response(account, service_id, staff_id, slot_days):
+    return {
+        'account': account.account_name,
+        'service_id': service_id,
+        'staff_id': staff_id,
+        'time_zone': account.timezone,
+        'days': [{'date': day.strftime("%Y-%m-%d"), 'available_slots': slots} for day, slots in slot_days],
+    }
+
+
+def prepare_booking(payload, account):
+    """Validate a booking payload and build the form data for Zoho's appointment endpoint."""
+    service_id = payload.get('service_id') or account.bookings_service_id
+    staff_id = payload.get('staff_id') or account.bookings_staff_id
+
+    if not service_id or not staff_id:
+        raise BookingRequestError({'error': 'Bookings Service ID or Staff ID not configured'})
+
+    date_str = payload.get('date') # Expected YYYY-MM-DD
+    time_str = payload.get('time') # Expected HH:MM (24h)
+
+    try:
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+
+        # Parse time string - supports both "HH:MM" and "HH:MM AM/PM"
+        time_obj = None
+        for fmt in ["%H:%M", "%I:%M %p", "%I:%M%p"]:
+            try:
+                time_obj = datetime.strptime(time_str.strip(), fmt)
+                break
+            except ValueError:
+                continue
+    except Exception as e:
+        raise BookingRequestError({'error': f'Invalid date or time format: {str(e)}'})
+
+    if not time_obj:
+        raise BookingRequestError({'error': 'Time format not recognized. Use HH:MM or HH:MM AM/PM'})
+
+    try:
+        search_days = int(payload.get('search_days') or SLOT_SEARCH_DAYS)
+        return_days = int(payload.get('return_days') or 1)
+    except (TypeError, ValueError):
+        raise BookingRequestError({'error': 'search_days and return_days must be integers'})
+    if not 1 <= search_days <= SLOT_SEARCH_MAX_DAYS or not 1 <= return_days <= search_days:
+        raise BookingRequestError({'error': f'search_days must be 1-{SLOT_SEARCH_MAX_DAYS} and return_days 1-search_days'})
+
+    # Combine date and time for a full comparison
+    booking_datetime = date_obj.replace(hour=time_obj.hour, minute=time_obj.minute)
+
+    # Standardize time_str to 24h for consistency in internal logic
+    time_str = booking_datetime.strftime("%H:%M")
+
+    # Check if requested time is in the past
+    if booking_datetime < datetime.now():
+        raise BookingRequestError({
+            'error': f'Cannot book in the past. Requested: {booking_datetime.strftime("%Y-%m-%d %H:%M")}, Current: {datetime.now().strftime("%Y-%m-%d %H:%M")}'
+        })
+
+    # Custom fields in Zoho Bookings JSON API usually go inside any_additional_info
+    additional_info = {}
+    for key, value in payload.items():
+        if key not in BOOKING_INTERNAL_FIELDS:
+            additional_info[key] = value
+
+    customer_info = {
+        "name": payload.get('name'),
+        "email": payload.get('email'),
+        "phone_number": payload.get('phone'),
+    }
+
+    # Strategy: Send custom fields in ALL known Zoho formats to ensure one sticks.
+    if additional_info:
+        # 1. any_additional_info (Standard)
+        customer_info["any_additional_info"] = additional_info
+
+        # 2. custom_fields (Legacy/Alternative)
+        customer_info["custom_fields"] = additional_info
+
+        # 3. Root Level (Falback)
+        for k, v in additional_info.items():
+            if k not in customer_info:
+                customer_info[k] = v
+
+    from_time = format_datetime_for_zoho(date_obj, time_str)
+
+    # --- PROXY FIX FOR MANDATORY FIELDS (State) ---
+    # Ensure "State" is also mapped to its numeric ID if present
+    # This ID was found via debugging network logs (Step 299)
+    if "State" in additional_info:
+        additional_info["407473000000047017"] = additional_info["State"]
+
+    post_data = {
+        "service_id": service_id,
+        "staff_id": staff_id,
+        "from_time": from_time,
+        "customer_details": json.dumps(customer_info),
+        # CRITICAL FIX: Send custom fields as TOP-LEVEL parameters separate from customer_details
+        # This matches the behavior that finally worked in test_booking.py
+        "additional_fields": json.dumps(additional_info),
+        "custom_fields": json.dumps(additional_info)
+    }
+
+    return {
+        'service_id': service_id,
+        'staff_id': staff_id,
+        'date_obj': date_obj,
+        'time_str': time_str,
+        'booking_datetime': booking_datetime,
+        'from_time': from_time,
+        'post_data': post_data,
+        'search_days': search_days,
+        'return_days': return_days,
+    }
+
+
+def booking_failure(res_data, raw_zoho_resp):
+    """
+    (body, status) for a failed booking that is NOT about availability,
+    or None when the slot was taken and alternatives should be searched.
+    """
+    zoho_msg = res_data.get("message", "Unknown error")
+    logger.info("Booking failed. Zoho message: %s", zoho_msg)
+
+    zoho_msg_lower = zoho_msg.lower()
+    if any(k in zoho_msg_lower for k in TAKEN_KEYWORDS):
+        return None
+
+    # Check if it's a "Mandatory Field" error
+    # Pattern: "Custom field [State''] fields are mandatory"
+    # Pattern: "'State' is mandatory"
+    mandatory_match = re.search(r"Custom field \[(.*?)'?"'\] fields are mandatory', zoho_msg)
+    if not mandatory_match:
+        mandatory_match = re.search(r"'(.*?)' is mandatory", zoho_msg)
+
+    if mandatory_match:
+        field_name = mandatory_match.group(1).replace("'", "").strip()
+        return {
+            'status': 'missing_fields',
+            'message': f'Zoho requires a mandatory field: {field_name}',
+            'fields': {field_name: "REQUIRED"},
+            'raw_zoho_error': zoho_msg
+        }, 400
+
+    return {
+        'status': 'error',
+        'message': f'Zoho Booking failed: {zoho_msg}',
+        'details': res_data,
+        'raw_zoho_response': raw_zoho_resp
+    }, 400
+
+
+def requested_time_is_free(booking, slots):
+    """True if the requested time shows up in the requested day's slot list."""
+    r1 = booking['booking_datetime'].strftime("%I:%M %p")
+    r2 = r1.lstrip('0')
+    clean_slots = [s.strip() for s in slots]
+    return r1 in clean_slots or r2 in clean_slots or booking['time_str'] in clean_slots
+
+
+def alternative_slots_response(booking, res_data, raw_zoho_resp, day, slots):
+    """(body, status) once the fallback search found `slots` on `day`."""
+    zoho_msg = res_data.get("message", "Unknown error")
+
+    # --- SELF-CORRECTION LOGIC ---
+    # If our requested time is actually IN the available list,
+    # then the booking failed for a REASON OTHER THAN availability.
+    # We should return the original Zoho error.
+    # IMPORTANT: Only check this for the requested date
+    if day.date() == booking['date_obj'].date() and requested_time_is_free(booking, slots):
+        return {
+            'status': 'error',
+            'message': f'Zoho rejected the booking for a non-availability reason: {zoho_msg}',
+            'details': res_data,
+            'raw_zoho_response': raw_zoho_resp
+        }, 400
+
+    # If we are here, it means it's a real availability issue (truly not in the list or a different day)
+    return {
+        'status': 'slot unavailable',
+        'message': f'The requested slot was reported as unavailable. Here are available slots for {format_date_for_zoho(day)}',
+        'date': day.strftime("%Y-%m-%d"),
+        'available_slots': slots,
+        'zoho_debug_msg': zoho_msg
+    }, 200
+
+
+@timed('slot_search')
+def find_alternative_slots(account, booking, token):
+    """
+    Look for free slots over booking['search_days'] days starting at the requested date,
+    fetching up to SLOT_SEARCH_CONCURRENCY days at once. Stops as soon as the earliest
+    booking['return_days'] days with slots are known and returns them as [(day, slots)].
+    """
+    days = [booking['date_obj'] + timedelta(days=i) for i in range(booking['search_days'])]
+    fetch = lambda day: get_available_slots(account, day, booking['service_id'], booking['staff_id'], token)
+
+    pending = {}
+    next_day = 0
+    found = []
+    try:
+        for i, day in enumerate(days):
+            # Keep a sliding window of lookups ahead of the day being consumed
+            while next_day < len(days) and next_day < i + SLOT_SEARCH_CONCURRENCY:
+                pending[next_day] = _slot_executor.submit(fetch, days[next_day])
+                next_day += 1
+            slots = pending.pop(i).result()
+            if slots:
+                found.append((day, slots))
+                if len(found) == booking['return_days']:
+                    break
+    finally:
+        for future in pending.values():
+            future.cancel()
+    return found
+
+
+@timed('slot_search')
+async def afind_alternative_slots(account, booking, token):
+    """Async twin of find_alternative_slots."""
+    days = [booking['date_obj'] + timedelta(days=i) for i in range(booking['search_days'])]
+    semaphore = asyncio.Semaphore(SLOT_SEARCH_CONCURRENCY)
+
+    async def fetch(day):
+        async with semaphore:
+            return await aget_available_slots(account, day, booking['service_id'], booking['staff_id'], token)
+
+    tasks = [asyncio.ensure_future(fetch(day)) for day in days]
+    found = []
+    try:
+        for day, task in zip(days, tasks):
+            slots = await task
+            if slots:
+                found.append((day, slots))
+                if len(found) == booking['return_days']:
+                    break
+    finally:
+        for task in tasks:
+            task.cancel()
+    return found
+
+
+def slot_search_response(booking, res_data, raw_zoho_resp, found):
+    """(body, status) for the result of find_alternative_slots."""
+    if not found:
+        return no_slots_response(res_data, booking['search_days'])
+
+    day, slots = found[0]
+    body, status = alternative_slots_response(booking, res_data, raw_zoho_resp, day, slots)
+    if status == 200 and booking['return_days'] > 1:
+        body['alternatives'] = [{'date': d.strftime("%Y-%m-%d"), 'available_slots': s} for d, s in found]
+    return body, status
+
+
+def no_slots_response(res_data, days):
+    return {
+        'status': 'error',
+        'message': f'No available slots found in the next {days} days.',
+        'zoho_error': res_data.get("message")
+    }, 400
+
+
+def parse_bookings_list(resp_json):
+    # Corrected parsing based on observed response: response -> returnvalue -> data
+    return resp_json.get('response', {}).get('returnvalue', {}).get('data', [])
+
+
+def _summarize(items, id_keys, name_keys):
+    # Try both common Zoho key formats
+    processed = []
+    for item in items:
+        item_id = next((item.get(k) for k in id_keys if item.get(k)), None)
+        item_name = next((item.get(k) for k in name_keys if item.get(k)), None)
+        if item_id and item_name:
+            processed.append({'id': item_id, 'name': item_name})
+    return processed
+
+
+def summarize_services(services):
+    return _summarize(services, ('service_id', 'id'), ('service_name', 'name', 'display_name'))
+
+
+def summarize_staff(staff):
+    return _summarize(staff, ('staff_id', 'id'), ('staff_name', 'name', 'display_name'))
+
+
+def parse_portal_id(resp_json):
+    portals = resp_json.get('response', {}).get('returnvalue', {}).get('portals', [])
+    if portals:
+        return portals[0].get('portal_id') or portals[0].get('portal_name')
+    return None
+
+
+def cached_portal_id(account):
+    """(hit, portal_id): portal ids are cached per account, including "there is none"."""
+    portal_id = bookings_meta_cache.get(('portal', account.pk))
+    return portal_id is not None, portal_id or None
+
+
+def cache_portal_id(account, portal_id):
+    bookings_meta_cache.set(('portal', account.pk), portal_id or '', ttl=FIELDS_PROBE_TTL)
+
+
+def get_portal_id(account, headers):
+    hit, portal_id = cached_portal_id(account)
+    if hit:
+        return portal_id
+    try:
+        portal_resp = upstream.get(f"{account.api_domain}/bookings/v1/json/portals", account=account,
+                                   headers=headers)
+    except requests.RequestException:
+        return None
+    if portal_resp.status_code == 200:
+        portal_id = parse_portal_id(portal_resp.json())
+        if portal_id:
+            logger.debug("Found portal context %s for account %s", portal_id, account.pk)
+    cache_portal_id(account, portal_id)
+    return portal_id
+
+
+async def aget_portal_id(account, headers):
+    hit, portal_id = cached_portal_id(account)
+    if hit:
+        return portal_id
+    try:
+        portal_resp = await async_upstream.get(f"{account.api_domain}/bookings/v1/json/portals", account=account,
+                                               headers=headers)
+    except async_upstream.HTTPError:
+        return None
+    if portal_resp.status_code == 200:
+        portal_id = parse_portal_id(portal_resp.json())
+    cache_portal_id(account, portal_id)
+    return portal_id
+
+
+def fields_probes(api_domain):
+    """Probes worth trying for api_domain: the last one that worked first, recent failures skipped."""
+    winner = bookings_meta_cache.get(('fields_probe', api_domain))
+    probes = [winner] if winner else []
+    probes += [probe for probe in FIELDS_PROBES if probe != winner]
+    return [probe for probe in probes if not bookings_meta_cache.get(('fields_probe_failed', api_domain, probe))]
+
+
+def fields_probe_request(api_domain, probe, service_id):
+    """(method, url, request kwargs) for one fields probe."""
+    endpoint, method, with_service_id = probe
+    params = {"service_id": service_id} if with_service_id else None
+    if method == 'GET':
+        return method, f"{api_domain}{endpoint}", {'params': params}
+    return method, f"{api_domain}{endpoint}", {'data': params}
+
+
+def record_fields_probe(api_domain, probe, ok):
+    if ok:
+        bookings_meta_cache.set(('fields_probe', api_domain), probe, ttl=FIELDS_PROBE_TTL)
+        bookings_meta_cache.delete(('fields_probe_failed', api_domain, probe))
+    else:
+        if bookings_meta_cache.get(('fields_probe', api_domain)) == probe:
+            bookings_meta_cache.delete(('fields_probe', api_domain))
+        bookings_meta_cache.set(('fields_probe_failed', api_domain, probe), True, ttl=FIELDS_PROBE_FAILURE_TTL)
+
+
+def record_fields_probe_error(api_domain, probe):
+    """Skip a probe that got a 5xx for a short while, still remembering it if it worked before."""
+    bookings_meta_cache.set(('fields_probe_failed', api_domain, probe), True, ttl=FIELDS_PROBE_ERROR_TTL)
+
+
+def service_fields_key(account, service_id):
+    return ('service_fields', account.pk, str(service_id))
+
+
+def cached_service_fields(account, service_id):
+    return bookings_meta_cache.get(service_fields_key(account, service_id))
+
+
+def cache_service_fields(account, service_id, data):
+    """Parse a fields response and cache {'mandatory_fields', 'count', 'debug_found_fields'}."""
+    mandatory_fields, fields_list = extract_mandatory_fields(data)
+    result = {
+        'mandatory_fields': mandatory_fields,
+        'count': len(mandatory_fields),
+        'debug_found_fields': len(fields_list)
+    }
+    bookings_meta_cache.set(service_fields_key(account, service_id), result, ttl=SERVICE_FIELDS_CACHE_TTL)
+    return result
+
+
+def fetch_service_fields(account, headers, service_id):
+    """(fields response, last_error), trying the remembered probe first and skipping known failures."""
+    last_error = "Unknown"
+    probes = fields_probes(account.api_domain)
+    if not probes:
+        return None, f"All fields endpoints failed recently; retrying after at most {FIELDS_PROBE_FAILURE_TTL}s"
+
+    for probe in probes:
+        method, url, kwargs = fields_probe_request(account.api_domain, probe, service_id)
+        try:
+            resp = upstream.request(method, url, account=account, headers=headers, **kwargs)
+            logger.debug("Fields probe %s %s -> %s", method, probe[0], resp.status_code)
+            if resp.status_code == 200:
+                data = resp.json()
+                record_fields_probe(account.api_domain, probe, True)
+                return data, None
+            last_error = f"Status {resp.status_code}: {resp.text}"
+            logger.debug("Fields probe failed. Body: %s", BodyPreview(resp), extra={'sampled': True})
+            if resp.status_code in FIELDS_PROBE_UNSUPPORTED:
+                record_fields_probe(account.api_domain, probe, False)
+            elif resp.status_code >= 500:
+                record_fields_probe_error(account.api_domain, probe)
+        except Exception as e:
+            # Transport errors say nothing about the probe, so it isn't marked as failing
+            last_error = str(e)
+            logger.warning("Fields probe %s %s failed: %s", method, probe[0], e)
+    return None, last_error
+
+
+async def afetch_service_fields(account, headers, service_id):
+    last_error = "Unknown"
+    probes = fields_probes(account.api_domain)
+    if not probes:
+        return None, f"All fields endpoints failed recently; retrying after at most {FIELDS_PROBE_FAILURE_TTL}s"
+
+    for probe in probes:
+        method, url, kwargs = fields_probe_request(account.api_domain, probe, service_id)
+        try:
+            resp = await async_upstream.request(method, url, account=account, headers=headers, **kwargs)
+            if resp.status_code == 200:
+                data = resp.json()
+                record_fields_probe(account.api_domain, probe, True)
+                return data, None
+            last_error = f"Status {resp.status_code}: {resp.text}"
+            if resp.status_code in FIELDS_PROBE_UNSUPPORTED:
+                record_fields_probe(account.api_domain, probe, False)
+            elif resp.status_code >= 500:
+                record_fields_probe_error(account.api_domain, probe)
+        except Exception as e:
+            last_error = str(e)
+    return None, last_error
+
+
+def _find_fields_in_json(obj):
+    # Deep search for any key matching 'fields' or containing list of fields
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if k in ['fields', 'custom_fields', 'booking_fields'] and isinstance(v, list):
+                return v
+            result = _find_fields_in_json(v)
+            if result: return result
+    elif isinstance(obj, list):
+        for item in obj:
+            result = _find_fields_in_json(item)
+            if result: return result
+    return None
+
+
+def extract_mandatory_fields(data):
+    """Return ({field_id: label}, fields_list) for the mandatory custom fields in a Bookings fields response."""
+    fields_list = _find_fields_in_json(data) or []
+
+    # Fallback to direct path search
+    if not fields_list:
+        # response -> returnvalue -> fields
+        fields_list = data.get('response', {}).get('returnvalue', {}).get('fields', [])
+
+    mandatory_fields = {}
+    for f in fields_list:
+        if not isinstance(f, dict): continue
+
+        # Zoho uses multiple keys for requirement status
+        is_req = f.get('is_mandatory') or f.get('mandatory') or f.get('required') or False
+
+        if is_req:
+            # Field ID or Field Name
+            field_id = f.get('field_name') or f.get('id') or f.get('field_id')
+            display_name = f.get('display_name') or f.get('label') or field_id
+
+            # Filter out base fields that we already handle in the UI
+            if field_id and field_id.lower() not in ['name', 'email', 'phone_number', 'date', 'time', 'service_id', 'staff_id']:
+                mandatory_fields[field_id] = f"REQUIRED: {display_name}"
+
+    return mandatory_fields, fields_list
@@ -0,0 +1,192 @@
+"""
+Circuit breakers for Zoho origins (each api_domain and accounts_server). When one data
+center errors or slows down, calls to it fail fast instead of holding workers for the full
+timeout, so tenants on healthy regions keep being served. After a cooldown a few probe
+calls are let through; if they succeed the circuit closes again.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Outcomes are judged over this many seconds, once at least MIN_CALLS calls were made
+WINDOW = getattr(settings, 'ZOHO_BREAKER_WINDOW', 30)
+MIN_CALLS = getattr(settings, 'ZOHO_BREAKER_MIN_CALLS', 10)
+# Trip when this share of calls failed (no response or a 5xx)...
+ERROR_RATE = getattr(settings, 'ZOHO_BREAKER_ERROR_RATE', 0.5)
+# ...or took longer than SLOW_CALL seconds
+SLOW_CALL = getattr(settings, 'ZOHO_BREAKER_SLOW_CALL', 5.0)
+SLOW_RATE = getattr(settings, 'ZOHO_BREAKER_SLOW_RATE', 0.5)
+# How long an open circuit fails fast before probing, and how many probes it lets through
+OPEN_SECONDS = getattr(settings, 'ZOHO_BREAKER_OPEN_SECONDS', 30)
+HALF_OPEN_PROBES = getattr(settings, 'ZOHO_BREAKER_HALF_OPEN_PROBES', 1)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(requests.RequestException):
+    """Zoho calls to this origin are failing fast; `retry_after` is a hint in seconds."""
+
+    def __init__(self, origin, retry_after):
+        super().__init__(f"Zoho at {origin} is unavailable (circuit open); retry in {retry_after:.0f}s")
+        self.origin = origin
+        self.retry_after = retry_after
+
+
+def origin_of(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class CircuitBreaker:
+    """
+    Thread-safe closed -> open -> half_open state machine over per-second outcome counts.
+    Call admit() before a call (it raises CircuitOpen or returns whether the call is a
+    probe) and record() with its outcome afterwards.
+    """
+
+    def __init__(self, origin):
+        self.origin = origin
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        # [second, calls, failures, slow calls], oldest first
+        self._buckets = deque()
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        horizon = int(now) - WINDOW
+        while self._buckets and self._buckets[0][0] <= horizon:
+            self._buckets.popleft()
+
+    def _open(self, now, reason):
+        self.state = OPEN
+        self.opened_at = now
+        self.trips += 1
+        self._buckets.clear()
+        logger.warning("Circuit for %s opened (%s); failing fast for %ss", self.origin, reason, OPEN_SECONDS)
+
+    def _retry_after(self, now):
+        return max(1.0, self.opened_at + OPEN_SECONDS - now)
+
+    def check(self):
+        """Raise CircuitOpen while calls are being refused; doesn't take a probe slot."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at < OPEN_SECONDS:
+                self.rejected += 1
+                raise CircuitOpen(self.origin, self._retry_after(now))
+
+    def admit(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == CLOSED:
+                return False
+            if self.state == OPEN:
+                if now - self.opened_at < OPEN_SECONDS:
+                    self.rejected += 1
+                    raise CircuitOpen(self.origin, self._retry_after(now))
+                self.state = HALF_OPEN
+                self._probes = self._probe_successes = 0
+                logger.info("Circuit for %s half-open; probing", self.origin)
+            if self._probes + self._probe_successes >= HALF_OPEN_PROBES:
+                self.rejected += 1
+                raise CircuitOpen(self.origin, 1.0)
+            self._probes += 1
+            return True
+
+    def record(self, failed, seconds, probe=False):
+        slow = seconds >= SLOW_CALL
+        with self._lock:
+            now = time.monotonic()
+            if probe:
+                self._probes -= 1
+                if self.state != HALF_OPEN:
+                    return
+                if failed or slow:
+                    self._open(now, 'probe failed' if failed else f'probe took {seconds:.1f}s')
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= HALF_OPEN_PROBES:
+                    self.state = CLOSED
+                    self._buckets.clear()
+                    logger.info("Circuit for %s closed", self.origin)
+                return
+            # Calls let through before the circuit opened don't count against the next round
+            if self.state != CLOSED:
+                return
+
+            second = int(now)
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0, 0])
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            bucket[2] += failed
+            bucket[3] += slow
+
+            self._prune(now)
+            calls = sum(b[1] for b in self._buckets)
+            if calls < MIN_CALLS:
+                return
+            failures = sum(b[2] for b in self._buckets)
+            slow_calls = sum(b[3] for b in self._buckets)
+            if failures / calls >= ERROR_RATE:
+                self._open(now, f'{failures}/{calls} calls failed')
+            elif slow_calls / calls >= SLOW_RATE:
+                self._open(now, f'{slow_calls}/{calls} calls slower than {SLOW_CALL}s')
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            state = self.state
+            if state == OPEN and now - self.opened_at >= OPEN_SECONDS:
+                state = HALF_OPEN  # The next call probes
+            return {
+                'state': state,
+                'calls': sum(b[1] for b in self._buckets),
+                'failures': sum(b[2] for b in self._buckets),
+                'slow_calls': sum(b[3] for b in self._buckets),
+                'retry_after': round(self._retry_after(now), 1) if state == OPEN else 0,
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url):
+    origin = origin_of(url)
+    breaker = _breakers.get(origin)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(origin)
+            if breaker is None:
+                breaker = _breakers[origin] = CircuitBreaker(origin)
+    return breaker
+
+
+def is_open(url):
+    """Whether calls to the url's origin are currently refused (for diverting work up front)."""
+    breaker = _breakers.get(origin_of(url))
+    return breaker is not None and breaker.snapshot()['state'] == OPEN
+
+
+def states():
+    """{origin: breaker snapshot} for every Zoho origin called in this process."""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {origin: breaker.snapshot() for origin, breaker in breakers.items()}
@@ -0,0 +1,371 @@
+"""
+Large lead imports through Zoho's Bulk Write API. Rows are read one at a time from a CSV or
+NDJSON file and spooled to disk in chunks; each chunk goes to Zoho as a zipped CSV, becomes
+a bulk write job that is polled to completion, and its per-row outcome is appended to a
+result CSV. Memory use stays the same whatever the size of the input.
+"""
+import csv
+import io
+import json
+import logging
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from . import fingerprints, upstream
+from .crm import ensure_fields_exist, get_module_fields
+from .models import LeadImport
+from .tokens import get_valid_token
+
+logger = logging.getLogger(__name__)
+
+# Rows per bulk write job; Zoho takes at most 25,000 records per file
+CHUNK_SIZE = min(getattr(settings, 'ZOHO_BULK_WRITE_CHUNK', 25000), 25000)
+# How often a job's status is checked, and how long to wait for it (seconds)
+POLL_INTERVAL = getattr(settings, 'ZOHO_BULK_POLL_INTERVAL', 10)
+POLL_TIMEOUT = getattr(settings, 'ZOHO_BULK_POLL_TIMEOUT', 3600)
+# Field Zoho matches existing leads on; it has to be unique in the Leads module
+FIND_BY = getattr(settings, 'ZOHO_BULK_FIND_BY', 'Email')
+# Files uploaded to POST /api/leads/import/ and their result files
+IMPORT_DIR = Path(getattr(settings, 'ZOHO_IMPORT_DIR', Path(settings.BASE_DIR) / 'imports'))
+
+FORMATS = ('csv', 'ndjson')
+RESULT_COLUMNS = ['row', 'status', 'record_id', 'errors']
+FINISHED_STATUSES = {'COMPLETED', 'FAILED'}
+SUCCESS_STATUSES = {'ADDED', 'UPDATED', 'INSERTED', 'UPSERTED'}
+_COPY_BUFFER = 64 * 1024
+
+
+class BulkImportError(Exception):
+    """A chunk couldn't be imported; every row in it is reported with this message."""
+
+
+class MissingScopeError(BulkImportError):
+    """The account's token lacks the Bulk Write/file scopes; no chunk can succeed, so the import stops."""
+
+    def __init__(self, account):
+        super().__init__(f"Account {account.account_name} hasn't granted Zoho the bulk import permissions "
+                         f"(ZohoCRM.bulk.ALL, ZohoFiles.files.ALL); re-connect it from the dashboard and retry")
+
+
+def check_scope(account, resp):
+    """Accounts connected before imports existed were never asked for these scopes."""
+    try:
+        code = resp.json().get('code')
+    except (ValueError, AttributeError):
+        return
+    if code == 'OAUTH_SCOPE_MISMATCH':
+        raise MissingScopeError(account)
+
+
+def detect_format(name='', content_type=''):
+    name = (name or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')) or content_type in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    if name.endswith('.csv') or content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    return None
+
+
+def read_rows(fileobj, fmt):
+    """Yield (row number, record or None if unreadable) from a binary CSV/NDJSON stream."""
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(text), 1):
+            yield number, {key: value for key, value in row.items() if key and value not in (None, '')}
+        return
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+
+def _cell(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def prepare_record(record):
+    record.pop('tenant_id', None)
+    if 'Last_Name' not in record and 'last_name' not in record:
+        record['Last_Name'] = 'Unknown' # Default for Zoho mandatory field
+    return {key: _cell(value) for key, value in record.items() if value is not None}
+
+
+class Chunk:
+    """Up to CHUNK_SIZE rows spooled to a temporary file, with the union of their columns."""
+
+    def __init__(self):
+        self.spool = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        self.columns = {}
+        self.size = 0
+
+    def add(self, number, record):
+        for key in record:
+            self.columns.setdefault(key, len(self.columns))
+        self.spool.write(json.dumps([number, record]) + '\n')
+        self.size += 1
+
+    def rows(self):
+        self.spool.seek(0)
+        for line in self.spool:
+            yield json.loads(line)
+
+    def write_zip(self, path):
+        """The chunk as Leads.csv inside a zip, the format the Bulk Write API takes."""
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            with archive.open('Leads.csv', 'w') as raw:
+                out = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+                writer = csv.writer(out)
+                writer.writerow(self.columns)
+                for _, record in self.rows():
+                    writer.writerow([record.get(column, '') for column in self.columns])
+                out.flush()
+                out.detach()
+
+    def close(self):
+        self.spool.close()
+
+
+def chunks(rows, results, counts):
+    """Group readable rows into Chunks; unreadable ones go straight to the result file."""
+    chunk = Chunk()
+    for number, record in rows:
+        if record is None:
+            results.writerow([number, 'INVALID', '', 'Row is not a JSON object'])
+            counts['invalid'] += 1
+            continue
+        chunk.add(number, prepare_record(record))
+        if chunk.size >= CHUNK_SIZE:
+            yield chunk
+            chunk = Chunk()
+    if chunk.size:
+        yield chunk
+    else:
+        chunk.close()
+
+
+def content_domain(api_domain):
+    """File uploads go to content.zohoapis.<dc> rather than www.zohoapis.<dc>."""
+    parts = urlsplit(api_domain)
+    if parts.netloc.startswith('www.zohoapis.'):
+        return f"{parts.scheme}://content.{parts.netloc[len('www.'):]}"
+    return api_domain
+
+
+def get_org_id(account, headers):
+    resp = upstream.get(f"{account.api_domain}/crm/v2/org", account=account, headers=headers)
+    org = (resp.json().get('org') or [{}])[0] if resp.status_code == 200 else {}
+    org_id = org.get('zgid') or org.get('id')
+    if not org_id:
+        raise BulkImportError(f"Couldn't read the CRM org id (HTTP {resp.status_code})")
+    return org_id
+
+
+def upload_zip(account, headers, org_id, path):
+    with open(path, 'rb') as fh:
+        resp = upstream.post(f"{content_domain(account.api_domain)}/crm/v2/upload", account=account,
+                             headers=dict(headers, **{'X-CRM-ORG': org_id, 'feature': 'bulk-write'}),
+                             files={'file': (Path(path).name, fh, 'application/zip')})
+    check_scope(account, resp)
+    file_id = (resp.json().get('details') or {}).get('file_id') if resp.status_code == 200 else None
+    if not file_id:
+        raise BulkImportError(f"File upload failed (HTTP {resp.status_code}): {resp.text[:200]}")
+    return file_id
+
+
+def create_job(account, headers, file_id, columns, existing_fields):
+    # Columns Zoho doesn't know (e.g. a field it refused to create) are left out of the mapping
+    mappings = [{'api_name': column, 'index': index} for column, index in columns.items()
+                if existing_fields is None or column in existing_fields]
+    resource = {'type': 'data', 'module': 'Leads', 'file_id': file_id, 'field_mappings': mappings}
+    operation = 'insert'
+    if FIND_BY in columns:
+        operation = 'upsert'
+        resource['find_by'] = FIND_BY
+    resp = upstream.post(f"{account.api_domain}/crm/bulk/v2/write", account=account, headers=headers,
+                         json={'operation': operation, 'ignore_empty': True, 'resource': [resource]})
+    check_scope(account, resp)
+    job_id = (resp.json().get('details') or {}).get('id') if resp.status_code in (200, 201) else None
+    if not job_id:
+        raise BulkImportError(f"Bulk write job was refused (HTTP {resp.status_code}): {resp.text[:200]}")
+    return str(job_id)
+
+
+def wait_for_job(account, job_id):
+    deadline = time.monotonic() + POLL_TIMEOUT
+    while True:
+        # Jobs can outlive an access token; fetch a fresh one each time
+        headers = {'Authorization': f'Zoho-oauthtoken {get_valid_token(account)}'}
+        resp = upstream.get(f"{account.api_domain}/crm/bulk/v2/write/{job_id}", account=account, headers=headers)
+        status = resp.json().get('status') if resp.status_code == 200 else None
+        if status in FINISHED_STATUSES:
+            return resp.json()
+        if time.monotonic() >= deadline:
+            raise BulkImportError(f"Bulk write job {job_id} didn't finish within {POLL_TIMEOUT}s")
+        time.sleep(POLL_INTERVAL)
+
+
+def result_rows(account, job):
+    """Yield Zoho's per-row result (STATUS, RECORD_ID, ERRORS...) from the job's result zip."""
+    download_url = (job.get('result') or {}).get('download_url')
+    if not download_url:
+        raise BulkImportError(f"Bulk write job {job.get('status', '').lower()} without a result file")
+    headers = {'Authorization': f'Zoho-oauthtoken {get_valid_token(account)}'}
+    resp = upstream.get(urljoin(account.api_domain, download_url), account=account, headers=headers, stream=True)
+    if resp.status_code != 200:
+        raise BulkImportError(f"Result download failed (HTTP {resp.status_code})")
+    with tempfile.TemporaryFile() as spool:
+        for block in resp.iter_content(_COPY_BUFFER):
+            spool.write(block)
+        spool.seek(0)
+        with zipfile.ZipFile(spool) as archive:
+            name = next(name for name in archive.namelist() if name.lower().endswith('.csv'))
+            with archive.open(name) as raw:
+                yield from csv.DictReader(io.TextIOWrapper(raw, encoding='utf-8-sig', newline=''))
+
+
+def forget_fingerprints(account, chunk, batch_size=500):
+    """The import changes these leads behind the fingerprint index's back."""
+    batch = []
+    for _, record in chunk.rows():
+        batch.append(record)
+        if len(batch) >= batch_size:
+            fingerprints.forget(account, batch)
+            batch = []
+    fingerprints.forget(account, batch)
+
+
+def import_chunk(account, chunk, org_id, results):
+    """Run one chunk through a bulk write job; returns (succeeded, failed, job id)."""
+    token = get_valid_token(account)
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+    ensure_fields_exist(account, 'Leads', chunk.columns)
+    existing_fields = get_module_fields(account, 'Leads', headers)
+
+    # Before the job (repeats of the old payloads must be sent) and after it (one may have
+    # been upserted through the proxy meanwhile, and the import overwrote it)
+    forget_fingerprints(account, chunk)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = Path(workdir) / 'Leads.zip'
+        chunk.write_zip(path)
+        file_id = upload_zip(account, headers, org_id, path)
+    job_id = create_job(account, headers, file_id, chunk.columns, existing_fields)
+    logger.info("Bulk write job %s started for %s rows (account %s)", job_id, chunk.size, account.pk)
+    job = wait_for_job(account, job_id)
+
+    succeeded = failed = 0
+    outcomes = result_rows(account, job)
+    try:
+        # Zoho's result file lists the rows in upload order
+        for number, _ in chunk.rows():
+            outcome = next(outcomes, None) or {'STATUS': 'UNKNOWN', 'ERRORS': 'Missing from Zoho result file'}
+            status = outcome.get('STATUS', '')
+            ok = status.upper() in SUCCESS_STATUSES
+            succeeded += ok
+            failed += not ok
+            results.writerow([number, status, outcome.get('RECORD_ID', ''), outcome.get('ERRORS', '')])
+    finally:
+        outcomes.close()
+    forget_fingerprints(account, chunk)
+    return succeeded, failed, job_id
+
+
+def run_import(account, source, fmt, result_file, progress=None):
+    """
+    Import every row of `source` (a binary file object) into Leads, writing one result line
+    per input row to `result_file` (a text file). `progress(succeeded, failed, job_id)` is
+    called after each chunk. Returns (succeeded, failed).
+    """
+    results = csv.writer(result_file)
+    results.writerow(RESULT_COLUMNS)
+    token = get_valid_token(account)
+    org_id = get_org_id(account, {'Authorization': f'Zoho-oauthtoken {token}'})
+
+    succeeded = failed = 0
+    counts = {'invalid': 0}
+    for chunk in chunks(read_rows(source, fmt), results, counts):
+        try:
+            ok, bad, job_id = import_chunk(account, chunk, org_id, results)
+        except MissingScopeError:
+            raise
+        except (BulkImportError, requests.RequestException, ValueError) as e:
+            logger.warning("Bulk import chunk of %s rows failed for account %s: %s", chunk.size, account.pk, e)
+            ok, bad, job_id = 0, chunk.size, None
+            for number, _ in chunk.rows():
+                results.writerow([number, 'FAILED', '', str(e)])
+        finally:
+            chunk.close()
+        succeeded += ok
+        failed += bad
+        result_file.flush()
+        if progress:
+            progress(succeeded, failed + counts['invalid'], job_id)
+    return succeeded, failed + counts['invalid']
+
+
+def save_upload(chunks_iter, fmt):
+    """Write an uploaded file to IMPORT_DIR block by block; returns its path."""
+    IMPORT_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile('wb', dir=IMPORT_DIR, suffix=f'.{fmt}', delete=False) as out:
+        for block in chunks_iter:
+            out.write(block)
+    return out.name
+
+
+def process_import(lead_import):
+    """Run a queued LeadImport (uploaded through the API) to completion."""
+    lead_import.status = LeadImport.STATUS_PROCESSING
+    lead_import.result_path = str(Path(lead_import.source_path).with_suffix('.results.csv'))
+    lead_import.save(update_fields=['status', 'result_path', 'updated_at'])
+
+    def progress(succeeded, failed, job_id):
+        lead_import.succeeded, lead_import.failed = succeeded, failed
+        if job_id:
+            lead_import.zoho_job_ids.append(job_id)
+        lead_import.save(update_fields=['succeeded', 'failed', 'zoho_job_ids', 'updated_at'])
+
+    try:
+        with open(lead_import.source_path, 'rb') as source, \
+                open(lead_import.result_path, 'w', encoding='utf-8', newline='') as result_file:
+            lead_import.succeeded, lead_import.failed = run_import(
+                lead_import.account, source, lead_import.format, result_file, progress)
+    except (BulkImportError, requests.RequestException, ValueError, OSError) as e:
+        logger.warning("Lead import %s failed: %s", lead_import.pk, e)
+        lead_import.status = LeadImport.STATUS_FAILED
+        lead_import.error = str(e)
+    except Exception as e:
+        # A bug or a database error: still mark the import failed rather than leave it processing
+        logger.exception("Lead import %s failed unexpectedly", lead_import.pk)
+        lead_import.status = LeadImport.STATUS_FAILED
+        lead_import.error = f"{type(e).__name__}: {e}"
+    else:
+        lead_import.status = LeadImport.STATUS_DONE
+    lead_import.finished_at = timezone.now()
+    lead_import.save(update_fields=['status', 'succeeded', 'failed', 'error', 'finished_at', 'updated_at'])
+    return lead_import
+
+
+def claim_next_import():
+    """Take the oldest queued import, or None; safe with several workers."""
+    for pk in LeadImport.objects.filter(status=LeadImport.STATUS_QUEUED).order_by('created_at') \
+            .values_list('pk', flat=True)[:10]:
+        if LeadImport.objects.filter(pk=pk, status=LeadImport.STATUS_QUEUED) \
+                .update(status=LeadImport.STATUS_PROCESSING, updated_at=timezone.now()):
+            return LeadImport.objects.select_related('account').get(pk=pk)
+    return None
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class TTLCache:
+    """Small thread-safe in-process cache with per-entry expiry and an LRU size bound."""
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Lookup outcomes, exported by base/metrics.py
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Drop every entry whose key matches predicate(key)."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls sharing a key into one execution whose result every caller receives."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: concurrent awaits of a key on one event loop share one task."""
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        task = self._tasks.get(flight_key)
+        if task is None:
+            task = self._tasks[flight_key] = loop.create_task(fn(*args, **kwargs))
+            task.add_done_callback(lambda _: self._tasks.pop(flight_key, None))
+        # A caller going away (client disconnect) mustn't cancel the call for the others
+        return await asyncio.shield(task)
+
+
+# Field metadata per (account pk, module), used by ensure_fields_exist
+field_cache = TTLCache(
+    ttl=getattr(settings, 'ZOHO_FIELD_CACHE_TTL', 600),
+    maxsize=getattr(settings, 'ZOHO_FIELD_CACHE_MAXSIZE', 256),
+)
+
+# Fields Zoho refused to create per (account pk, module, api_name), so every lead
+# carrying them doesn't retry the creation
+field_failure_cache = TTLCache(
+    ttl=getattr(settings, 'ZOHO_FIELD_FAILURE_TTL', 3600),
+    maxsize=getattr(settings, 'ZOHO_FIELD_CACHE_MAXSIZE', 256) * 16,
+)
+
+# Bookings availability per (account pk, service, staff, date, timezone); kept short since
+# bookings made outside this proxy only show up once an entry expires
+slot_cache = TTLCache(
+    ttl=getattr(settings, 'ZOHO_SLOT_CACHE_TTL', 60),
+    maxsize=getattr(settings, 'ZOHO_SLOT_CACHE_MAXSIZE', 2048),
+)
+
+# Lead lookups per (account pk, id, email, phone), including "not found"; dropped when the
+# proxy upserts a lead with that id, Email or Phone
+lead_cache = TTLCache(
+    ttl=getattr(settings, 'ZOHO_LEAD_CACHE_TTL', 30),
+    maxsize=getattr(settings, 'ZOHO_LEAD_CACHE_MAXSIZE', 4096),
+)
+
+# Active ZohoAccount per tenant_id (and the primary account), see base/accounts.py
+account_cache = TTLCache(
+    ttl=getattr(settings, 'ZOHO_ACCOUNT_CACHE_TTL', 300),
+    maxsize=getattr(settings, 'ZOHO_ACCOUNT_CACHE_MAXSIZE', 1024),
+)
+
+# Bookings metadata for get_service_fields: the portal per account, the endpoint probe that
+# works (and the ones that don't) per api_domain, and parsed mandatory fields per service.
+# Entries carry their own TTLs, see base/bookings.py.
+bookings_meta_cache = TTLCache(
+    ttl=getattr(settings, 'ZOHO_SERVICE_FIELDS_CACHE_TTL', 600),
+    maxsize=getattr(settings, 'ZOHO_BOOKINGS_META_CACHE_MAXSIZE', 1024),
+)
@@ -0,0 +1,497 @@
+import asyncio
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+
+from . import async_upstream, upstream
+from .cache import AsyncSingleFlight, SingleFlight, field_cache, field_failure_cache, lead_cache
+from .log import BodyPreview
+from .timing import timed
+from .tokens import aget_valid_token, get_valid_token
+
+logger = logging.getLogger(__name__)
+
+# Zoho's upsert endpoint accepts at most 100 records per call
+UPSERT_BATCH_SIZE = min(getattr(settings, 'ZOHO_UPSERT_BATCH_SIZE', 100), 100)
+DUPLICATE_CHECK_FIELDS = ["Email", "Phone"]
+
+# Per-field creation requests in flight at once, when Zoho won't take a batch
+FIELD_CREATE_CONCURRENCY = getattr(settings, 'ZOHO_FIELD_CREATE_CONCURRENCY', 4)
+# Codes meaning the field is already there (e.g. another worker created it first)
+FIELD_EXISTS_CODES = {'DUPLICATE_DATA', 'ALREADY_EXISTS'}
+
+_field_executor = ThreadPoolExecutor(max_workers=FIELD_CREATE_CONCURRENCY, thread_name_prefix='field-create')
+
+# Lead exports: records per page (Zoho's maximum is 200), and exports that can have their
+# next page loading at once
+EXPORT_PAGE_SIZE = min(getattr(settings, 'ZOHO_EXPORT_PAGE_SIZE', 200), 200)
+EXPORT_PREFETCH_WORKERS = getattr(settings, 'ZOHO_EXPORT_PREFETCH_WORKERS', 8)
+
+_page_executor = ThreadPoolExecutor(max_workers=EXPORT_PREFETCH_WORKERS, thread_name_prefix='lead-export')
+
+_MISSING = object()
+# Concurrent identical lead lookups share one Zoho round trip
+_lead_flight = SingleFlight()
+_alead_flight = AsyncSingleFlight()
+
+
+def get_module_fields(account, module, headers):
+    """Return the set of field api_names for a module, served from the field cache when warm."""
+    cache_key = (account.pk, module)
+    existing_fields = field_cache.get(cache_key)
+    if existing_fields is not None:
+        return existing_fields
+
+    fields_url = f"{account.api_domain}/crm/v2/settings/fields?module={module}"
+    try:
+        resp = upstream.get(fields_url, account=account, headers=headers)
+    except requests.RequestException as e:
+        logger.warning("Fields lookup failed for account %s: %s", account.pk, e)
+        return None
+    if resp.status_code != 200:
+        return None
+
+    existing_fields = frozenset(field['api_name'] for field in resp.json().get('fields', []))
+    field_cache.set(cache_key, existing_fields)
+    return existing_fields
+
+
+async def aget_module_fields(account, module, headers):
+    cache_key = (account.pk, module)
+    existing_fields = field_cache.get(cache_key)
+    if existing_fields is not None:
+        return existing_fields
+
+    fields_url = f"{account.api_domain}/crm/v2/settings/fields?module={module}"
+    try:
+        resp = await async_upstream.get(fields_url, account=account, headers=headers)
+    except async_upstream.HTTPError as e:
+        logger.warning("Fields lookup failed for account %s: %s", account.pk, e)
+        return None
+    if resp.status_code != 200:
+        return None
+
+    existing_fields = frozenset(field['api_name'] for field in resp.json().get('fields', []))
+    field_cache.set(cache_key, existing_fields)
+    return existing_fields
+
+
+def invalidate_module_fields(account, module):
+    field_cache.delete((account.pk, module))
+
+
+# List of system fields to never try to create
+SYSTEM_BASE_FIELDS = {'First_Name', 'Last_Name', 'Email', 'Company', 'Phone', 'Mobile', 'Lead_Source', 'Lead_Status', 'Industry', 'Website', 'Description'}
+
+
+def fields_to_create(existing_fields, data_keys):
+    # A new field is one that's neither a system field nor already in Zoho
+    return [key for key in data_keys if key not in existing_fields and key not in SYSTEM_BASE_FIELDS]
+
+
+def field_definition(key):
+    # Prepare API Name: Zoho API names usually don't like multiple underscores or starting with numbers
+    # But we'll try to use what's provided first.
+    return {
+        "api_name": key,
+        "display_label": key.replace('_', ' ').title(),
+        "data_type": "text",
+        "field_label": key.replace('_', ' ').title(), # Some versions use field_label
+        "length": 255
+    }
+
+
+def _field_row_ok(row):
+    return row.get('status') == 'success' or row.get('code') in FIELD_EXISTS_CODES
+
+
+def parse_field_results(keys, status_code, resp_json):
+    """
+    Outcome per key of a fields POST: True if the field now exists, False if Zoho rejected it.
+    None when the response doesn't say per field (e.g. the batch as a whole was refused).
+    """
+    rows = resp_json.get('fields') if isinstance(resp_json, dict) else None
+    if isinstance(rows, list) and len(rows) == len(keys):
+        return {key: _field_row_ok(row) for key, row in zip(keys, rows)}
+    if len(keys) == 1:
+        if status_code in [200, 201]:
+            return {keys[0]: True}
+        # Auth and rate-limit errors say nothing about the field itself
+        if 400 <= status_code < 500 and status_code not in [401, 403, 429] and isinstance(resp_json, dict):
+            return {keys[0]: _field_row_ok(resp_json)}
+    return None
+
+
+def record_field_results(account, module, results):
+    """Add created fields to the cached field list and remember rejected ones for a while."""
+    created = frozenset(key for key, ok in results.items() if ok)
+    if created:
+        existing_fields = field_cache.get((account.pk, module))
+        if existing_fields is not None:
+            field_cache.set((account.pk, module), existing_fields | created)
+    for key, ok in results.items():
+        if not ok:
+            logger.info("Zoho rejected field %r; not retrying it for a while", key)
+            field_failure_cache.set((account.pk, module, key), True)
+
+
+def missing_fields(account, module, existing_fields, data_keys):
+    return [key for key in fields_to_create(existing_fields, data_keys)
+            if not field_failure_cache.get((account.pk, module, key))]
+
+
+def _log_field_response(keys, resp, results):
+    if results is None or not all(results.values()):
+        logger.debug("Field creation response for %s: %s - %s", keys, resp.status_code, BodyPreview(resp),
+                     extra={'sampled': True})
+
+
+def _json_or_empty(resp):
+    try:
+        return resp.json()
+    except ValueError:
+        return {}
+
+
+def _post_fields(account, create_url, headers, keys):
+    resp = upstream.post(create_url, account=account, headers=headers,
+                         json={"fields": [field_definition(key) for key in keys]})
+    results = parse_field_results(keys, resp.status_code, _json_or_empty(resp))
+    _log_field_response(keys, resp, results)
+    return results
+
+
+def _post_field(account, create_url, headers, key):
+    try:
+        return _post_fields(account, create_url, headers, [key]) or {}
+    except requests.RequestException as e:
+        logger.warning("Field creation failed for %r: %s", key, e)
+        return {}
+
+
+@timed('fields')
+def ensure_fields_exist(account, module, data_keys):
+    token = get_valid_token(account)
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+    
+    # Get existing fields
+    existing_fields = get_module_fields(account, module, headers)
+    if existing_fields is None:
+        return # Fallback or log error
+
+    keys = missing_fields(account, module, existing_fields, data_keys)
+    if not keys:
+        return
+    logger.info("Fields %s not found in Zoho; creating them", keys)
+    _create_fields(account, module, headers, keys)
+
+
+@timed('field_create')
+def _create_fields(account, module, headers, keys):
+    create_url = f"{account.api_domain}/crm/v2/settings/fields?module={module}"
+
+    # One request for all of them; Zoho answers per field
+    try:
+        results = _post_fields(account, create_url, headers, keys)
+    except requests.RequestException as e:
+        logger.warning("Field creation failed for %s: %s", keys, e)
+        return
+
+    if results is None:
+        # The batch was refused as a whole: create them one by one, a few at a time
+        results = {}
+        for partial in _field_executor.map(lambda key: _post_field(account, create_url, headers, key), keys):
+            results.update(partial)
+    record_field_results(account, module, results)
+
+
+async def _apost_fields(account, create_url, headers, keys):
+    resp = await async_upstream.post(create_url, account=account, headers=headers,
+                                     json={"fields": [field_definition(key) for key in keys]})
+    results = parse_field_results(keys, resp.status_code, _json_or_empty(resp))
+    _log_field_response(keys, resp, results)
+    return results
+
+
+@timed('fields')
+async def aensure_fields_exist(account, module, data_keys):
+    token = await aget_valid_token(account)
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+
+    existing_fields = await aget_module_fields(account, module, headers)
+    if existing_fields is None:
+        return
+
+    keys = missing_fields(account, module, existing_fields, data_keys)
+    if not keys:
+        return
+    logger.info("Fields %s not found in Zoho; creating them", keys)
+    await _acreate_fields(account, module, headers, keys)
+
+
+@timed('field_create')
+async def _acreate_fields(account, module, headers, keys):
+    create_url = f"{account.api_domain}/crm/v2/settings/fields?module={module}"
+
+    try:
+        results = await _apost_fields(account, create_url, headers, keys)
+    except async_upstream.HTTPError as e:
+        logger.warning("Field creation failed for %s: %s", keys, e)
+        return
+
+    if results is None:
+        semaphore = asyncio.Semaphore(FIELD_CREATE_CONCURRENCY)
+
+        async def create_one(key):
+            async with semaphore:
+                try:
+                    return await _apost_fields(account, create_url, headers, [key]) or {}
+                except async_upstream.HTTPError as e:
+                    logger.warning("Field creation failed for %r: %s", key, e)
+                    return {}
+
+        results = {}
+        for partial in await asyncio.gather(*(create_one(key) for key in keys)):
+            results.update(partial)
+    record_field_results(account, module, results)
+
+
+def parse_upsert_row(row):
+    """Flatten one entry of Zoho's upsert `data` array into the proxy's per-record result."""
+    return {
+        'status': row.get('status', 'error'),
+        'lead_id': row.get('details', {}).get('id') if row.get('status') == 'success' else None,
+        'action': row.get('action'),
+        'code': row.get('code'),
+        'message': row.get('message'),
+    }
+
+
+def summarize_upsert(status_code, resp_json):
+    """(lead_id, action) from a single-record upsert response."""
+    lead_id = None
+    action = "created"
+    try:
+        if status_code in [200, 201]:
+            data = resp_json.get('data', [])
+            if data and data[0].get('status') == 'success':
+                lead_id = data[0].get('details', {}).get('id')
+                action = data[0].get('action', 'success')
+    except:
+        pass
+    return lead_id, action
+
+
+def lead_search_criteria(email, phone):
+    criteria = []
+    if email: criteria.append(f"(Email:equals:{email})")
+    if phone: criteria.append(f"(Phone:equals:{phone})")
+
+    # Combine criteria with OR if both provided
+    return criteria[0] if len(criteria) == 1 else f"({'OR'.join(criteria)})"
+
+
+def normalize_email(email):
+    return str(email or '').strip().lower()
+
+
+def normalize_phone(phone):
+    return re.sub(r'\D', '', str(phone or ''))
+
+
+def search_phone(phone):
+    """Phone as Zoho's Phone:equals: search matches it: literally, so "+1 555" and "1555" differ."""
+    return str(phone or '').strip()
+
+
+def dedupe_key_for(payload):
+    """Normalized Email (or Phone digits) identifying the Zoho record a payload will upsert into."""
+    email = normalize_email(payload.get('Email'))
+    if email:
+        return f"email:{email}"
+    phone = normalize_phone(payload.get('Phone'))
+    if phone:
+        return f"phone:{phone}"
+    return ''
+
+
+def lead_cache_key(account, lead_id, email, phone):
+    return (account.pk, str(lead_id or ''), normalize_email(email), search_phone(phone))
+
+
+def invalidate_leads(account, records=(), lead_ids=()):
+    """Forget cached lookups that could match these upserted records (by Email, Phone or id)."""
+    ids = {str(lead_id) for lead_id in lead_ids if lead_id}
+    emails = {normalize_email(record.get('Email')) for record in records} - {''}
+    phones = {normalize_phone(record.get('Phone')) for record in records} - {''}
+    if not (ids or emails or phones):
+        return
+    lead_cache.delete_where(lambda key: key[0] == account.pk and (
+        key[1] in ids or key[2] in emails or (key[3] and normalize_phone(key[3]) in phones)))
+
+
+def _first_record(resp):
+    if resp.status_code != 200:
+        return None
+    return (resp.json().get('data') or [None])[0]
+
+
+def fetch_lead(account, lead_id, email, phone):
+    """The lead with this id, else the first matching Email/Phone; None when there is none."""
+    token = get_valid_token(account)
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+    lead_data = None
+    if lead_id:
+        resp = upstream.get(f"{account.api_domain}/crm/v2/Leads/{lead_id}", account=account, headers=headers)
+        lead_data = _first_record(resp)
+    if not lead_data and (email or phone):
+        resp = upstream.get(f"{account.api_domain}/crm/v2/Leads/search", account=account, headers=headers,
+                            params={'criteria': lead_search_criteria(email, phone)})
+        lead_data = _first_record(resp)
+    return lead_data
+
+
+async def afetch_lead(account, lead_id, email, phone):
+    token = await aget_valid_token(account)
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+    lead_data = None
+    if lead_id:
+        resp = await async_upstream.get(f"{account.api_domain}/crm/v2/Leads/{lead_id}", account=account,
+                                        headers=headers)
+        lead_data = _first_record(resp)
+    if not lead_data and (email or phone):
+        resp = await async_upstream.get(f"{account.api_domain}/crm/v2/Leads/search", account=account,
+                                        headers=headers, params={'criteria': lead_search_criteria(email, phone)})
+        lead_data = _first_record(resp)
+    return lead_data
+
+
+def lookup_lead(account, lead_id=None, email=None, phone=None):
+    """fetch_lead through the lead cache; failed lookups raise and aren't cached."""
+    key = lead_cache_key(account, lead_id, email, phone)
+    lead_data = lead_cache.get(key, _MISSING)
+    if lead_data is _MISSING:
+        lead_data = _lead_flight.do(key, fetch_lead, account, lead_id, email, phone)
+        lead_cache.set(key, lead_data)
+    return lead_data
+
+
+async def alookup_lead(account, lead_id=None, email=None, phone=None):
+    key = lead_cache_key(account, lead_id, email, phone)
+    lead_data = lead_cache.get(key, _MISSING)
+    if lead_data is _MISSING:
+        lead_data = await _alead_flight.do(key, afetch_lead, account, lead_id, email, phone)
+        lead_cache.set(key, lead_data)
+    return lead_data
+
+
+def export_criteria(email=None, phone=None, criteria=None, modified_since=None):
+    """Zoho search criteria for an export, or None to list every lead."""
+    parts = []
+    if email or phone:
+        parts.append(lead_search_criteria(email, phone))
+    if criteria:
+        parts.append(criteria if criteria.startswith('(') else f"({criteria})")
+    if parts and modified_since:
+        # The search API ignores If-Modified-Since
+        parts.append(f"(Modified_Time:greater_equal:{modified_since})")
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else f"({'and'.join(parts)})"
+
+
+def fetch_leads_page(account, url, headers, params):
+    """One page of a lead list/search: (records, info). No content (204/304) is an empty last page."""
+    resp = upstream.get(url, account=account, headers=headers, params=params)
+    if resp.status_code in (204, 304):
+        return [], {}
+    if resp.status_code != 200:
+        raise requests.HTTPError(f"Zoho answered HTTP {resp.status_code}: {resp.text[:200]}", response=resp)
+    body = resp.json()
+    return body.get('data') or [], body.get('info') or {}
+
+
+def iter_lead_pages(account, email=None, phone=None, criteria=None, modified_since=None, fields=None):
+    """
+    Yield pages (lists) of matching leads, oldest change first when listing. Pages are fetched
+    lazily, one ahead: the next page loads while the caller handles the current one.
+    `modified_since` is an ISO 8601 datetime.
+    """
+    search = export_criteria(email, phone, criteria, modified_since)
+    params = {'per_page': EXPORT_PAGE_SIZE}
+    extra_headers = {}
+    if search:
+        url = f"{account.api_domain}/crm/v2/Leads/search"
+        params['criteria'] = search
+    else:
+        url = f"{account.api_domain}/crm/v2/Leads"
+        params.update(sort_by='Modified_Time', sort_order='asc')
+        if modified_since:
+            extra_headers['If-Modified-Since'] = modified_since
+    if fields:
+        params['fields'] = ','.join(fields)
+
+    def fetch(page_params):
+        # A long export can outlive an access token
+        headers = {'Authorization': f'Zoho-oauthtoken {get_valid_token(account)}', **extra_headers}
+        return _page_executor.submit(fetch_leads_page, account, url, headers, page_params)
+
+    page_params = dict(params, page=1)
+    future = fetch(page_params)
+    try:
+        while future is not None:
+            records, info = future.result()
+            future = None
+            if info.get('more_records') and records:
+                if info.get('next_page_token'):
+                    page_params = dict(params, page_token=info['next_page_token'])
+                else:
+                    page_params = dict(page_params, page=page_params.get('page', 1) + 1)
+                future = fetch(page_params)
+            if records:
+                yield records
+    finally:
+        # The consumer stopped early (e.g. the client went away): don't fetch for nobody
+        if future is not None:
+            future.cancel()
+
+
+@timed('upsert')
+def upsert_leads(account, records):
+    """
+    Upsert records into Leads in 100-record chunks; returns one result per record, in input
+    order. `retryable` marks failures worth sending again (no answer, 429, 5xx).
+    """
+    token = get_valid_token(account)
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+    lead_url = f"{account.api_domain}/crm/v2/Leads/upsert"
+
+    results = []
+    for start in range(0, len(records), UPSERT_BATCH_SIZE):
+        chunk = records[start:start + UPSERT_BATCH_SIZE]
+        upsert_data = {
+            "data": chunk,
+            "duplicate_check_fields": DUPLICATE_CHECK_FIELDS
+        }
+        try:
+            resp = upstream.post(lead_url, account=account, headers=headers, json=upsert_data)
+            rows = resp.json().get('data') or []
+        except (requests.RequestException, ValueError) as e:
+            results.extend({'status': 'error', 'lead_id': None, 'action': None, 'code': None,
+                            'message': f'Zoho upsert failed: {e}', 'retryable': True} for _ in chunk)
+            continue
+
+        # Throttled or failing on Zoho's side: the same records may go through later
+        retryable = resp.status_code == 429 or resp.status_code >= 500
+        chunk_results = []
+        for i in range(len(chunk)):
+            row = rows[i] if i < len(rows) else {'message': f'No result from Zoho (HTTP {resp.status_code})'}
+            result = parse_upsert_row(row)
+            result['retryable'] = retryable and result['status'] != 'success'
+            chunk_results.append(result)
+        invalidate_leads(account, chunk, [result['lead_id'] for result in chunk_results])
+        results.extend(chunk_results)
+    return results
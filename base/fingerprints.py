@@ -0,0 +1,116 @@
+"""
+Content hashes of the leads last upserted through the proxy, keyed by tenant and normalized
+Email/Phone. A payload identical to the previous one for the same lead (double-submitted
+forms, retried webhooks) is answered without calling Zoho, and a changed one is sent with
+only the fields that differ.
+
+Every process that writes leads (web workers, process_lead_queue, import_leads) has to see
+the same hashes, or one of them could skip a payload Zoho no longer holds. They live in the
+Django cache named by ZOHO_LEAD_FINGERPRINT_CACHE_ALIAS, which must be shared between them
+(Redis, Memcached, the database cache); without it every upsert is sent in full.
+"""
+import hashlib
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .crm import DUPLICATE_CHECK_FIELDS, dedupe_key_for
+
+# Fingerprints older than this (seconds) are ignored, so edits made directly in Zoho are
+# eventually overwritten by a repeated payload again
+TTL = getattr(settings, 'ZOHO_LEAD_FINGERPRINT_TTL', 86400)
+
+# Always sent, so the upsert still finds (or can create) the lead
+_ALWAYS_SENT = set(DUPLICATE_CHECK_FIELDS) | {'Last_Name', 'last_name'}
+
+skipped_total = metrics.Counter('zoho_proxy_lead_upserts_skipped_total',
+                                'Single-lead upserts answered from the fingerprint index, unchanged payloads.', [])
+
+Fingerprint = namedtuple('Fingerprint', ['lead_id', 'action', 'payload_hash', 'field_hashes'])
+
+
+class FingerprintStore:
+    """Fingerprints in a Django cache backend, shared by every process that uses it."""
+
+    def __init__(self, alias):
+        self._cache = caches[alias]
+
+    def _key(self, account_pk, key):
+        return f"zoho_fingerprint:{account_pk}:{_digest(key)}"
+
+    def get(self, account_pk, key):
+        return self._cache.get(self._key(account_pk, key))
+
+    def set(self, account_pk, key, fingerprint):
+        self._cache.set(self._key(account_pk, key), fingerprint, timeout=TTL)
+
+    def delete_many(self, account_pk, keys):
+        self._cache.delete_many([self._key(account_pk, key) for key in keys])
+
+
+def _build_store():
+    alias = getattr(settings, 'ZOHO_LEAD_FINGERPRINT_CACHE_ALIAS', None)
+    return FingerprintStore(alias) if alias else None
+
+
+# None when fingerprinting is off (no shared cache configured)
+store = _build_store()
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(',', ':'), default=str).encode()).hexdigest()
+
+
+def field_digests(payload):
+    return {key: _digest(value) for key, value in payload.items()}
+
+
+def find(account, payload):
+    """(key, fingerprint) for the lead the payload upserts into; fingerprint None if unknown or too old."""
+    key = dedupe_key_for(payload)
+    if not key or store is None:
+        return key, None
+    return key, store.get(account.pk, key)
+
+
+def is_unchanged(fingerprint, payload):
+    return fingerprint is not None and bool(fingerprint.lead_id) and fingerprint.payload_hash == _digest(payload)
+
+
+def changed_fields(fingerprint, payload):
+    """The part of the payload Zoho doesn't have yet, plus what the upsert needs to match the lead."""
+    if fingerprint is None:
+        return payload
+    known = fingerprint.field_hashes
+    return {key: value for key, value in payload.items()
+            if key in _ALWAYS_SENT or known.get(key) != _digest(value)}
+
+
+def remember(account, key, payload, lead_id, action, fingerprint=None):
+    """Record what Zoho now holds for this lead after a successful upsert."""
+    if not key or not lead_id or store is None:
+        return
+    hashes = dict(fingerprint.field_hashes) if fingerprint and fingerprint.lead_id == str(lead_id) else {}
+    hashes.update(field_digests(payload))
+    store.set(account.pk, key, Fingerprint(str(lead_id), action or '', _digest(payload), hashes))
+
+
+def remember_results(account, records, results):
+    """remember() for a batch upsert (bulk endpoint, queue worker); failed records are forgotten."""
+    failed = []
+    for record, result in zip(records, results):
+        if result['status'] == 'success' and result['lead_id']:
+            remember(account, dedupe_key_for(record), record, result['lead_id'], result['action'])
+        else:
+            failed.append(record)
+    forget(account, failed)
+
+
+def forget(account, records):
+    """Drop fingerprints for leads about to change by other means (queued leads, bulk imports)."""
+    keys = {dedupe_key_for(record) for record in records} - {''}
+    if keys and store is not None:
+        store.delete_many(account.pk, keys)
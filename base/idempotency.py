@@ -0,0 +1,186 @@
+"""
+Idempotency-Key support for the lead and booking POSTs. The first request with a key runs
+and its response is stored; retries with the same key get that response back without Zoho
+being called again, and a retry arriving while the first is still running waits for it.
+"""
+import asyncio
+import functools
+import hashlib
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from . import metrics
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+# How long a stored response is replayed (seconds)
+TTL = getattr(settings, 'ZOHO_IDEMPOTENCY_TTL', 86400)
+# How long a duplicate waits for the first request to finish before giving up with a 409
+WAIT = getattr(settings, 'ZOHO_IDEMPOTENCY_WAIT', 30)
+# An in-progress key not touched for this long belongs to a worker that died; it's taken over
+LOCK_TIMEOUT = getattr(settings, 'ZOHO_IDEMPOTENCY_LOCK_TIMEOUT', 120)
+POLL_INTERVAL = 0.1
+
+_OWNER = 'owner'
+_REPLAY = 'replay'
+_IN_PROGRESS = 'in_progress'
+_CONFLICT = 'conflict'
+
+replays_total = metrics.Counter('zoho_proxy_idempotent_replays_total',
+                                'Responses replayed for a repeated Idempotency-Key, by endpoint.', ['endpoint'])
+
+
+def request_hash(request):
+    digest = hashlib.sha256()
+    for part in (request.method, request.path, request.META.get('QUERY_STRING', '')):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def claim(scope, key, fingerprint):
+    """
+    Try to take the key. Returns (outcome, record): _OWNER when this request should run,
+    _REPLAY with the stored response, _IN_PROGRESS while another request holds it, or
+    _CONFLICT when the key was used for a different request.
+    """
+    try:
+        with transaction.atomic():
+            return _OWNER, IdempotencyKey.objects.create(
+                scope=scope, key=key, request_hash=fingerprint, expires_at=timezone.now() + timedelta(seconds=TTL))
+    except IntegrityError:
+        return inspect(scope, key, fingerprint)
+
+
+def inspect(scope, key, fingerprint):
+    """claim() for a key that already exists: what to do about the request holding it."""
+    now = timezone.now()
+    record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+    if record is None:
+        # Deleted in between (expired or abandoned); try again
+        return claim(scope, key, fingerprint)
+    if record.expires_at <= now:
+        IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).delete()
+        return claim(scope, key, fingerprint)
+    if record.request_hash != fingerprint:
+        return _CONFLICT, record
+    if record.status == IdempotencyKey.STATUS_DONE:
+        return _REPLAY, record
+
+    stale_before = now - timedelta(seconds=LOCK_TIMEOUT)
+    if IdempotencyKey.objects.filter(pk=record.pk, status=IdempotencyKey.STATUS_IN_PROGRESS,
+                                     updated_at__lt=stale_before).update(updated_at=now):
+        return _OWNER, record
+    return _IN_PROGRESS, record
+
+
+def complete(record, response):
+    """Store the response for replay; server errors aren't stored, so a retry runs again."""
+    if response.status_code >= 500:
+        release(record)
+        return
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        status=IdempotencyKey.STATUS_DONE, response_status=response.status_code,
+        response_body=response.content.decode(), content_type=response.get('Content-Type', ''),
+        updated_at=timezone.now(),
+    )
+
+
+def release(record):
+    IdempotencyKey.objects.filter(pk=record.pk, status=IdempotencyKey.STATUS_IN_PROGRESS).delete()
+
+
+def purge_expired():
+    return IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def replay_response(scope, record):
+    replays_total.inc(scope)
+    response = HttpResponse(record.response_body, status=record.response_status, content_type=record.content_type)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _key_error(key):
+    if len(key) > 255:
+        return JsonResponse({'error': f'{HEADER} must be at most 255 characters'}, status=400)
+    return None
+
+
+def _unresolved_response(outcome):
+    if outcome == _CONFLICT:
+        return JsonResponse({'error': f'{HEADER} was already used for a different request'}, status=422)
+    return JsonResponse({'error': f'A request with this {HEADER} is still in progress; retry later'}, status=409)
+
+
+def idempotent(scope):
+    """
+    View decorator: requests carrying an Idempotency-Key run once per key; repeats get the
+    stored response (marked `Idempotent-Replayed: true`). Works on sync and async views.
+    """
+    def decorate(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                key = request.headers.get(HEADER)
+                if not key:
+                    return await view(request, *args, **kwargs)
+                error = _key_error(key)
+                if error:
+                    return error
+
+                fingerprint = request_hash(request)
+                deadline = time.monotonic() + WAIT
+                outcome, record = await sync_to_async(claim)(scope, key, fingerprint)
+                while outcome == _IN_PROGRESS and time.monotonic() < deadline:
+                    await asyncio.sleep(POLL_INTERVAL)
+                    outcome, record = await sync_to_async(inspect)(scope, key, fingerprint)
+                if outcome == _REPLAY:
+                    return replay_response(scope, record)
+                if outcome != _OWNER:
+                    return _unresolved_response(outcome)
+
+                try:
+                    response = await view(request, *args, **kwargs)
+                except BaseException:
+                    await sync_to_async(release)(record)
+                    raise
+                await sync_to_async(complete)(record, response)
+                return response
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                key = request.headers.get(HEADER)
+                if not key:
+                    return view(request, *args, **kwargs)
+                error = _key_error(key)
+                if error:
+                    return error
+
+                fingerprint = request_hash(request)
+                deadline = time.monotonic() + WAIT
+                outcome, record = claim(scope, key, fingerprint)
+                while outcome == _IN_PROGRESS and time.monotonic() < deadline:
+                    time.sleep(POLL_INTERVAL)
+                    outcome, record = inspect(scope, key, fingerprint)
+                if outcome == _REPLAY:
+                    return replay_response(scope, record)
+                if outcome != _OWNER:
+                    return _unresolved_response(outcome)
+
+                try:
+                    response = view(request, *args, **kwargs)
+                except BaseException:
+                    release(record)
+                    raise
+                complete(record, response)
+                return response
+        return wrapper
+    return decorate
@@ -0,0 +1,94 @@
+import logging
+import threading
+
+import requests
+
+from . import background, upstream
+from .models import ZohoAccount
+from .tokens import get_valid_token
+
+logger = logging.getLogger(__name__)
+
+# Name given to accounts until their owner's identity has been looked up
+GENERIC_ACCOUNT_NAME = "Zoho Account"
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def needs_identity(account):
+    return not account.account_name or account.account_name == GENERIC_ACCOUNT_NAME
+
+
+def fetch_identity(account, token):
+    """Display name for the token's owner, or None if Zoho wouldn't tell us."""
+    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+
+    # Use the regional OAuth User Info endpoint
+    info_resp = upstream.get(f"{account.accounts_server}/oauth/user/info", headers=headers)
+    logger.debug("Identity lookup for account %s: user info status %s", account.pk, info_resp.status_code)
+    if info_resp.status_code == 200:
+        info_data = info_resp.json()
+        return f"{info_data.get('Display_Name')} ({info_data.get('Email')})"
+
+    logger.debug("User info unavailable for account %s; trying the CRM org", account.pk)
+    org_resp = upstream.get(f"{account.api_domain}/crm/v2/org", account=account, headers=headers)
+    if org_resp.status_code == 200:
+        org_data = org_resp.json().get('org', [{}])[0]
+        return org_data.get('company_name')
+    return None
+
+
+def resolve_identity(account):
+    """Look up and store the account's display name; returns True once it has one."""
+    if not needs_identity(account):
+        return True
+    token = get_valid_token(account)
+    if not token:
+        return False
+    try:
+        name = fetch_identity(account, token)
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("Identity lookup failed for account %s: %s", account.pk, e)
+        return False
+    if not name or name == GENERIC_ACCOUNT_NAME:
+        return False
+
+    account.account_name = name
+    account.save(update_fields=['account_name', 'updated_at'])
+    logger.info("Resolved identity for account %s: %s", account.pk, account.account_name)
+    return True
+
+
+def _resolve_in_background(account_pk):
+    try:
+        account = ZohoAccount.objects.filter(pk=account_pk).first()
+        if account:
+            resolve_identity(account)
+    finally:
+        with _pending_lock:
+            _pending.discard(account_pk)
+
+
+def schedule_identity(account):
+    """Resolve the account's identity off the request path, at most once at a time per account."""
+    if not needs_identity(account):
+        return
+    with _pending_lock:
+        if account.pk in _pending:
+            return
+        _pending.add(account.pk)
+    background.submit(_resolve_in_background, account.pk)
+
+
+def resolve_pending_identities():
+    """Resolve every account still showing the generic name; returns (resolved, still_pending)."""
+    resolved = pending = 0
+    for account in ZohoAccount.objects.filter(is_active=True):
+        if not needs_identity(account):
+            continue
+        if resolve_identity(account):
+            resolved += 1
+        else:
+            pending += 1
+    return resolved, pending
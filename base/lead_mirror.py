@@ -0,0 +1,180 @@
+"""
+Local mirror of Zoho Leads for accounts with lead_mirror_enabled. sync_leads copies what
+changed since its last pass (Modified_Time cursor, If-Modified-Since) and drops deleted
+leads; lookups are answered from the table while the last full pass is recent enough.
+Upserts through the proxy are written through, so the mirror doesn't miss our own leads.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .crm import fetch_leads_page, iter_lead_pages, normalize_email, search_phone
+from .models import LeadMirror, LeadSyncState, ZohoAccount
+from .tokens import get_valid_token
+
+logger = logging.getLogger(__name__)
+
+# Lookups use the mirror while its last completed sync started at most this many seconds ago
+MAX_AGE = getattr(settings, 'ZOHO_LEAD_MIRROR_MAX_AGE', 300)
+# Changes are asked for from a little before the cursor, so leads saved in the same second
+# as the last one copied aren't missed
+CURSOR_OVERLAP = timedelta(seconds=1)
+
+
+def _parse_time(value):
+    return parse_datetime(value) if isinstance(value, str) else None
+
+
+def mirror_row(account, record):
+    return LeadMirror(
+        account=account,
+        lead_id=str(record['id']),
+        email=normalize_email(record.get('Email'))[:255],
+        phone=search_phone(record.get('Phone'))[:50],
+        data=record,
+        modified_time=_parse_time(record.get('Modified_Time')),
+    )
+
+
+def store(account, records):
+    """Insert or update mirrored leads; returns how many were written."""
+    rows = [mirror_row(account, record) for record in records if record.get('id')]
+    LeadMirror.objects.bulk_create(rows, update_conflicts=True, unique_fields=['account', 'lead_id'],
+                                   update_fields=['email', 'phone', 'data', 'modified_time', 'synced_at'])
+    return len(rows)
+
+
+def _since(cursor):
+    return (cursor - CURSOR_OVERLAP).isoformat(timespec='seconds') if cursor else None
+
+
+def _deleted_pages(account, since):
+    url = f"{account.api_domain}/crm/v2/Leads/deleted"
+    page = 1
+    while True:
+        headers = {'Authorization': f'Zoho-oauthtoken {get_valid_token(account)}', 'If-Modified-Since': since}
+        records, info = fetch_leads_page(account, url, headers, {'type': 'all', 'page': page, 'per_page': 200})
+        if records:
+            yield records
+        if not (records and info.get('more_records')):
+            return
+        page += 1
+
+
+def sync_account(account, full=False):
+    """
+    One incremental pass for an account: changed leads since the cursor, then deletions.
+    The cursor is saved after every page, so an interrupted pass resumes where it stopped.
+    Returns (leads copied, leads removed).
+    """
+    state, _ = LeadSyncState.objects.get_or_create(account=account)
+    started = timezone.now()
+    if full or (state.cursor is None and state.full_sync_started_at is None):
+        # A full copy, which may only finish in a later pass if this one is interrupted
+        state.cursor = state.deleted_cursor = None
+        state.full_sync_started_at = started
+        state.save(update_fields=['cursor', 'deleted_cursor', 'full_sync_started_at', 'updated_at'])
+    copied = removed = 0
+    try:
+        for records in iter_lead_pages(account, modified_since=_since(state.cursor)):
+            copied += store(account, records)
+            newest = max(filter(None, (_parse_time(r.get('Modified_Time')) for r in records)), default=None)
+            if newest and (state.cursor is None or newest > state.cursor):
+                state.cursor = newest
+                state.save(update_fields=['cursor', 'updated_at'])
+
+        if state.full_sync_started_at:
+            # Anything the full copy didn't touch is gone from Zoho; after it only deletions matter
+            removed += LeadMirror.objects.filter(account=account,
+                                                 synced_at__lt=state.full_sync_started_at).delete()[0]
+            state.deleted_cursor = state.full_sync_started_at
+            state.full_sync_started_at = None
+        else:
+            for records in _deleted_pages(account, _since(state.deleted_cursor or state.last_synced_at)):
+                ids = [str(r['id']) for r in records if r.get('id')]
+                removed += LeadMirror.objects.filter(account=account, lead_id__in=ids).delete()[0]
+                newest = max(filter(None, (_parse_time(r.get('deleted_time')) for r in records)), default=None)
+                if newest and (state.deleted_cursor is None or newest > state.deleted_cursor):
+                    state.deleted_cursor = newest
+    except Exception as e:
+        state.error = str(e)
+        state.save(update_fields=['error', 'deleted_cursor', 'updated_at'])
+        raise
+
+    if state.cursor is None:
+        # Nothing in Zoho yet; the next pass still only needs what changed from now on
+        state.cursor = started
+    state.last_synced_at = started
+    state.error = ''
+    state.save()
+    logger.info("Lead mirror for account %s: %s copied, %s removed", account.pk, copied, removed)
+    return copied, removed
+
+
+def sync_accounts(accounts=None, full=False):
+    """sync_account for every mirror-enabled account; one account failing doesn't stop the rest."""
+    if accounts is None:
+        accounts = ZohoAccount.objects.filter(lead_mirror_enabled=True, is_active=True)
+    results = {}
+    for account in accounts:
+        try:
+            results[account.pk] = sync_account(account, full)
+        except Exception as e:
+            logger.warning("Lead sync failed for account %s: %s", account.pk, e)
+            results[account.pk] = e
+    return results
+
+
+def mirror_age(account):
+    """Seconds since the mirror was last complete, or None if it never was."""
+    last_synced_at = (LeadSyncState.objects.filter(account=account)
+                      .values_list('last_synced_at', flat=True).first())
+    if last_synced_at is None:
+        return None
+    return (timezone.now() - last_synced_at).total_seconds()
+
+
+def find_mirrored_lead(account, lead_id=None, email=None, phone=None):
+    """Same order as a Zoho lookup: by id, then by Email or Phone."""
+    leads = LeadMirror.objects.filter(account=account)
+    row = None
+    if lead_id:
+        row = leads.filter(lead_id=str(lead_id)).first()
+    if row is None and (email or phone):
+        matches = leads.none()
+        if normalize_email(email):
+            matches |= leads.filter(email=normalize_email(email))
+        if search_phone(phone):
+            matches |= leads.filter(phone=search_phone(phone))
+        row = matches.order_by('-modified_time').first()
+    return row.data if row else None
+
+
+def lookup_mirrored_lead(account, lead_id=None, email=None, phone=None, max_age=None):
+    """
+    (True, lead or None) when the mirror can answer, (False, None) when it's off or staler
+    than max_age seconds (default ZOHO_LEAD_MIRROR_MAX_AGE) and Zoho has to be asked.
+    """
+    if not account.lead_mirror_enabled:
+        return False, None
+    age = mirror_age(account)
+    if age is None or age > (MAX_AGE if max_age is None else max_age):
+        return False, None
+    return True, find_mirrored_lead(account, lead_id, email, phone)
+
+
+def mirror_upserted(account, records, lead_ids):
+    """Write leads just upserted through the proxy into the mirror, merged over what it had."""
+    if not account.lead_mirror_enabled:
+        return
+    pairs = [(record, str(lead_id)) for record, lead_id in zip(records, lead_ids) if lead_id]
+    if not pairs:
+        return
+    known = dict(LeadMirror.objects.filter(account=account, lead_id__in=[lead_id for _, lead_id in pairs])
+                 .values_list('lead_id', 'data'))
+    now = timezone.now().isoformat(timespec='seconds')
+    store(account, [{**known.get(lead_id, {}), **record, 'id': lead_id, 'Modified_Time': now}
+                    for record, lead_id in pairs])
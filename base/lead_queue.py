@@ -0,0 +1,123 @@
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import breaker, fingerprints
+from .crm import dedupe_key_for, ensure_fields_exist, upsert_leads
+from .lead_mirror import mirror_upserted
+from .models import LeadJob, ZohoAccount
+
+# Delay (seconds) before a retryable failure is attempted again, doubling with each attempt
+RETRY_BACKOFF = getattr(settings, 'ZOHO_LEAD_QUEUE_RETRY_BACKOFF', 5)
+RETRY_BACKOFF_MAX = getattr(settings, 'ZOHO_LEAD_QUEUE_RETRY_BACKOFF_MAX', 300)
+
+
+def enqueue_lead(account, payload):
+    payload = {k: v for k, v in payload.items() if k != 'tenant_id'}
+    # The worker will change this lead; until then a repeat of its old payload must be sent
+    fingerprints.forget(account, [payload])
+    return LeadJob.objects.create(account=account, payload=payload, dedupe_key=dedupe_key_for(payload))
+
+
+def requeue_stale_jobs(stale_after):
+    """Hand back jobs claimed by a worker that died before finishing them."""
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return LeadJob.objects.filter(status=LeadJob.STATUS_PROCESSING, updated_at__lt=cutoff).update(
+        status=LeadJob.STATUS_QUEUED, claim_id=None, updated_at=timezone.now()
+    )
+
+
+def retry_delay(attempts):
+    """Seconds to wait after the `attempts`-th failed attempt."""
+    return min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** (attempts - 1))
+
+
+def due_jobs():
+    """Queued jobs that aren't waiting out a retry backoff."""
+    return LeadJob.objects.filter(status=LeadJob.STATUS_QUEUED).filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now())
+    )
+
+
+def claim_jobs(account, limit):
+    """Atomically claim up to `limit` queued jobs for an account, safe against concurrent workers."""
+    candidate_ids = list(
+        due_jobs().filter(account=account)
+        .order_by('created_at').values_list('pk', flat=True)[:limit]
+    )
+    if not candidate_ids:
+        return []
+    claim_id = uuid.uuid4()
+    LeadJob.objects.filter(pk__in=candidate_ids, status=LeadJob.STATUS_QUEUED).update(
+        status=LeadJob.STATUS_PROCESSING, claim_id=claim_id, updated_at=timezone.now()
+    )
+    return list(LeadJob.objects.filter(claim_id=claim_id).order_by('created_at'))
+
+
+def coalesce(jobs):
+    """
+    Merge jobs targeting the same Email/Phone into a single record, later values winning.
+    Returns a list of (merged_payload, [jobs]) in first-seen order.
+    """
+    groups = OrderedDict()
+    for job in jobs:
+        key = job.dedupe_key or f"job:{job.pk}"
+        if key not in groups:
+            groups[key] = ({}, [])
+        merged, members = groups[key]
+        merged.update(job.payload)
+        members.append(job)
+    return list(groups.values())
+
+
+def process_account(account, batch_size, max_attempts):
+    """Drain one batch for an account. Returns the number of jobs handled."""
+    jobs = claim_jobs(account, batch_size)
+    if not jobs:
+        return 0
+
+    groups = coalesce(jobs)
+    records = [merged for merged, _ in groups]
+
+    all_keys = set()
+    for record in records:
+        all_keys.update(record.keys())
+    ensure_fields_exist(account, 'Leads', all_keys)
+
+    results = upsert_leads(account, records)
+    mirror_upserted(account, records, [result['lead_id'] for result in results])
+    fingerprints.remember_results(account, records, results)
+    for (_, members), result in zip(groups, results):
+        for job in members:
+            job.attempts += 1
+            job.result = dict(result, coalesced=len(members))
+            job.claim_id = None
+            if result['status'] == 'success':
+                job.status = LeadJob.STATUS_DONE
+            elif result['retryable'] and job.attempts < max_attempts:
+                # No answer, throttled or a Zoho-side error: try again once the backoff has passed
+                job.status = LeadJob.STATUS_QUEUED
+                job.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+            else:
+                job.status = LeadJob.STATUS_FAILED
+            job.save(update_fields=['attempts', 'result', 'claim_id', 'status', 'next_attempt_at', 'updated_at'])
+    return len(jobs)
+
+
+def process_queue(batch_size=100, max_attempts=5):
+    """One pass over every account with queued work, a batch per tenant."""
+    account_ids = (
+        due_jobs()
+        .values_list('account_id', flat=True).distinct()
+    )
+    handled = 0
+    for account in ZohoAccount.objects.filter(pk__in=list(account_ids), is_active=True):
+        # Leave the jobs queued (without spending attempts) until the data center recovers
+        if breaker.is_open(account.api_domain):
+            continue
+        handled += process_account(account, batch_size, max_attempts)
+    return handled
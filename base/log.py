@@ -0,0 +1,135 @@
+"""
+Logging helpers wired up by settings.LOGGING: a queue handler so request threads never
+block on log I/O, redaction of tokens and lead PII, sampling of verbose Zoho bodies, and
+a structured (key=value or JSON) formatter.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+from logging.handlers import QueueHandler, QueueListener
+
+BODY_PREVIEW_LIMIT = 500
+
+# Attributes every LogRecord has; anything else was passed via `extra` and is logged as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_TOKEN_PATTERNS = [
+    (re.compile(r'(Zoho-oauthtoken\s+)\S+'), r'\1[REDACTED]'),
+    (re.compile(r'\b1000\.[0-9a-f]{32}\.[0-9a-f]{32}\b'), '[REDACTED]'),
+    (re.compile(r'''(['"]?(?:access_token|refresh_token|client_secret)['"]?\s*[:=]\s*['"]?)[^'",&\s}]+'''),
+     r'\1[REDACTED]'),
+    # The OAuth callback's ?code=
+    (re.compile(r'([?&]code=)[^&\s\'"]+'), r'\1[REDACTED]'),
+]
+# `code` is also Zoho's status field ("DUPLICATE_DATA", ...); only scrub it in a code exchange
+_GRANT_CODE_PATTERN = re.compile(r'''(['"]?code['"]?\s*[:=]\s*['"]?)[^'",&\s}]+''')
+# Field names of lead payloads; Bookings' generic `name` (services, staff) is left alone
+_PII_KEYS = r'(?:Email|email|Phone|phone|phone_number|Mobile|mobile|First_Name|Last_Name|Full_Name)'
+_PII_PATTERNS = [
+    (re.compile(r'''(['"]''' + _PII_KEYS + r'''['"]\s*:\s*)(['"])(?:(?!\2).)*\2'''), r'\1\2[PII]\2'),
+    (re.compile(r'(\((?:Phone|Mobile|Email):equals:)[^)]*'), r'\1[PII]'),
+    (re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+'), '[EMAIL]'),
+]
+
+
+def redact(text):
+    for pattern, replacement in _TOKEN_PATTERNS + _PII_PATTERNS:
+        text = pattern.sub(replacement, text)
+    if 'authorization_code' in text:
+        text = _GRANT_CODE_PATTERN.sub(r'\1[REDACTED]', text)
+    return text
+
+
+class RedactingFilter(logging.Filter):
+    """Scrub OAuth tokens, secrets and lead contact details from the rendered message."""
+
+    def filter(self, record):
+        # Renders the message once; later handlers reuse the scrubbed text
+        record.msg, record.args = redact(record.getMessage()), None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records logged with extra={'sampled': True} (bulky bodies)."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False):
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class StructuredFormatter(logging.Formatter):
+    """One line per record: `ts level logger message key=value...`, or a JSON object."""
+
+    def __init__(self, json_lines=False):
+        super().__init__()
+        self.json_lines = json_lines
+
+    def format(self, record):
+        fields = {key: value for key, value in vars(record).items()
+                  if key not in _RECORD_ATTRS and key != 'sampled'}
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            message = f"{message}\n{record.exc_text}"
+
+        if self.json_lines:
+            return json.dumps(dict(ts=self.formatTime(record), level=record.levelname, logger=record.name,
+                                   message=message, **fields), default=str)
+        extras = ''.join(f" {key}={value}" for key, value in fields.items())
+        return f"{self.formatTime(record)} {record.levelname} {record.name} {message}{extras}"
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Hands records to a background listener thread that does the formatting and writing, so
+    a slow stdout or disk never stalls a request.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.target = logging.StreamHandler(stream)
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def setFormatter(self, fmt):
+        # The listener formats; this handler only renders %-args before queueing
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class BodyPreview:
+    """Lazily rendered, truncated response body; only costs anything if the record is emitted."""
+
+    def __init__(self, resp, limit=BODY_PREVIEW_LIMIT):
+        self.resp = resp
+        self.limit = limit
+
+    def __str__(self):
+        return self.resp.text[:self.limit]
+
+
+class LazyJson:
+    def __init__(self, data, limit=BODY_PREVIEW_LIMIT):
+        self.data = data
+        self.limit = limit
+
+    def __str__(self):
+        return json.dumps(self.data)[:self.limit]
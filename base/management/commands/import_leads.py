@@ -0,0 +1,59 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base.accounts import resolve_account
+from base.bulk_import import (
+    FORMATS, BulkImportError, claim_next_import, detect_format, process_import, run_import,
+)
+
+
+class Command(BaseCommand):
+    help = ('Import a large CSV/NDJSON file of leads through the Zoho Bulk Write API, or, without a file, '
+            'run the imports uploaded to POST /api/leads/import/.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', help='CSV or NDJSON file of leads (one per row/line)')
+        parser.add_argument('--tenant', help='Tenant to import into (default: the primary account)')
+        parser.add_argument('--format', choices=FORMATS, help='Input format (default: from the file extension)')
+        parser.add_argument('--output', help='Where to write the per-row result CSV (default: stdout)')
+        parser.add_argument('--loop', action='store_true', help='Without a file: keep polling for uploads')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Idle poll interval with --loop')
+
+    def handle(self, *args, **options):
+        if options['file']:
+            self.import_file(options)
+            return
+        while True:
+            lead_import = claim_next_import()
+            if lead_import:
+                process_import(lead_import)
+                self.stdout.write(f"Import {lead_import.pk} {lead_import.status}: {lead_import.succeeded} "
+                                  f"succeeded, {lead_import.failed} failed")
+            elif not options['loop']:
+                break
+            else:
+                time.sleep(options['sleep'])
+
+    def import_file(self, options):
+        fmt = options['format'] or detect_format(options['file'])
+        if not fmt:
+            raise CommandError("Can't tell the file format; pass --format csv or --format ndjson")
+        account = resolve_account(options['tenant'])
+        if not account:
+            raise CommandError(f"Zoho account not found for tenant: {options['tenant'] or 'Primary'}")
+
+        def progress(succeeded, failed, job_id):
+            self.stderr.write(f"{succeeded} succeeded, {failed} failed (job {job_id or '-'})")
+
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            with open(options['file'], 'rb') as source:
+                succeeded, failed = run_import(account, source, fmt, output, progress)
+        except BulkImportError as e:
+            raise CommandError(str(e))
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(f"Imported into {account.account_name}: {succeeded} succeeded, {failed} failed")
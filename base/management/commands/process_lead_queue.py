@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.lead_queue import process_queue, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Drain the async lead queue into Zoho, coalescing updates for the same Email/Phone.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Jobs claimed per tenant per pass')
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Attempts per job when Zoho is unreachable, throttles or answers 5xx')
+        parser.add_argument('--stale-after', type=int, default=300,
+                            help='Requeue jobs stuck in processing for this many seconds')
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when idle')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Idle poll interval with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            requeue_stale_jobs(options['stale_after'])
+            handled = process_queue(options['batch_size'], options['max_attempts'])
+            if handled:
+                self.stdout.write(f"Processed {handled} queued leads")
+            elif not options['loop']:
+                break
+            else:
+                time.sleep(options['sleep'])
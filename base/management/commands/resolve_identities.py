@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.identity import resolve_pending_identities
+
+
+class Command(BaseCommand):
+    help = 'Look up display names for connected Zoho accounts that still show the generic name.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running instead of exiting after one pass')
+        parser.add_argument('--sleep', type=float, default=300.0, help='Seconds between passes with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            resolved, pending = resolve_pending_identities()
+            if resolved or pending:
+                self.stdout.write(f"Resolved {resolved} account identities, {pending} still pending")
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
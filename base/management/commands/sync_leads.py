@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base.lead_mirror import sync_accounts
+from base.models import ZohoAccount
+
+
+class Command(BaseCommand):
+    help = 'Bring the local lead mirror of accounts with lead_mirror_enabled up to date with Zoho.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenant', help='Only sync this tenant (it must have lead_mirror_enabled)')
+        parser.add_argument('--full', action='store_true', help='Copy every lead again instead of only changes')
+        parser.add_argument('--loop', action='store_true', help='Keep running instead of exiting after one pass')
+        parser.add_argument('--sleep', type=float, default=60.0, help='Seconds between passes with --loop')
+
+    def handle(self, *args, **options):
+        accounts = None
+        if options['tenant']:
+            accounts = list(ZohoAccount.objects.filter(tenant_id=options['tenant'], lead_mirror_enabled=True))
+            if not accounts:
+                raise CommandError(f"No mirror-enabled account for tenant: {options['tenant']}")
+
+        full = options['full']
+        while True:
+            for pk, result in sync_accounts(accounts, full=full).items():
+                if isinstance(result, Exception):
+                    self.stderr.write(f"Account {pk}: sync failed: {result}")
+                else:
+                    self.stdout.write(f"Account {pk}: {result[0]} leads copied, {result[1]} removed")
+            if not options['loop']:
+                break
+            full = False
+            time.sleep(options['sleep'])
@@ -0,0 +1,221 @@
+"""
+In-process metrics aggregation: counters and fixed-bucket histograms keyed by label values,
+plus gauges read from their source at scrape time. Updating one is a dict lookup and a few
+additions under a lock, cheap enough for every request and every Zoho call, and safe to
+share between the threads of a WSGI worker. render() produces the Prometheus text format.
+"""
+import bisect
+import threading
+
+from django.db import models
+
+from . import background, breaker, ratelimit
+from .cache import account_cache, bookings_meta_cache, field_cache, field_failure_cache, lead_cache, slot_cache
+from .models import LeadJob
+
+# Upper bounds in seconds; observations above the last one land in the implicit +Inf bucket
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, labels, (), value) for labels, value in values.items()]
+
+
+class Gauge:
+    """
+    A value read when metrics are scraped. `collect` returns {label values: value}; nothing is
+    updated on the request path.
+    """
+
+    def __init__(self, name, documentation, labels, collect, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.kind = kind
+        self._collect = collect
+        REGISTRY.append(self)
+
+    def samples(self):
+        return [(self.name, labels, (), value) for labels, value in self._collect().items()]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (+Inf last)..., sum, count, max]
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0, 0.0]
+            series[index] += 1
+            series[-3] += value
+            series[-2] += 1
+            if value > series[-1]:
+                series[-1] = value
+
+    def snapshot(self):
+        """{label values: (per-bucket counts, sum, count, max)}, copied under the lock."""
+        with self._lock:
+            return {labels: (series[:-3], *series[-3:]) for labels, series in self._series.items()}
+
+    def quantile(self, counts, q, largest):
+        """Estimate the q-quantile from per-bucket counts, interpolating inside the bucket."""
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return largest
+                lower = self.buckets[index - 1] if index else 0.0
+                return min(largest, lower + (self.buckets[index] - lower) * (rank - seen) / count)
+            seen += count
+        return largest
+
+    def samples(self):
+        samples = []
+        for labels, (counts, total, count, largest) in self.snapshot().items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', labels, (('le', _format_value(bound)),), cumulative))
+            samples.append((f'{self.name}_sum', labels, (), total))
+            samples.append((f'{self.name}_count', labels, (), count))
+        return samples
+
+    def summary(self):
+        """{label values: {'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'}}."""
+        result = {}
+        for labels, (counts, total, count, largest) in self.snapshot().items():
+            result[labels] = {
+                'count': count,
+                'mean_ms': round(total / count * 1000, 2) if count else None,
+                **{f'p{int(q * 100)}_ms': round(self.quantile(counts, q, largest) * 1000, 2)
+                   for q in (0.5, 0.95, 0.99)},
+                'max_ms': round(largest * 1000, 2),
+            }
+        return result
+
+
+request_duration = Histogram('zoho_proxy_request_duration_seconds',
+                             'Time spent serving a request, by endpoint.', ['endpoint'])
+phase_duration = Histogram('zoho_proxy_request_phase_duration_seconds',
+                           'Time spent in each phase of a request (token, fields, upsert...), by endpoint.',
+                           ['endpoint', 'phase'])
+upstream_duration = Histogram('zoho_proxy_upstream_duration_seconds',
+                              'Duration of Zoho API calls, by api_domain.', ['api_domain'])
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, extra, value in metric.samples():
+            lines.append(f'{name}{_format_labels(metric.labels, labels, extra)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+requests_total = Counter('zoho_proxy_requests_total', 'Requests served, by endpoint, method and status.',
+                         ['endpoint', 'method', 'status'])
+upstream_requests_total = Counter('zoho_proxy_upstream_requests_total',
+                                  'Zoho API calls, by endpoint path, account and status ("error" if no response).',
+                                  ['zoho_endpoint', 'account', 'status'])
+token_refreshes_total = Counter('zoho_proxy_token_refreshes_total', 'OAuth access token refreshes, by result.',
+                                ['result'])
+
+CACHES = {
+    'field': field_cache,
+    'field_failure': field_failure_cache,
+    'slot': slot_cache,
+    'account': account_cache,
+    'bookings_meta': bookings_meta_cache,
+    'lead': lead_cache,
+}
+
+Gauge('zoho_proxy_cache_hits_total', 'In-process cache hits, by cache.', ['cache'],
+      lambda: {(name,): cache.hits for name, cache in CACHES.items()}, kind='counter')
+Gauge('zoho_proxy_cache_misses_total', 'In-process cache misses (including expired entries), by cache.', ['cache'],
+      lambda: {(name,): cache.misses for name, cache in CACHES.items()}, kind='counter')
+Gauge('zoho_proxy_cache_entries', 'Entries held by each in-process cache.', ['cache'],
+      lambda: {(name,): len(cache) for name, cache in CACHES.items()})
+
+
+def _lead_queue_depth():
+    depth = {(LeadJob.STATUS_QUEUED,): 0, (LeadJob.STATUS_PROCESSING,): 0}
+    rows = (LeadJob.objects.filter(status__in=[LeadJob.STATUS_QUEUED, LeadJob.STATUS_PROCESSING])
+            .values_list('status').annotate(count=models.Count('pk')))
+    for status, count in rows:
+        depth[(status,)] = count
+    return depth
+
+
+Gauge('zoho_proxy_lead_queue_depth', 'Leads waiting for or being processed by process_lead_queue.', ['status'],
+      _lead_queue_depth)
+Gauge('zoho_proxy_background_queue_depth', 'Tasks waiting for the background pool (token persistence, refreshes).',
+      [], lambda: {(): background.pending()})
+Gauge('zoho_proxy_ratelimit_bucket_level', 'Rate-limit credits left per account (negative: calls waiting).',
+      ['account'], lambda: {(str(pk),): level['level'] for pk, level in ratelimit.bucket_levels().items()})
+Gauge('zoho_proxy_ratelimit_paused_seconds', 'Seconds left of a back-off Zoho asked for, per account.',
+      ['account'], lambda: {(str(pk),): level['paused_for'] for pk, level in ratelimit.bucket_levels().items()})
+
+_BREAKER_STATES = {breaker.CLOSED: 0, breaker.HALF_OPEN: 1, breaker.OPEN: 2}
+
+Gauge('zoho_proxy_circuit_state', 'Circuit breaker per Zoho origin: 0 closed, 1 half-open, 2 open.', ['origin'],
+      lambda: {(origin,): _BREAKER_STATES[state['state']] for origin, state in breaker.states().items()})
+Gauge('zoho_proxy_circuit_trips_total', 'Times each Zoho origin\'s circuit opened.', ['origin'],
+      lambda: {(origin,): state['trips'] for origin, state in breaker.states().items()}, kind='counter')
+Gauge('zoho_proxy_circuit_rejected_total', 'Zoho calls refused because the circuit was open.', ['origin'],
+      lambda: {(origin,): state['rejected'] for origin, state in breaker.states().items()}, kind='counter')
@@ -0,0 +1,54 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics, timing
+
+logger = logging.getLogger('base.timing')
+
+# Expose phase timings to clients; turn off if they shouldn't see how long Zoho took
+SERVER_TIMING_HEADER = getattr(settings, 'ZOHO_SERVER_TIMING', True)
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.url_name or match.view_name) if match else 'unmatched'
+
+
+def _finish(request, response, token):
+    timings = timing.finish(token)
+    total = timings.elapsed()
+    endpoint = endpoint_name(request)
+
+    metrics.requests_total.inc(endpoint, request.method, str(response.status_code))
+    metrics.request_duration.observe(total, endpoint)
+    for name, (seconds, count) in timings.phases.items():
+        metrics.phase_duration.observe(seconds, endpoint, name)
+
+    if SERVER_TIMING_HEADER:
+        response['Server-Timing'] = timings.server_timing(total)
+    logger.info("%s %s", request.method, request.path, extra={
+        'endpoint': endpoint,
+        'status': response.status_code,
+        'duration_ms': round(total * 1000, 1),
+        **{f'{name}_ms': round(seconds * 1000, 1) for name, (seconds, count) in timings.phases.items()},
+    })
+    return response
+
+
+@sync_and_async_middleware
+def timing_middleware(get_response):
+    """Times each request's phases; adds a Server-Timing header, a log line and histogram samples."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = timing.start()
+            response = await get_response(request)
+            return _finish(request, response, token)
+    else:
+        def middleware(request):
+            token = timing.start()
+            response = get_response(request)
+            return _finish(request, response, token)
+    return middleware
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:35
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_zohoaccount_timezone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('payload', models.JSONField()),
+                ('dedupe_key', models.CharField(blank=True, default='', max_length=255)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('claim_id', models.UUIDField(blank=True, db_index=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lead_jobs', to='base.zohoaccount')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='base_leadjo_status_6074a7_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0008_leadimport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='zohoaccount',
+            name='lead_mirror_enabled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='LeadSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cursor', models.DateTimeField(blank=True, null=True)),
+                ('deleted_cursor', models.DateTimeField(blank=True, null=True)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='lead_sync', to='base.zohoaccount')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LeadMirror',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lead_id', models.CharField(max_length=50)),
+                ('email', models.CharField(blank=True, default='', max_length=255)),
+                ('phone', models.CharField(blank=True, default='', max_length=50)),
+                ('data', models.JSONField()),
+                ('modified_time', models.DateTimeField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mirrored_leads', to='base.zohoaccount')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['account', 'email'], name='base_leadmi_account_cbf3f5_idx'), models.Index(fields=['account', 'phone'], name='base_leadmi_account_42460d_idx')],
+                'constraints': [models.UniqueConstraint(fields=('account', 'lead_id'), name='unique_mirrored_lead')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0009_lead_mirror'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('lead_id', models.CharField(max_length=50)),
+                ('action', models.CharField(blank=True, default='', max_length=20)),
+                ('payload_hash', models.CharField(max_length=64)),
+                ('field_hashes', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lead_fingerprints', to='base.zohoaccount')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('account', 'key'), name='unique_lead_fingerprint')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+def store_phones_as_given(apps, schema_editor):
+    # Mirrored phones were digits only; lookups now match them like Zoho does, as given
+    LeadMirror = apps.get_model('base', 'LeadMirror')
+    for row in LeadMirror.objects.only('pk', 'data').iterator():
+        phone = str(row.data.get('Phone') or '').strip()[:50]
+        LeadMirror.objects.filter(pk=row.pk).update(phone=phone)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_leadfingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leadsyncstate',
+            name='full_sync_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(store_phones_as_given, migrations.RunPython.noop),
+    ]
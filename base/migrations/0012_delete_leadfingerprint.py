@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:43
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0011_lead_mirror_full_sync'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='LeadFingerprint',
+        ),
+    ]
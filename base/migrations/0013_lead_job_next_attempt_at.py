@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_delete_leadfingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leadjob',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
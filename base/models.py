@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 class ZohoAccount(models.Model):
@@ -13,14 +15,151 @@ class ZohoAccount(models.Model):
     expiry_time = models.DateTimeField()
     is_active = models.BooleanField(default=True)
     is_primary = models.BooleanField(default=False)
+    # Keep a local copy of the account's Leads (sync_leads) and answer lookups from it
+    lead_mirror_enabled = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
-        if self.is_primary:
+        update_fields = kwargs.get('update_fields')
+        if self.is_primary and (update_fields is None or 'is_primary' in update_fields):
             # Set all other accounts to not primary
             ZohoAccount.objects.filter(is_primary=True).exclude(pk=self.pk).update(is_primary=False)
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.account_name
+
+class LeadJob(models.Model):
+    """A lead accepted in async mode, waiting for the process_lead_queue worker."""
+    STATUS_QUEUED = 'queued'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    account = models.ForeignKey(ZohoAccount, on_delete=models.CASCADE, related_name='lead_jobs')
+    payload = models.JSONField()
+    # Normalized Email/Phone; jobs sharing a key are merged into one upsert
+    dedupe_key = models.CharField(max_length=255, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    claim_id = models.UUIDField(null=True, blank=True, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # Set when a retryable failure is requeued; the job isn't claimed again before then
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
+
+class LeadMirror(models.Model):
+    """A lead as last seen in Zoho, kept by sync_leads for accounts with lead_mirror_enabled."""
+    account = models.ForeignKey(ZohoAccount, on_delete=models.CASCADE, related_name='mirrored_leads')
+    lead_id = models.CharField(max_length=50)
+    # Matched like Zoho's lead search: lower-cased Email, Phone as given (trimmed)
+    email = models.CharField(max_length=255, blank=True, default='')
+    phone = models.CharField(max_length=50, blank=True, default='')
+    data = models.JSONField()
+    modified_time = models.DateTimeField(null=True, blank=True)
+    synced_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['account', 'lead_id'], name='unique_mirrored_lead')]
+        indexes = [
+            models.Index(fields=['account', 'email']),
+            models.Index(fields=['account', 'phone']),
+        ]
+
+    def __str__(self):
+        return f"{self.account_id}:{self.lead_id}"
+
+class LeadSyncState(models.Model):
+    """Where an account's incremental lead sync got to."""
+    account = models.OneToOneField(ZohoAccount, on_delete=models.CASCADE, related_name='lead_sync')
+    # Modified_Time of the newest lead copied so far; the next pass asks for changes since then
+    cursor = models.DateTimeField(null=True, blank=True)
+    deleted_cursor = models.DateTimeField(null=True, blank=True)
+    # Start of the last pass that finished; the mirror is complete as of this time
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    # Start of a full copy that hasn't finished yet (it may take several passes); once it does,
+    # rows it didn't touch are leads deleted from Zoho
+    full_sync_started_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.account_id} @ {self.cursor}"
+
+class LeadImport(models.Model):
+    """A file uploaded to POST /api/leads/import/, imported through Zoho's Bulk Write API."""
+    STATUS_QUEUED = 'queued'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    FORMAT_CHOICES = [('csv', 'CSV'), ('ndjson', 'NDJSON')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    account = models.ForeignKey(ZohoAccount, on_delete=models.CASCADE, related_name='lead_imports')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    source_path = models.CharField(max_length=500)
+    # One line per input row: row, status, record_id, errors
+    result_path = models.CharField(max_length=500, blank=True, default='')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    succeeded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    zoho_job_ids = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
+
+class IdempotencyKey(models.Model):
+    """The stored outcome of a POST sent with an Idempotency-Key header, replayed to retries."""
+    STATUS_IN_PROGRESS = 'in_progress'
+    STATUS_DONE = 'done'
+    STATUS_CHOICES = [
+        (STATUS_IN_PROGRESS, 'In progress'),
+        (STATUS_DONE, 'Done'),
+    ]
+
+    # The endpoint the key was used on; the same key on another endpoint is a different request
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    # sha256 of the request, so a key reused for a different payload is refused
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_IN_PROGRESS)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True, default='')
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_key')]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key} ({self.status})"
@@ -0,0 +1,155 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+
+# Credits per second each account may spend, and how many it may burst above that
+RATE = getattr(settings, 'ZOHO_RATE_LIMIT_RATE', 10)
+BURST = getattr(settings, 'ZOHO_RATE_LIMIT_BURST', 20)
+# A call waits this long at most for its turn; beyond that it fails fast instead of piling up
+MAX_WAIT = getattr(settings, 'ZOHO_RATE_LIMIT_MAX_WAIT', 5.0)
+# How often a 429 answer is retried (after the wait Zoho asked for) before it's returned
+RETRIES_ON_429 = getattr(settings, 'ZOHO_RATE_LIMIT_RETRIES', 2)
+
+
+class RateLimitExceeded(requests.RequestException):
+    """The account's budget is exhausted for longer than MAX_WAIT."""
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Callers reserve a credit and sleep for the returned delay, so
+    a burst is spread out at `rate` instead of being sent at once.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, cost=1):
+        """Take `cost` credits, on loan if need be; returns the seconds to wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= cost
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def release(self, cost=1):
+        """Give back credits reserved for a call that isn't going to be made."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + cost)
+
+    def pause(self, seconds):
+        """Zoho told us to back off: hold every call for `seconds` and drop the burst allowance."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+    def drain(self):
+        """Zoho reports no credits left: spend the local burst allowance too."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 0.0)
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                'level': round(self._tokens, 2),
+                'capacity': self.capacity,
+                'rate': self.rate,
+                'paused_for': round(max(0.0, self._paused_until - now), 2),
+            }
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket_for(account):
+    bucket = _buckets.get(account.pk)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(account.pk)
+            if bucket is None:
+                bucket = _buckets[account.pk] = TokenBucket(RATE, BURST)
+    return bucket
+
+
+def reserve(account):
+    """Seconds the caller should wait before calling Zoho for this account."""
+    bucket = bucket_for(account)
+    wait = bucket.reserve()
+    if wait > MAX_WAIT:
+        bucket.release()
+        raise RateLimitExceeded(f"Zoho API budget for account {account.pk} exhausted; retry in {wait:.1f}s")
+    return wait
+
+
+def _retry_after_seconds(value):
+    """Retry-After is either a number of seconds or an HTTP date."""
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _reset_seconds(value):
+    """X-RATELIMIT-RESET: an epoch timestamp (s or ms) or a delay in seconds."""
+    try:
+        reset = float(value)
+    except ValueError:
+        return None
+    if reset > 1e12:
+        reset /= 1000.0
+    if reset > 1e9:
+        return max(0.0, reset - time.time())
+    return reset
+
+
+def observe(account, status_code, headers):
+    """
+    Feed a Zoho response back into the account's bucket. Returns the seconds Zoho asked us to
+    back off for (0 when it didn't).
+    """
+    bucket = bucket_for(account)
+    delay = None
+    if headers.get('Retry-After'):
+        delay = _retry_after_seconds(headers['Retry-After'])
+
+    remaining = headers.get('X-RATELIMIT-REMAINING')
+    if remaining is not None and remaining.strip() in ('0', '0.0'):
+        bucket.drain()
+        if delay is None and headers.get('X-RATELIMIT-RESET'):
+            delay = _reset_seconds(headers['X-RATELIMIT-RESET'])
+
+    if status_code == 429 and delay is None:
+        delay = 1.0
+    if delay:
+        bucket.pause(delay)
+    return delay or 0.0
+
+
+def bucket_levels():
+    """{account pk: bucket snapshot} for every account that has called Zoho in this process."""
+    with _buckets_lock:
+        buckets = dict(_buckets)
+    return {pk: bucket.snapshot() for pk, bucket in buckets.items()}
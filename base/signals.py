@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .accounts import invalidate_accounts
+from .models import ZohoAccount
+from .token_store import token_store
+from .tokens import TOKEN_FIELDS
+
+
+@receiver(post_save, sender=ZohoAccount)
+@receiver(post_delete, sender=ZohoAccount)
+def account_changed(sender, instance, update_fields=None, **kwargs):
+    # Token refreshes are served from the token store; cached accounts stay valid
+    if update_fields and set(update_fields) <= set(TOKEN_FIELDS):
+        return
+    if kwargs.get('signal') is post_delete:
+        token_store.delete(instance.pk)
+    # Saving one account can change another's is_primary, so drop them all
+    invalidate_accounts()
@@ -1,3 +1,553 @@
-from django.test import TestCase
+import json
+import tempfile
+import time
+from datetime import timedelta
+from email.utils import formatdate
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.core.cache import caches
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from . import bookings, breaker, bulk_import, fingerprints, idempotency, lead_mirror, lead_queue, ratelimit
+from .cache import account_cache, bookings_meta_cache
+from .models import IdempotencyKey, LeadImport, LeadJob, LeadMirror, LeadSyncState, ZohoAccount
+
+
+class FakeClock:
+    """Stands in for the time module in code that only reads time.monotonic() and time.time()."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return 1_700_000_000 + self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def create_account(**kwargs):
+    # Accounts are cached per tenant; a cached one from an earlier test would be rolled back
+    account_cache.clear()
+    fields = {
+        'account_name': 'Test', 'tenant_id': 't1', 'access_token': 'token', 'refresh_token': 'refresh',
+        'api_domain': 'https://www.zohoapis.com', 'expiry_time': timezone.now() + timedelta(hours=1),
+        'is_primary': True,
+    }
+    fields.update(kwargs)
+    return ZohoAccount.objects.create(**fields)
+
+
+@mock.patch.multiple(breaker, WINDOW=30, MIN_CALLS=4, ERROR_RATE=0.5, SLOW_CALL=5.0, SLOW_RATE=0.5,
+                     OPEN_SECONDS=30, HALF_OPEN_PROBES=1)
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(breaker, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.circuit = breaker.CircuitBreaker('https://www.zohoapis.com')
+
+    def call(self, failed=False, seconds=0.1):
+        probe = self.circuit.admit()
+        self.circuit.record(failed, seconds, probe)
+        return probe
+
+    def trip(self):
+        for _ in range(4):
+            self.call(failed=True)
+
+    def test_stays_closed_below_min_calls(self):
+        for _ in range(3):
+            self.call(failed=True)
+        self.assertEqual(self.circuit.state, breaker.CLOSED)
+
+    def test_opens_at_error_rate_and_fails_fast(self):
+        self.call()
+        self.call()
+        self.call(failed=True)
+        self.assertEqual(self.circuit.state, breaker.CLOSED)
+        self.call(failed=True)
+        self.assertEqual(self.circuit.state, breaker.OPEN)
+        with self.assertRaises(breaker.CircuitOpen) as raised:
+            self.circuit.admit()
+        self.assertEqual(raised.exception.retry_after, 30)
+        with self.assertRaises(breaker.CircuitOpen):
+            self.circuit.check()
+        self.assertEqual(self.circuit.trips, 1)
+        self.assertEqual(self.circuit.rejected, 2)
+
+    def test_slow_calls_trip_the_circuit(self):
+        self.call(seconds=0.1)
+        self.call(seconds=0.1)
+        self.call(seconds=6.0)
+        self.call(seconds=5.0)
+        self.assertEqual(self.circuit.state, breaker.OPEN)
+
+    def test_outcomes_older_than_the_window_are_forgotten(self):
+        self.call(failed=True)
+        self.call(failed=True)
+        self.call(failed=True)
+        self.clock.advance(31)
+        self.call()
+        self.assertEqual(self.circuit.state, breaker.CLOSED)
+        self.assertEqual(self.circuit.snapshot()['calls'], 1)
+
+    def test_half_open_probe_success_closes(self):
+        self.trip()
+        self.clock.advance(30)
+        self.assertEqual(self.circuit.snapshot()['state'], breaker.HALF_OPEN)
+        self.assertTrue(self.circuit.admit())
+        self.assertEqual(self.circuit.state, breaker.HALF_OPEN)
+        # Only HALF_OPEN_PROBES calls are let through while the probe is out
+        with self.assertRaises(breaker.CircuitOpen):
+            self.circuit.admit()
+        self.circuit.record(False, 0.1, probe=True)
+        self.assertEqual(self.circuit.state, breaker.CLOSED)
+        self.assertFalse(self.circuit.admit())
+
+    def test_half_open_probe_failure_reopens(self):
+        self.trip()
+        self.clock.advance(30)
+        self.call(failed=True)
+        self.assertEqual(self.circuit.state, breaker.OPEN)
+        self.assertEqual(self.circuit.trips, 2)
+        with self.assertRaises(breaker.CircuitOpen):
+            self.circuit.admit()
+
+    def test_slow_probe_reopens(self):
+        self.trip()
+        self.clock.advance(30)
+        self.call(seconds=5.0)
+        self.assertEqual(self.circuit.state, breaker.OPEN)
+
+    def test_calls_admitted_before_opening_are_not_counted(self):
+        self.trip()
+        self.circuit.record(False, 0.1)
+        self.clock.advance(30)
+        self.call()
+        self.assertEqual(self.circuit.state, breaker.CLOSED)
+        self.assertEqual(self.circuit.snapshot()['calls'], 0)
+
+
+class CircuitOpenLeadTests(TestCase):
+    def setUp(self):
+        self.account = create_account()
+        patcher = mock.patch.dict(breaker._breakers, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post_lead(self, email):
+        return self.client.post('/api/leads/', json.dumps({'Email': email, 'Last_Name': 'Test'}),
+                                content_type='application/json')
+
+    def assertQueued(self, response, email):
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        self.assertEqual(body['reason'], 'circuit_open')
+        job = LeadJob.objects.get(pk=body['job_id'])
+        self.assertEqual(job.status, LeadJob.STATUS_QUEUED)
+        self.assertEqual(job.payload['Email'], email)
+
+    @mock.patch('base.views.upstream.post')
+    @mock.patch('base.views.ensure_fields_exist')
+    def test_open_circuit_queues_lead_without_calling_zoho(self, ensure_fields_exist, post):
+        circuit = breaker.breaker_for(self.account.api_domain)
+        circuit.state, circuit.opened_at = breaker.OPEN, time.monotonic()
+        response = self.post_lead('open@example.com')
+        self.assertQueued(response, 'open@example.com')
+        ensure_fields_exist.assert_not_called()
+        post.assert_not_called()
+
+    @mock.patch('base.views.ensure_fields_exist')
+    def test_circuit_opening_mid_request_queues_lead(self, ensure_fields_exist):
+        error = breaker.CircuitOpen(self.account.api_domain, 30)
+        with mock.patch('base.views.upstream.post', side_effect=error):
+            response = self.post_lead('tripped@example.com')
+        self.assertQueued(response, 'tripped@example.com')
+
+
+@mock.patch.multiple(ratelimit, RATE=10, BURST=5, MAX_WAIT=1.0)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        for patcher in (mock.patch.object(ratelimit, 'time', self.clock),
+                        mock.patch.dict(ratelimit._buckets, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.account = SimpleNamespace(pk=1)
+
+    def test_bucket_spends_burst_then_paces_at_rate(self):
+        bucket = ratelimit.TokenBucket(rate=10, capacity=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1)
+        self.assertAlmostEqual(bucket.reserve(), 0.2)
+
+    def test_bucket_refills_up_to_capacity(self):
+        bucket = ratelimit.TokenBucket(rate=10, capacity=2)
+        bucket.reserve()
+        bucket.reserve()
+        self.clock.advance(0.1)
+        self.assertAlmostEqual(bucket.snapshot()['level'], 1)
+        self.clock.advance(60)
+        self.assertEqual(bucket.snapshot()['level'], 2)
+
+    def test_release_returns_a_credit(self):
+        bucket = ratelimit.TokenBucket(rate=10, capacity=1)
+        bucket.reserve()
+        bucket.release()
+        self.assertEqual(bucket.reserve(), 0)
+
+    def test_reserve_fails_fast_beyond_max_wait(self):
+        # 5 burst credits, then 0.1s per call: the 15th call would wait 1.0s, the 16th 1.1s
+        waits = [ratelimit.reserve(self.account) for _ in range(15)]
+        self.assertAlmostEqual(waits[-1], 1.0)
+        with self.assertRaises(ratelimit.RateLimitExceeded):
+            ratelimit.reserve(self.account)
+        # The refused call gave its credit back
+        self.assertAlmostEqual(ratelimit.bucket_for(self.account).snapshot()['level'], -10)
+
+    def test_429_with_retry_after_pauses_the_account(self):
+        self.assertEqual(ratelimit.observe(self.account, 429, {'Retry-After': '3'}), 3.0)
+        snapshot = ratelimit.bucket_for(self.account).snapshot()
+        self.assertEqual(snapshot['paused_for'], 3.0)
+        self.assertLessEqual(snapshot['level'], 0)
+        with self.assertRaises(ratelimit.RateLimitExceeded):
+            ratelimit.reserve(self.account)
+        self.clock.advance(2.5)
+        self.assertAlmostEqual(ratelimit.reserve(self.account), 0.5)
+
+    def test_retry_after_as_http_date(self):
+        retry_at = self.clock.time() + 2
+        header = formatdate(retry_at, usegmt=True)
+        self.assertAlmostEqual(ratelimit.observe(self.account, 429, {'Retry-After': header}), 2.0, delta=1.0)
+
+    def test_429_without_retry_after_backs_off_one_second(self):
+        self.assertEqual(ratelimit.observe(self.account, 429, {}), 1.0)
+        self.assertEqual(ratelimit.bucket_for(self.account).snapshot()['paused_for'], 1.0)
+
+    def test_exhausted_budget_waits_for_reset(self):
+        headers = {'X-RATELIMIT-REMAINING': '0', 'X-RATELIMIT-RESET': str(int(self.clock.time()) + 4)}
+        self.assertAlmostEqual(ratelimit.observe(self.account, 200, headers), 4.0, delta=1.0)
+        self.assertLessEqual(ratelimit.bucket_for(self.account).snapshot()['level'], 0)
+
+    def test_ok_response_changes_nothing(self):
+        self.assertEqual(ratelimit.observe(self.account, 200, {'X-RATELIMIT-REMAINING': '42'}), 0.0)
+        self.assertEqual(ratelimit.bucket_for(self.account).snapshot()['level'], 5)
+
+
+class IdempotencyTests(TestCase):
+    url = '/api/leads/?async=true'
+
+    def setUp(self):
+        self.account = create_account()
+
+    def post_lead(self, key, email='idem@example.com'):
+        return self.client.post(self.url, json.dumps({'Email': email, 'Last_Name': 'Test'}),
+                                content_type='application/json', headers={'Idempotency-Key': key})
+
+    def test_first_request_runs_and_repeats_are_replayed(self):
+        first = self.post_lead('key-1')
+        self.assertEqual(first.status_code, 202)
+        self.assertNotIn('Idempotent-Replayed', first)
+        record = IdempotencyKey.objects.get(scope='proxy_lead', key='key-1')
+        self.assertEqual(record.status, IdempotencyKey.STATUS_DONE)
+
+        second = self.post_lead('key-1')
+        self.assertEqual(second.status_code, 202)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(LeadJob.objects.count(), 1)
+
+    def test_requests_without_a_key_always_run(self):
+        self.client.post(self.url, json.dumps({'Email': 'a@example.com'}), content_type='application/json')
+        self.client.post(self.url, json.dumps({'Email': 'a@example.com'}), content_type='application/json')
+        self.assertEqual(LeadJob.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_key_reused_for_a_different_request_is_refused(self):
+        self.post_lead('key-2', 'first@example.com')
+        response = self.post_lead('key-2', 'second@example.com')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(LeadJob.objects.count(), 1)
+
+    @mock.patch.object(idempotency, 'WAIT', 0)
+    def test_duplicate_of_a_running_request_gets_409(self):
+        # Same request as post_lead() sends, claimed by a request that hasn't finished
+        request = RequestFactory().post(self.url, json.dumps({'Email': 'idem@example.com', 'Last_Name': 'Test'}),
+                                        content_type='application/json')
+        outcome, _ = idempotency.claim('proxy_lead', 'key-3', idempotency.request_hash(request))
+        self.assertEqual(outcome, idempotency._OWNER)
+
+        response = self.post_lead('key-3')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(LeadJob.objects.exists())
+
+    def test_expired_key_runs_the_request_again(self):
+        self.post_lead('key-4')
+        IdempotencyKey.objects.filter(key='key-4').update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.post_lead('key-4')
+        self.assertEqual(response.status_code, 202)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(LeadJob.objects.count(), 2)
+
+    def test_purge_drops_only_expired_keys(self):
+        self.post_lead('key-5')
+        self.post_lead('key-6', 'other@example.com')
+        IdempotencyKey.objects.filter(key='key-5').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(idempotency.purge_expired(), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['key-6'])
+
+
+class FingerprintTests(TestCase):
+    def setUp(self):
+        self.account = create_account()
+        self.other = create_account(account_name='Other', tenant_id='t2', is_primary=False)
+        # The test settings' default cache stands in for the shared one
+        caches['default'].clear()
+        patcher = mock.patch.object(fingerprints, 'store', fingerprints.FingerprintStore('default'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def remember(self, account, payload, lead_id='100'):
+        key, fingerprint = fingerprints.find(account, payload)
+        fingerprints.remember(account, key, payload, lead_id, 'insert', fingerprint)
+
+    def test_repeated_payload_is_unchanged(self):
+        payload = {'Email': 'Lead@Example.com', 'Last_Name': 'Doe', 'City': 'Pune'}
+        self.remember(self.account, payload)
+        key, fingerprint = fingerprints.find(self.account, dict(payload))
+        self.assertEqual(key, 'email:lead@example.com')
+        self.assertTrue(fingerprints.is_unchanged(fingerprint, dict(payload)))
+        self.assertEqual(fingerprint.lead_id, '100')
+
+    def test_changed_payload_sends_changed_fields_and_duplicate_check_keys(self):
+        self.remember(self.account, {'Email': 'lead@example.com', 'Phone': '555', 'Last_Name': 'Doe',
+                                     'City': 'Pune', 'Company': 'Acme'})
+        payload = {'Email': 'lead@example.com', 'Phone': '555', 'Last_Name': 'Doe', 'City': 'Delhi',
+                   'Company': 'Acme'}
+        _, fingerprint = fingerprints.find(self.account, payload)
+        self.assertFalse(fingerprints.is_unchanged(fingerprint, payload))
+        self.assertEqual(fingerprints.changed_fields(fingerprint, payload),
+                         {'Email': 'lead@example.com', 'Phone': '555', 'Last_Name': 'Doe', 'City': 'Delhi'})
+
+    def test_unknown_lead_sends_everything(self):
+        payload = {'Email': 'new@example.com', 'Last_Name': 'Doe', 'City': 'Pune'}
+        _, fingerprint = fingerprints.find(self.account, payload)
+        self.assertIsNone(fingerprint)
+        self.assertFalse(fingerprints.is_unchanged(fingerprint, payload))
+        self.assertEqual(fingerprints.changed_fields(fingerprint, payload), payload)
+
+    def test_other_account_or_key_is_not_skipped(self):
+        payload = {'Email': 'lead@example.com', 'Last_Name': 'Doe'}
+        self.remember(self.account, payload)
+        _, fingerprint = fingerprints.find(self.other, payload)
+        self.assertIsNone(fingerprint)
+        _, fingerprint = fingerprints.find(self.account, {'Email': 'someone@example.com', 'Last_Name': 'Doe'})
+        self.assertIsNone(fingerprint)
+
+    def test_payload_without_email_or_phone_has_no_fingerprint(self):
+        key, fingerprint = fingerprints.find(self.account, {'Last_Name': 'Doe'})
+        self.assertEqual(key, '')
+        self.assertIsNone(fingerprint)
+
+    def test_forget_drops_the_fingerprint(self):
+        payload = {'Email': 'lead@example.com', 'Last_Name': 'Doe'}
+        self.remember(self.account, payload)
+        fingerprints.forget(self.account, [payload])
+        self.assertIsNone(fingerprints.find(self.account, payload)[1])
+
+    def test_nothing_is_skipped_without_a_shared_store(self):
+        payload = {'Email': 'lead@example.com', 'Last_Name': 'Doe'}
+        with mock.patch.object(fingerprints, 'store', None):
+            self.remember(self.account, payload)
+            key, fingerprint = fingerprints.find(self.account, payload)
+        self.assertEqual(key, 'email:lead@example.com')
+        self.assertIsNone(fingerprint)
+        self.assertEqual(fingerprints.changed_fields(fingerprint, payload), payload)
+
+    def test_queued_lead_drops_the_fingerprint(self):
+        # P1 upserted inline, then P2 for the same lead queued: a repeat of P1 must reach Zoho
+        first = {'Email': 'lead@example.com', 'Last_Name': 'Doe', 'City': 'Pune'}
+        self.remember(self.account, first)
+        lead_queue.enqueue_lead(self.account, {**first, 'City': 'Delhi'})
+        _, fingerprint = fingerprints.find(self.account, first)
+        self.assertFalse(fingerprints.is_unchanged(fingerprint, first))
+        self.assertEqual(fingerprints.changed_fields(fingerprint, first), first)
+
+    @mock.patch('base.views.ensure_fields_exist')
+    @mock.patch('base.views.upstream.post')
+    def test_proxy_lead_skips_unchanged_and_trims_changed_upserts(self, post, ensure_fields_exist):
+        post.return_value = mock.Mock(status_code=200, json=lambda: {
+            'data': [{'status': 'success', 'action': 'insert', 'details': {'id': '100'}}]})
+
+        def post_lead(payload):
+            return self.client.post('/api/leads/', json.dumps(payload), content_type='application/json').json()
+
+        lead = {'Email': 'lead@example.com', 'Last_Name': 'Doe', 'City': 'Pune'}
+        self.assertEqual(post_lead(lead)['lead_id'], '100')
+        repeat = post_lead(lead)
+        self.assertTrue(repeat['unchanged'])
+        self.assertEqual(repeat['lead_id'], '100')
+        self.assertEqual(post.call_count, 1)
+
+        post_lead({**lead, 'City': 'Delhi'})
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(post.call_args.kwargs['json']['data'],
+                         [{'Email': 'lead@example.com', 'Last_Name': 'Doe', 'City': 'Delhi'}])
+
+        # Same lead on another tenant is upserted in full
+        post_lead({**lead, 'tenant_id': 't2'})
+        self.assertEqual(post.call_count, 3)
+
+
+class LeadMirrorTests(TestCase):
+    def setUp(self):
+        self.account = create_account(lead_mirror_enabled=True)
+
+    def lead(self, lead_id, day, **fields):
+        return {'id': lead_id, 'Modified_Time': f'2026-10-{day:02d}T10:00:00+00:00', **fields}
+
+    def sync(self, *pages, fail=False):
+        def iter_lead_pages(account, modified_since=None):
+            yield from pages
+            if fail:
+                raise ConnectionError('connection reset')
+
+        with mock.patch.object(lead_mirror, 'iter_lead_pages', iter_lead_pages):
+            return lead_mirror.sync_account(self.account)
+
+    def mirrored_ids(self):
+        return sorted(LeadMirror.objects.filter(account=self.account).values_list('lead_id', flat=True))
+
+    def test_interrupted_first_pass_still_prunes_deleted_leads(self):
+        # Left over from before the mirror was (re)built; no longer in Zoho
+        lead_mirror.store(self.account, [self.lead('gone', 1)])
+        LeadMirror.objects.update(synced_at=timezone.now() - timedelta(days=1))
+
+        with self.assertRaises(ConnectionError):
+            self.sync([self.lead('1', 2)], fail=True)
+        self.assertIsNone(LeadSyncState.objects.get(account=self.account).last_synced_at)
+
+        self.assertEqual(self.sync([self.lead('2', 3)]), (1, 1))
+        self.assertEqual(self.mirrored_ids(), ['1', '2'])
+        state = LeadSyncState.objects.get(account=self.account)
+        self.assertIsNone(state.full_sync_started_at)
+        self.assertIsNotNone(state.deleted_cursor)
+
+    def test_phone_is_matched_like_zoho_does(self):
+        lead_mirror.store(self.account, [self.lead('1', 2, Email='Lead@Example.com', Phone=' +1 555 0100 ')])
+        self.assertEqual(lead_mirror.find_mirrored_lead(self.account, phone='+1 555 0100')['id'], '1')
+        self.assertIsNone(lead_mirror.find_mirrored_lead(self.account, phone='15550100'))
+        self.assertEqual(lead_mirror.find_mirrored_lead(self.account, email='lead@example.com')['id'], '1')
+
+
+class LeadQueueTests(TestCase):
+    def setUp(self):
+        self.account = create_account()
+        self.job = lead_queue.enqueue_lead(self.account, {'Email': 'queued@example.com', 'Last_Name': 'Test'})
+        for patcher in (mock.patch.object(lead_queue, 'ensure_fields_exist'),
+                        mock.patch.dict(breaker._breakers, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def process(self, **post):
+        with mock.patch('base.crm.upstream.post', **post):
+            lead_queue.process_account(self.account, batch_size=10, max_attempts=3)
+        self.job.refresh_from_db()
+        return self.job
+
+    def response(self, status_code, body):
+        return mock.Mock(status_code=status_code, json=lambda: body)
+
+    def test_success_completes_the_job(self):
+        job = self.process(return_value=self.response(200, {'data': [
+            {'status': 'success', 'code': 'SUCCESS', 'action': 'insert', 'details': {'id': '100'}}]}))
+        self.assertEqual(job.status, LeadJob.STATUS_DONE)
+        self.assertEqual(job.result['lead_id'], '100')
+
+    def test_transient_failures_are_retried_up_to_max_attempts(self):
+        failures = [
+            {'side_effect': requests.ConnectionError('connection reset')},
+            {'return_value': self.response(429, {'code': 'TOO_MANY_REQUESTS'})},
+            {'return_value': self.response(503, {})},
+        ]
+        for attempt, failure in enumerate(failures, 1):
+            job = self.process(**failure)
+            self.assertEqual(job.attempts, attempt)
+            self.assertEqual(job.status, LeadJob.STATUS_QUEUED if attempt < 3 else LeadJob.STATUS_FAILED)
+            LeadJob.objects.filter(pk=job.pk).update(next_attempt_at=timezone.now())
+
+    def test_retries_back_off_exponentially(self):
+        unreachable = {'side_effect': requests.ConnectionError('connection reset')}
+        for attempt, delay in ((1, 5), (2, 10)):
+            before = timezone.now()
+            job = self.process(**unreachable)
+            self.assertEqual(job.attempts, attempt)
+            self.assertGreaterEqual(job.next_attempt_at, before + timedelta(seconds=delay))
+            self.assertLessEqual(job.next_attempt_at, timezone.now() + timedelta(seconds=delay))
+            # Not claimed again while the backoff runs
+            self.assertEqual(self.process(**unreachable).attempts, attempt)
+            LeadJob.objects.filter(pk=job.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(lead_queue.retry_delay(10), lead_queue.RETRY_BACKOFF_MAX)
+
+    def test_auth_errors_fail_immediately(self):
+        job = self.process(return_value=self.response(401, {'code': 'INVALID_TOKEN'}))
+        self.assertEqual(job.status, LeadJob.STATUS_FAILED)
+        self.assertEqual(job.attempts, 1)
+
+    def test_rejected_records_fail_immediately(self):
+        job = self.process(return_value=self.response(200, {'data': [
+            {'status': 'error', 'code': 'INVALID_DATA', 'message': 'invalid data'}]}))
+        self.assertEqual(job.status, LeadJob.STATUS_FAILED)
+        self.assertEqual(job.result['code'], 'INVALID_DATA')
+
+
+class LeadImportTests(TestCase):
+    def test_unexpected_errors_mark_the_import_failed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / 'leads.csv'
+            source.write_text('Email,Last_Name\nlead@example.com,Doe\n')
+            lead_import = LeadImport.objects.create(account=create_account(), format='csv', source_path=str(source))
+            with mock.patch.object(bulk_import, 'run_import', side_effect=KeyError('Email')), \
+                    self.assertLogs('base.bulk_import', 'ERROR'):
+                bulk_import.process_import(lead_import)
+        lead_import.refresh_from_db()
+        self.assertEqual(lead_import.status, LeadImport.STATUS_FAILED)
+        self.assertEqual(lead_import.error, "KeyError: 'Email'")
+        self.assertIsNotNone(lead_import.finished_at)
+
+
+class FieldsProbeTests(TestCase):
+    def setUp(self):
+        self.account = create_account()
+        bookings_meta_cache.clear()
+        self.addCleanup(bookings_meta_cache.clear)
+
+    def fetch(self, status_code):
+        response = mock.Mock(status_code=status_code, text='', json=lambda: {'fields': []})
+        with mock.patch('base.bookings.upstream.request', return_value=response) as request:
+            _, error = bookings.fetch_service_fields(self.account, {}, 'service')
+        return request.call_count, error
+
+    def test_server_errors_are_not_probed_again_right_away(self):
+        calls, _ = self.fetch(503)
+        self.assertEqual(calls, len(bookings.FIELDS_PROBES))
+        calls, error = self.fetch(503)
+        self.assertEqual(calls, 0)
+        self.assertIn('failed recently', error)
+
+    def test_server_error_keeps_the_working_probe(self):
+        winner = bookings.FIELDS_PROBES[3]
+        bookings.record_fields_probe(self.account.api_domain, winner, True)
+        self.fetch(503)
+        self.assertEqual(bookings_meta_cache.get(('fields_probe', self.account.api_domain)), winner)
+        self.assertNotIn(winner, bookings.fields_probes(self.account.api_domain))
@@ -0,0 +1,117 @@
+"""
+Per-request phase timings. TimingMiddleware opens a RequestTimings for each request; code on
+the request path wraps its phases with `phase(name)` / `@timed(name)`, and upstream calls are
+added as the `zoho` phase. Outside a request (workers, management commands) all of this is
+a no-op.
+"""
+import asyncio
+import contextvars
+import functools
+import re
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from . import metrics
+
+_current = contextvars.ContextVar('zoho_request_timings', default=None)
+
+# Record ids in Zoho paths (/crm/v2/Leads/4876876000000123001) would make a label per record
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        # phase name -> [seconds, count], in the order phases were first entered
+        self.phases = {}
+        self._active = set()
+
+    def add(self, name, seconds):
+        entry = self.phases.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        """Server-Timing header value; durations in milliseconds, call counts as desc."""
+        parts = []
+        for name, (seconds, count) in self.phases.items():
+            part = f"{name};dur={seconds * 1000:.1f}"
+            if count > 1:
+                part += f';desc="{count} calls"'
+            parts.append(part)
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ', '.join(parts)
+
+
+def start():
+    """Begin timing the current request; returns the context token for finish()."""
+    return _current.set(RequestTimings())
+
+
+def current():
+    return _current.get()
+
+
+def finish(token):
+    timings = _current.get()
+    _current.reset(token)
+    return timings
+
+
+@contextmanager
+def phase(name):
+    timings = _current.get()
+    # A phase nested in itself (e.g. the async token lookup falling back to the sync one)
+    # is only counted once
+    if timings is None or name in timings._active:
+        yield
+        return
+    timings._active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._active.discard(name)
+        timings.add(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """Decorator form of phase(), for both plain and async functions."""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with phase(name):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with phase(name):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_upstream(url, seconds, account=None, status='error'):
+    """
+    One Zoho call: into the per-api_domain histogram, the call counter and the current
+    request's `zoho` phase.
+    """
+    parts = urlsplit(url)
+    metrics.upstream_duration.observe(seconds, f"{parts.scheme}://{parts.netloc}")
+    metrics.upstream_requests_total.inc(_ID_SEGMENT.sub('/{id}', parts.path),
+                                        str(account.pk) if account is not None else '', str(status))
+    timings = _current.get()
+    if timings is not None:
+        timings.add('zoho', seconds)
+
+
+def record_wait(seconds):
+    """Time a call spent waiting for its rate-limit turn."""
+    timings = _current.get()
+    if timings is not None and seconds:
+        timings.add('ratelimit', seconds)
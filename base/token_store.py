@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .cache import TTLCache
+
+
+class LocalTokenStore:
+    """Access tokens for this process only; entries disappear when the token expires."""
+
+    def __init__(self, maxsize):
+        self._cache = TTLCache(ttl=3600, maxsize=maxsize)
+
+    def get(self, account_pk):
+        return self._cache.get(account_pk)
+
+    def set(self, account_pk, access_token, expiry_time):
+        ttl = (expiry_time - timezone.now()).total_seconds()
+        if ttl > 0:
+            self._cache.set(account_pk, (access_token, expiry_time), ttl=ttl)
+
+    def delete(self, account_pk):
+        self._cache.delete(account_pk)
+
+
+class CacheTokenStore:
+    """Access tokens in a Django cache backend, shared by every worker that uses it."""
+
+    def __init__(self, alias):
+        self._cache = caches[alias]
+
+    def _key(self, account_pk):
+        return f"zoho_token:{account_pk}"
+
+    def get(self, account_pk):
+        return self._cache.get(self._key(account_pk))
+
+    def set(self, account_pk, access_token, expiry_time):
+        ttl = int((expiry_time - timezone.now()).total_seconds())
+        if ttl > 0:
+            self._cache.set(self._key(account_pk), (access_token, expiry_time), timeout=ttl)
+
+    def delete(self, account_pk):
+        self._cache.delete(self._key(account_pk))
+
+
+def _build_store():
+    alias = getattr(settings, 'ZOHO_TOKEN_CACHE_ALIAS', None)
+    if alias:
+        return CacheTokenStore(alias)
+    return LocalTokenStore(maxsize=getattr(settings, 'ZOHO_TOKEN_STORE_MAXSIZE', 1024))
+
+
+# (access_token, expiry_time) per account pk. Holds tokens newer than the DB row until
+# the background write lands, and in a shared backend lets workers reuse each other's refreshes.
+token_store = _build_store()
@@ -0,0 +1,142 @@
+import logging
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from . import background, metrics, upstream
+from .cache import SingleFlight
+from .models import ZohoAccount
+from .timing import timed
+from .token_store import token_store
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: fall back to the in-process guard only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Refresh this long before Zoho's reported expiry so requests never see a dead token
+TOKEN_REFRESH_MARGIN = timedelta(seconds=getattr(settings, 'ZOHO_TOKEN_REFRESH_MARGIN', 300))
+
+# Columns a token refresh writes; saves touching only these leave account caches alone
+TOKEN_FIELDS = ['access_token', 'expiry_time', 'updated_at']
+
+_refresh_flight = SingleFlight()
+
+
+@contextmanager
+def account_lock(account):
+    """Exclusive lock on an account shared by every worker process on this host."""
+    lock_dir = getattr(settings, 'ZOHO_LOCK_DIR', None)
+    if not lock_dir or fcntl is None:
+        yield
+        return
+
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, f"zoho_account_{account.pk}.lock"), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def refresh_zoho_token(account):
+    token_url = f"{account.accounts_server}/oauth/v2/token"
+    data = {
+        'refresh_token': account.refresh_token,
+        'client_id': settings.ZOHO_CLIENT_ID,
+        'client_secret': settings.ZOHO_CLIENT_SECRET,
+        'grant_type': 'refresh_token'
+    }
+    try:
+        res_data = upstream.post(token_url, data=data).json()
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("Token refresh failed for account %s: %s", account.pk, e)
+        metrics.token_refreshes_total.inc('error')
+        return False
+    if 'access_token' in res_data:
+        account.access_token = res_data['access_token']
+        account.expiry_time = timezone.now() + timedelta(seconds=res_data.get('expires_in', 3600))
+        token_store.set(account.pk, account.access_token, account.expiry_time)
+        background.submit(persist_token, account.pk, account.access_token, account.expiry_time)
+        metrics.token_refreshes_total.inc('success')
+        return True
+    metrics.token_refreshes_total.inc('rejected')
+    return False
+
+
+def persist_token(account_pk, access_token, expiry_time):
+    """Write a refreshed token to the DB; runs off the request path."""
+    account = ZohoAccount(pk=account_pk, access_token=access_token, expiry_time=expiry_time)
+    # Only the token columns: no primary-flag bookkeeping, no clobbering account config
+    account.save(update_fields=TOKEN_FIELDS)
+
+
+def current_token(account):
+    """The freshest (access_token, expiry_time) known here: the token store or the model row."""
+    stored = token_store.get(account.pk)
+    if stored and stored[1] > account.expiry_time:
+        return stored
+    return account.access_token, account.expiry_time
+
+
+def _needs_refresh(expiry_time):
+    return expiry_time - TOKEN_REFRESH_MARGIN <= timezone.now()
+
+
+def _refresh_exclusive(account):
+    """Refresh under the cross-worker lock; returns (access_token, expiry_time) or None."""
+    with account_lock(account):
+        # Another worker may have refreshed while we were waiting on the lock
+        stored = token_store.get(account.pk)
+        if stored and not _needs_refresh(stored[1]):
+            return stored
+        latest = ZohoAccount.objects.filter(pk=account.pk).values('access_token', 'expiry_time').first()
+        if latest and not _needs_refresh(latest['expiry_time']):
+            token_store.set(account.pk, latest['access_token'], latest['expiry_time'])
+            return latest['access_token'], latest['expiry_time']
+
+        if refresh_zoho_token(account):
+            return account.access_token, account.expiry_time
+        return None
+
+
+def _refresh_in_background(account_pk):
+    account = ZohoAccount.objects.filter(pk=account_pk).first()
+    if account:
+        _refresh_flight.do(account_pk, _refresh_exclusive, account)
+
+
+@timed('token')
+def get_valid_token(account):
+    access_token, expiry_time = current_token(account)
+    if not _needs_refresh(expiry_time):
+        return access_token
+
+    if expiry_time > timezone.now():
+        # Still valid, just inside the margin: refresh off the request path
+        if not _refresh_flight.in_flight(account.pk):
+            background.submit(_refresh_in_background, account.pk)
+        return access_token
+
+    # Expired: every concurrent caller for this account waits on a single refresh
+    refreshed = _refresh_flight.do(account.pk, _refresh_exclusive, account)
+    if not refreshed:
+        return None
+    return refreshed[0]
+
+
+@timed('token')
+async def aget_valid_token(account):
+    """Async twin of get_valid_token; only leaves the event loop when a refresh may be needed."""
+    access_token, expiry_time = current_token(account)
+    if not _needs_refresh(expiry_time):
+        return access_token
+    return await sync_to_async(get_valid_token)(account)
@@ -0,0 +1,102 @@
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import breaker, ratelimit, timing
+
+POOL_SIZE = getattr(settings, 'ZOHO_HTTP_POOL_SIZE', 20)
+CONNECT_TIMEOUT = getattr(settings, 'ZOHO_HTTP_CONNECT_TIMEOUT', 5)
+READ_TIMEOUT = getattr(settings, 'ZOHO_HTTP_READ_TIMEOUT', 30)
+RETRIES = getattr(settings, 'ZOHO_HTTP_RETRIES', 2)
+BACKOFF = getattr(settings, 'ZOHO_HTTP_BACKOFF', 0.3)
+
+# Only these are replayed after a response/read failure; connection errors are
+# retried for every method since the request never reached Zoho.
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _build_session():
+    retry = Retry(
+        total=RETRIES,
+        backoff_factor=BACKOFF,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=IDEMPOTENT_METHODS,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # Sessions are shared by every tenant, so never carry cookies between accounts
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def get_session(url):
+    """Return the keep-alive session for the url's origin (one pool per Zoho domain)."""
+    parts = urlsplit(url)
+    origin = f"{parts.scheme}://{parts.netloc}"
+    session = _sessions.get(origin)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(origin)
+            if session is None:
+                session = _sessions[origin] = _build_session()
+    return session
+
+
+def _send(session, method, url, account=None, **kwargs):
+    circuit = breaker.breaker_for(url)
+    probe = circuit.admit()
+    started = time.perf_counter()
+    status = 'error'
+    try:
+        resp = session.request(method, url, **kwargs)
+        status = resp.status_code
+        return resp
+    finally:
+        seconds = time.perf_counter() - started
+        circuit.record(status == 'error' or status >= 500, seconds, probe)
+        timing.record_upstream(url, seconds, account, status)
+
+
+def request(method, url, account=None, **kwargs):
+    """
+    Call Zoho through the pooled session. With `account`, the call is paced by that account's
+    rate-limit bucket and a 429 is retried after the wait Zoho asks for. Raises
+    breaker.CircuitOpen without calling Zoho while the origin's circuit is open.
+    """
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    session = get_session(url)
+    if account is None:
+        return _send(session, method, url, **kwargs)
+
+    for attempt in range(ratelimit.RETRIES_ON_429 + 1):
+        # Refused calls shouldn't spend the account's rate-limit credits
+        breaker.breaker_for(url).check()
+        wait = ratelimit.reserve(account)
+        if wait:
+            time.sleep(wait)
+            timing.record_wait(wait)
+        resp = _send(session, method, url, account, **kwargs)
+        ratelimit.observe(account, resp.status_code, resp.headers)
+        if resp.status_code != 429:
+            break
+    return resp
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
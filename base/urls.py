@@ -1,16 +1,35 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Proxy endpoints are served by the async views when running under ASGI
+if getattr(settings, 'ZOHO_ASYNC_VIEWS', False):
+    from . import async_views as proxy_views
+else:
+    proxy_views = views
+
 urlpatterns = [
     path('', views.index, name='index'),
     path('zoho/login/', views.zoho_login, name='zoho_login'),
     path('api/oauth/zoho/callback/', views.zoho_callback, name='zoho_callback'),
-    path('api/leads/', views.proxy_lead, name='proxy_lead'),
-    path('api/leads/get/', views.get_lead, name='get_lead'),
-    path('api/bookings/', views.proxy_booking, name='proxy_booking'),
+    path('api/leads/', proxy_views.proxy_lead, name='proxy_lead'),
+    path('api/leads/bulk/', views.proxy_lead_bulk, name='proxy_lead_bulk'),
+    path('api/leads/import/', views.lead_import, name='lead_import'),
+    path('api/leads/import/<uuid:import_id>/', views.lead_import_status, name='lead_import_status'),
+    path('api/leads/import/<uuid:import_id>/results/', views.lead_import_results, name='lead_import_results'),
+    path('api/leads/jobs/<uuid:job_id>/', views.lead_job_status, name='lead_job_status'),
+    path('api/ratelimit/', views.rate_limit_status, name='rate_limit_status'),
+    path('api/circuits/', views.circuit_status, name='circuit_status'),
+    path('api/timings/', views.timing_summary, name='timing_summary'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('api/leads/export/', views.export_leads, name='export_leads'),
+    path('api/leads/get/', proxy_views.get_lead, name='get_lead'),
+    path('api/bookings/', proxy_views.proxy_booking, name='proxy_booking'),
+    path('api/bookings/slots/', proxy_views.available_slots, name='available_slots'),
     path('account/primary/<int:pk>/', views.set_primary, name='set_primary'),
     path('account/update/<int:pk>/', views.update_account_config, name='update_account_config'),
-    path('account/metadata/<int:pk>/', views.get_bookings_metadata, name='get_bookings_metadata'),
-    path('account/fields/<int:pk>/', views.get_service_fields, name='get_service_fields'),
+    path('account/metadata/<int:pk>/', proxy_views.get_bookings_metadata, name='get_bookings_metadata'),
+    path('account/fields/<int:pk>/', proxy_views.get_service_fields, name='get_service_fields'),
+    path('account/identity/<int:pk>/', views.account_identity, name='account_identity'),
     path('account/delete/<int:pk>/', views.delete_account, name='delete_account'),
 ]
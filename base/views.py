@@ -1,46 +1,56 @@
+import logging
+
 import requests
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
-from datetime import datetime, timedelta
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
+from itertools import chain
 from django.views.decorators.csrf import csrf_exempt
-from .models import ZohoAccount
+from .models import ZohoAccount, LeadImport, LeadJob
+from . import breaker, fingerprints, metrics, upstream
+from .accounts import resolve_account
+from .breaker import CircuitOpen
+from .bulk_import import detect_format, save_upload
+from .bookings import (
+    BookingRequestError, booking_failure, cache_service_fields, cached_service_fields, fetch_service_fields,
+    find_alternative_slots, get_portal_id, get_slot_days, invalidate_slots, parse_bookings_list, prepare_booking,
+    slot_days_response, slot_query, slot_search_response, summarize_services, summarize_staff,
+)
+from .crm import (
+    DUPLICATE_CHECK_FIELDS, ensure_fields_exist, invalidate_leads, iter_lead_pages, lookup_lead, summarize_upsert,
+    upsert_leads,
+)
+from .idempotency import idempotent
+from .identity import GENERIC_ACCOUNT_NAME, needs_identity, schedule_identity
+from .lead_mirror import lookup_mirrored_lead, mirror_upserted
+from .lead_queue import enqueue_lead
+from .log import BodyPreview, LazyJson
+from .ratelimit import RateLimitExceeded, bucket_levels
+from .timing import phase
+from .tokens import get_valid_token
 import json
 
+logger = logging.getLogger(__name__)
+
 def index(request):
-    accounts = ZohoAccount.objects.all()
-    # Proactively try to refresh generic names
+    accounts = list(ZohoAccount.objects.all())
+    # Generic names are resolved in the background; the page shows them as resolving meanwhile
     for account in accounts:
-        if account.account_name == "Zoho Account" or not account.account_name:
-            token = get_valid_token(account)
-            if token:
-                try:
-                    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
-                    print(f"DEBUG: Fetching identity from Zoho Accounts")
-                    
-                    # Use the regional OAuth User Info endpoint
-                    info_resp = requests.get(f"{account.accounts_server}/oauth/user/info", headers=headers)
-                    print(f"DEBUG: Info API Status: {info_resp.status_code}")
-                    
-                    if info_resp.status_code == 200:
-                        info_data = info_resp.json()
-                        account.account_name = f"{info_data.get('Display_Name')} ({info_data.get('Email')})"
-                        print(f"DEBUG: Found Identity: {account.account_name}")
-                    else:
-                        print(f"DEBUG: Info API failed. Trying CRM Org fallback.")
-                        org_resp = requests.get(f"{account.api_domain}/crm/v2/org", headers=headers)
-                        if org_resp.status_code == 200:
-                            org_data = org_resp.json().get('org', [{}])[0]
-                            account.account_name = org_data.get('company_name', 'Zoho Account')
-                    
-                    if account.account_name != "Zoho Account":
-                        account.save()
-                except Exception as e:
-                    print(f"DEBUG: Exception: {e}")
-    primary_account = ZohoAccount.objects.filter(is_active=True, is_primary=True).first()
+        account.identity_pending = needs_identity(account)
+        if account.identity_pending:
+            schedule_identity(account)
+    primary_account = next((a for a in accounts if a.is_active and a.is_primary), None)
     return render(request, 'base/index.html', {'accounts': accounts, 'primary_account': primary_account})
 
+def account_identity(request, pk):
+    """Polled by the dashboard while an account's identity is being resolved."""
+    account = get_object_or_404(ZohoAccount, pk=pk)
+    return JsonResponse({'account_name': account.account_name, 'resolving': needs_identity(account)})
+
 def zoho_login(request):
     auth_url = f"{settings.ZOHO_AUTH_URL}?scope={settings.ZOHO_SCOPES}&client_id={settings.ZOHO_CLIENT_ID}&response_type=code&access_type=offline&redirect_uri={settings.ZOHO_REDIRECT_URI}&prompt=consent"
     return redirect(auth_url)
@@ -61,7 +71,7 @@ def zoho_callback(request):
         'grant_type': 'authorization_code'
     }
 
-    response = requests.post(token_url, data=data)
+    response = upstream.post(token_url, data=data)
     res_data = response.json()
 
     if 'access_token' in res_data:
@@ -69,24 +79,6 @@ def zoho_callback(request):
         # Zoho returns 'api_domain' in the token response.
         api_domain = res_data.get('api_domain', 'https://www.zohoapis.com')
         
-        # Get Identity Info using the new token
-        account_display_name = "Zoho Account"
-        headers = {'Authorization': f'Zoho-oauthtoken {res_data["access_token"]}'}
-        try:
-            # Try the regional Identity endpoint
-            info_resp = requests.get(f"{accounts_server}/oauth/user/info", headers=headers)
-            if info_resp.status_code == 200:
-                info_data = info_resp.json()
-                account_display_name = f"{info_data.get('Display_Name')} ({info_data.get('Email')})"
-            else:
-                # CRM Org fallback
-                org_resp = requests.get(f"{api_domain}/crm/v2/org", headers=headers)
-                if org_resp.status_code == 200:
-                    org_data = org_resp.json().get('org', [{}])[0]
-                    account_display_name = org_data.get('company_name', 'Zoho Account')
-        except:
-            pass
-
         # Set as primary if no primary exists
         is_primary = False
         if not ZohoAccount.objects.filter(is_primary=True).exists():
@@ -95,7 +87,7 @@ def zoho_callback(request):
         account, created = ZohoAccount.objects.update_or_create(
             refresh_token=res_data['refresh_token'],
             defaults={
-                'account_name': account_display_name,
+                'account_name': GENERIC_ACCOUNT_NAME,
                 'access_token': res_data['access_token'],
                 'api_domain': api_domain,
                 'accounts_server': accounts_server,
@@ -104,71 +96,12 @@ def zoho_callback(request):
                 'is_primary': is_primary
             }
         )
+        # Who owns the account is looked up after the redirect; the dashboard shows it as resolving
+        schedule_identity(account)
         return redirect('index')
     else:
         return JsonResponse(res_data, status=400)
 
-def refresh_zoho_token(account):
-    token_url = f"{account.accounts_server}/oauth/v2/token"
-    data = {
-        'refresh_token': account.refresh_token,
-        'client_id': settings.ZOHO_CLIENT_ID,
-        'client_secret': settings.ZOHO_CLIENT_SECRET,
-        'grant_type': 'refresh_token'
-    }
-    response = requests.post(token_url, data=data)
-    res_data = response.json()
-    if 'access_token' in res_data:
-        account.access_token = res_data['access_token']
-        account.expiry_time = timezone.now() + timedelta(seconds=res_data.get('expires_in', 3600))
-        account.save()
-        return True
-    return False
-
-def get_valid_token(account):
-    if account.expiry_time <= timezone.now():
-        if not refresh_zoho_token(account):
-            return None
-    return account.access_token
-
-def ensure_fields_exist(account, module, data_keys):
-    token = get_valid_token(account)
-    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
-    
-    # Get existing fields
-    fields_url = f"{account.api_domain}/crm/v2/settings/fields?module={module}"
-    resp = requests.get(fields_url, headers=headers)
-    if resp.status_code != 200:
-        return # Fallback or log error
-    
-    existing_fields = {field['api_name'] for field in resp.json().get('fields', [])}
-    
-    # List of system fields to never try to create
-    system_base_fields = {'First_Name', 'Last_Name', 'Email', 'Company', 'Phone', 'Mobile', 'Lead_Source', 'Lead_Status', 'Industry', 'Website', 'Description'}
-
-    for key in data_keys:
-        # Check if it's a new field (not in system fields and not in existing Zoho fields)
-        if key not in existing_fields and key not in system_base_fields:
-            print(f"DEBUG: Field '{key}' not found in Zoho. Attempting to create...")
-            # Try to create field
-            create_url = f"{account.api_domain}/crm/v2/settings/fields?module={module}"
-            
-            # Prepare API Name: Zoho API names usually don't like multiple underscores or starting with numbers
-            # But we'll try to use what's provided first.
-            field_data = {
-                "fields": [
-                    {
-                        "api_name": key,
-                        "display_label": key.replace('_', ' ').title(),
-                        "data_type": "text",
-                        "field_label": key.replace('_', ' ').title(), # Some versions use field_label
-                        "length": 255
-                    }
-                ]
-            }
-            create_resp = requests.post(create_url, headers=headers, json=field_data)
-            print(f"DEBUG: Field creation response for '{key}': {create_resp.status_code} - {create_resp.text}")
-
 def set_primary(request, pk):
     account = get_object_or_404(ZohoAccount, pk=pk)
     account.is_primary = True
@@ -197,6 +130,8 @@ def update_account_config(request, pk):
         account.tenant_id = data.get('tenant_id')
         account.bookings_service_id = data.get('bookings_service_id')
         account.bookings_staff_id = data.get('bookings_staff_id')
+        if 'lead_mirror_enabled' in data:
+            account.lead_mirror_enabled = bool(data['lead_mirror_enabled'])
         account.save()
         return JsonResponse({'status': 'success'})
     return JsonResponse({'error': 'Method not allowed'}, status=405)
@@ -211,55 +146,34 @@ def get_bookings_metadata(request, pk):
     base_domain = account.api_domain # Usually https://www.zohoapis.com or .in
     bookings_base = f"{base_domain}/bookings/v1/json"
     
-    print(f"DEBUG: Fetching metadata from {bookings_base} for account {account.account_name}")
+    logger.debug("Fetching metadata from %s for account %s", bookings_base, account.pk)
     
     try:
         # Fetch Services
         services_url = f"{bookings_base}/services"
-        services_resp = requests.get(services_url, headers=headers)
+        services_resp = upstream.get(services_url, account=account, headers=headers)
         
-        print(f"DEBUG: Services Resp [{services_resp.status_code}]: {services_resp.text[:200]}")
+        logger.debug("Services response [%s]: %s", services_resp.status_code, BodyPreview(services_resp, 200),
+                     extra={'sampled': True})
         
-        # Corrected parsing based on observed response: response -> returnvalue -> data
-        services_data = services_resp.json().get('response', {}).get('returnvalue', {})
-        services = services_data.get('data', [])
+        services = parse_bookings_list(services_resp.json())
         
         # Fetch Staff
         staff_url = f"{bookings_base}/staffs"
-        staff_resp = requests.get(staff_url, headers=headers)
-        
-        # Corrected parsing based on observed response: response -> returnvalue -> data
-        staff_data = staff_resp.json().get('response', {}).get('returnvalue', {})
-        staff = staff_data.get('data', [])
-        
-        if services:
-            print(f"DEBUG: First Service Keys: {list(services[0].keys())}")
-        if staff:
-            print(f"DEBUG: First Staff Keys: {list(staff[0].keys())}")
-            
-        print(f"DEBUG: Found {len(services)} services and {len(staff)} staff members.")
+        staff_resp = upstream.get(staff_url, account=account, headers=headers)
+        staff = parse_bookings_list(staff_resp.json())
         
-        # Try both common Zoho key formats
-        processed_services = []
-        for s in services:
-            s_id = s.get('service_id') or s.get('id')
-            s_name = s.get('service_name') or s.get('name') or s.get('display_name')
-            if s_id and s_name:
-                processed_services.append({'id': s_id, 'name': s_name})
+        logger.debug("Found %d services and %d staff members", len(services), len(staff))
         
-        processed_staff = []
-        for s in staff:
-            st_id = s.get('staff_id') or s.get('id')
-            st_name = s.get('staff_name') or s.get('name') or s.get('display_name')
-            if st_id and st_name:
-                processed_staff.append({'id': st_id, 'name': st_name})
+        processed_services = summarize_services(services)
+        processed_staff = summarize_staff(staff)
         
         return JsonResponse({
             'services': processed_services,
             'staff': processed_staff
         })
     except Exception as e:
-        print(f"ERROR: Metadata fetch failed: {str(e)}")
+        logger.exception("Metadata fetch failed for account %s", account.pk)
         return JsonResponse({'error': str(e)}, status=500)
 
 def get_service_fields(request, pk):
@@ -269,67 +183,22 @@ def get_service_fields(request, pk):
         return JsonResponse({'error': 'service_id required'}, status=400)
     
     account = get_object_or_404(ZohoAccount, pk=pk)
+    result = cached_service_fields(account, service_id)
+    if result is not None:
+        return JsonResponse(result)
+
     token = get_valid_token(account)
     headers = {'Authorization': f'Zoho-oauthtoken {token}'}
-    
-    # Try both /fields and /getfields (Zoho uses both depending on the API version/domain)
-    # Also try both GET and POST as some regions are picky
-    base_domain = account.api_domain
-    
-    # NEW STEP: Try to find a Portal/Workspace Name if we don't have one
-    # This often fixes the 500 error on regional domains
-    portal_name = None
-    try:
-        portal_resp = requests.get(f"{base_domain}/bookings/v1/json/portals", headers=headers)
-        if portal_resp.status_code == 200:
-            portals = portal_resp.json().get('response', {}).get('returnvalue', {}).get('portals', [])
-            if portals:
-                portal_name = portals[0].get('portal_id') or portals[0].get('portal_name')
-                print(f"DEBUG: Found Portal Context: {portal_name}")
-    except:
-        pass
 
-    endpoints = ["/bookings/v1/json/getfields", "/bookings/v1/json/fields"]
-    params = {"service_id": service_id}
-    if portal_name:
-        params["portal_id"] = portal_name
-    
-    last_error = "Unknown"
-    data = None
-    
-    for endpoint in endpoints:
-        url = f"{base_domain}{endpoint}"
-        for method in [requests.get, requests.post]:
-            try:
-                # Try with service_id first
-                params = {"service_id": service_id}
-                # (Removed staff_id check here as it might be causing the 500 in some Zoho regions)
-                
-                resp = method(url, headers=headers, params=params if method == requests.get else None, data=params if method == requests.post else None)
-                print(f"DEBUG: Fields API Trial ({method.__name__.upper()} {endpoint}) -> Status: {resp.status_code}")
-                
-                if resp.status_code == 200:
-                    data = resp.json()
-                    print(f"DEBUG: Fields API Success on {endpoint}!")
-                    break
-                else:
-                    last_error = f"Status {resp.status_code}: {resp.text}"
-                    print(f"DEBUG: Fields API Trial Failed. Body: {resp.text[:500]}")
-                
-                # Fallback: Try without service_id
-                if resp.status_code != 200:
-                    resp = method(url, headers=headers)
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        break
-            except Exception as e:
-                last_error = str(e)
-                print(f"DEBUG: Fields API Exception: {str(e)}")
-                continue
-        if data: break
+    # Portal/Workspace context; looked up once per account
+    get_portal_id(account, headers)
+
+    # Zoho serves /fields or /getfields, over GET or POST, depending on the API version and data
+    # center; the combination that worked last time for this api_domain is tried first
+    data, last_error = fetch_service_fields(account, headers, service_id)
     
     if not data:
-        print(f"CRITICAL: All Fields API attempts failed. Last error: {last_error}")
+        logger.error("All fields endpoints failed for account %s. Last error: %s", account.pk, last_error)
         return JsonResponse({
             'error': 'Failed to fetch fields from Zoho',
             'detail': last_error,
@@ -337,69 +206,59 @@ def get_service_fields(request, pk):
         }, status=200)
 
     try:
-        # Deep search for any key matching 'fields' or containing list of fields
-        def find_fields_in_json(obj):
-            if isinstance(obj, dict):
-                for k, v in obj.items():
-                    if k in ['fields', 'custom_fields', 'booking_fields'] and isinstance(v, list):
-                        return v
-                    result = find_fields_in_json(v)
-                    if result: return result
-            elif isinstance(obj, list):
-                for item in obj:
-                    result = find_fields_in_json(item)
-                    if result: return result
-            return None
-
-        fields_list = find_fields_in_json(data) or []
-        
-        # Fallback to direct path search
-        if not fields_list:
-            # response -> returnvalue -> fields
-            fields_list = data.get('response', {}).get('returnvalue', {}).get('fields', [])
-        
-        mandatory_fields = {}
-        for f in fields_list:
-            if not isinstance(f, dict): continue
-            
-            # Zoho uses multiple keys for requirement status
-            is_req = f.get('is_mandatory') or f.get('mandatory') or f.get('required') or False
-            
-            if is_req:
-                # Field ID or Field Name
-                field_id = f.get('field_name') or f.get('id') or f.get('field_id')
-                display_name = f.get('display_name') or f.get('label') or field_id
-                
-                # Filter out base fields that we already handle in the UI
-                if field_id and field_id.lower() not in ['name', 'email', 'phone_number', 'date', 'time', 'service_id', 'staff_id']:
-                    mandatory_fields[field_id] = f"REQUIRED: {display_name}"
-
-        return JsonResponse({
-            'mandatory_fields': mandatory_fields,
-            'count': len(mandatory_fields),
-            'debug_found_fields': len(fields_list)
-        })
+        return JsonResponse(cache_service_fields(account, service_id, data))
     except Exception as e:
-        print(f"ERROR in get_service_fields: {str(e)}")
+        logger.exception("Parsing service fields failed for account %s", account.pk)
         return JsonResponse({'error': str(e)}, status=500)
 
+def wants_async(request):
+    """Async mode is opted into per request with ?async=true or `Prefer: respond-async`."""
+    if request.GET.get('async', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+def lead_queued_response(job, reason=None):
+    body = {
+        'status': 'queued',
+        'job_id': str(job.pk),
+        'status_url': reverse('lead_job_status', args=[job.pk])
+    }
+    if reason:
+        body['reason'] = reason
+    return JsonResponse(body, status=202)
+
+def circuit_open_response(e):
+    """503 for a call refused by an open circuit breaker; Retry-After says when to come back."""
+    response = JsonResponse({'error': str(e), 'reason': 'circuit_open'}, status=503)
+    response['Retry-After'] = str(max(1, round(e.retry_after)))
+    return response
+
+def unchanged_lead_response(account, fingerprint):
+    fingerprints.skipped_total.inc()
+    return JsonResponse({
+        'lead_id': fingerprint.lead_id,
+        'action': fingerprint.action,
+        'account': account.account_name,
+        'status': 200,
+        'unchanged': True,
+        'response': None
+    })
+
 @csrf_exempt
+@idempotent('proxy_lead')
 def proxy_lead(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'Only POST allowed'}, status=405)
     
     try:
         payload = json.loads(request.body)
-        print(f"DEBUG: Proxy Lead Payload Received: {payload}")
+        logger.debug("Proxy lead payload received: %s", LazyJson(payload), extra={'sampled': True})
     except:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
 
     # Multi-tenant account lookup
     tenant_id = payload.get('tenant_id')
-    if not tenant_id:
-        account = ZohoAccount.objects.filter(is_active=True, is_primary=True).first()
-    else:
-        account = ZohoAccount.objects.filter(tenant_id=tenant_id, is_active=True).first()
+    account = resolve_account(tenant_id)
 
     if not account:
         return JsonResponse({'error': f'Zoho account not found for tenant: {tenant_id or "Primary"}'}, status=400)
@@ -408,6 +267,19 @@ def proxy_lead(request):
     if 'Last_Name' not in payload and 'last_name' not in payload:
         payload['Last_Name'] = 'Unknown' # Default for Zoho mandatory field
     
+    # Async mode: persist the lead and let the process_lead_queue worker push it
+    if wants_async(request):
+        return lead_queued_response(enqueue_lead(account, payload))
+
+    # Same payload as last time for this Email/Phone: Zoho already has it
+    key, fingerprint = fingerprints.find(account, payload)
+    if fingerprints.is_unchanged(fingerprint, payload):
+        return unchanged_lead_response(account, fingerprint)
+
+    # Zoho's data center for this account is failing: don't wait on it, queue the lead
+    if breaker.is_open(account.api_domain):
+        return lead_queued_response(enqueue_lead(account, payload), reason='circuit_open')
+
     # 1. Ensure fields exist
     ensure_fields_exist(account, 'Leads', payload.keys())
     
@@ -420,24 +292,28 @@ def proxy_lead(request):
     
     # If the payload contains an email or phone, we use them for duplicate check
     upsert_data = {
-        "data": [payload],
-        "duplicate_check_fields": ["Email", "Phone"]
+        # Only the fields that changed since the last upsert for this lead
+        "data": [fingerprints.changed_fields(fingerprint, payload)],
+        "duplicate_check_fields": DUPLICATE_CHECK_FIELDS
     }
     
-    resp = requests.post(lead_url, headers=headers, json=upsert_data)
-    resp_json = resp.json()
+    try:
+        with phase('upsert'):
+            resp = upstream.post(lead_url, account=account, headers=headers, json=upsert_data)
+        resp_json = resp.json()
+    except RateLimitExceeded:
+        # Over the account's Zoho budget: keep the lead for the queue worker rather than fail it
+        return lead_queued_response(enqueue_lead(account, payload), reason='rate_limited')
+    except CircuitOpen:
+        return lead_queued_response(enqueue_lead(account, payload), reason='circuit_open')
+    except (requests.RequestException, ValueError) as e:
+        return JsonResponse({'error': f'Zoho upsert failed: {e}', 'account': account.account_name}, status=502)
 
     # Extract Lead ID if successful
-    lead_id = None
-    action = "created"
-    try:
-        if resp.status_code in [200, 201]:
-            data = resp_json.get('data', [])
-            if data and data[0].get('status') == 'success':
-                lead_id = data[0].get('details', {}).get('id')
-                action = data[0].get('action', 'success')
-    except:
-        pass
+    lead_id, action = summarize_upsert(resp.status_code, resp_json)
+    invalidate_leads(account, [payload], [lead_id])
+    mirror_upserted(account, [payload], [lead_id])
+    fingerprints.remember(account, key, payload, lead_id, action, fingerprint)
 
     return JsonResponse({
         'lead_id': lead_id,
@@ -447,6 +323,186 @@ def proxy_lead(request):
         'response': resp_json
     })
 
+@csrf_exempt
+def proxy_lead_bulk(request):
+    """
+    Upsert many leads at once. Accepts a JSON array, {"tenant_id": ..., "data": [...]},
+    or NDJSON (one lead per line, tenant_id in the query string).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST allowed'}, status=405)
+
+    tenant_id = request.GET.get('tenant_id')
+    try:
+        if request.content_type in ('application/x-ndjson', 'application/jsonl'):
+            records = [json.loads(line) for line in request.body.splitlines() if line.strip()]
+        else:
+            body = json.loads(request.body)
+            if isinstance(body, dict):
+                tenant_id = body.get('tenant_id') or tenant_id
+                records = body.get('data')
+            else:
+                records = body
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    if not isinstance(records, list) or not records or not all(isinstance(r, dict) for r in records):
+        return JsonResponse({'error': 'Expected a non-empty list of lead objects'}, status=400)
+
+    max_records = getattr(settings, 'ZOHO_BULK_MAX_RECORDS', 5000)
+    if len(records) > max_records:
+        return JsonResponse({'error': f'Too many records: {len(records)} (max {max_records})'}, status=413)
+
+    account = resolve_account(tenant_id)
+
+    if not account:
+        return JsonResponse({'error': f'Zoho account not found for tenant: {tenant_id or "Primary"}'}, status=400)
+
+    all_keys = set()
+    for record in records:
+        record.pop('tenant_id', None)
+        if 'Last_Name' not in record and 'last_name' not in record:
+            record['Last_Name'] = 'Unknown' # Default for Zoho mandatory field
+        all_keys.update(record.keys())
+
+    # One schema check for the union of keys instead of one per record
+    ensure_fields_exist(account, 'Leads', all_keys)
+
+    results = upsert_leads(account, records)
+    mirror_upserted(account, records, [result['lead_id'] for result in results])
+    fingerprints.remember_results(account, records, results)
+    for index, result in enumerate(results):
+        result['index'] = index
+
+    succeeded = sum(1 for r in results if r['status'] == 'success')
+    return JsonResponse({
+        'account': account.account_name,
+        'total': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    })
+
+@csrf_exempt
+def lead_import(request):
+    """
+    Queue a large CSV/NDJSON file of leads for the Bulk Write API (run by `import_leads`).
+    Send it as multipart `file` or as the raw body (text/csv or application/x-ndjson).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST allowed'}, status=405)
+
+    upload = request.FILES.get('file')
+    tenant_id = request.POST.get('tenant_id') if upload else None
+    tenant_id = tenant_id or request.GET.get('tenant_id')
+    fmt = request.GET.get('format') or detect_format(upload.name if upload else '', request.content_type)
+    if fmt not in ('csv', 'ndjson'):
+        return JsonResponse({'error': 'Send a .csv or .ndjson file (or pass ?format=csv|ndjson)'}, status=400)
+
+    account = resolve_account(tenant_id)
+
+    if not account:
+        return JsonResponse({'error': f'Zoho account not found for tenant: {tenant_id or "Primary"}'}, status=400)
+
+    # Copied to disk block by block, never held in memory whole
+    if upload:
+        source_path = save_upload(upload.chunks(), fmt)
+    else:
+        source_path = save_upload(iter(lambda: request.read(64 * 1024), b''), fmt)
+
+    lead_import = LeadImport.objects.create(account=account, format=fmt, source_path=source_path)
+    return JsonResponse({
+        'status': lead_import.status,
+        'import_id': str(lead_import.pk),
+        'status_url': reverse('lead_import_status', args=[lead_import.pk]),
+        'results_url': reverse('lead_import_results', args=[lead_import.pk])
+    }, status=202)
+
+def lead_import_status(request, import_id):
+    lead_import = LeadImport.objects.filter(pk=import_id).first()
+    if not lead_import:
+        return JsonResponse({'error': 'Import not found'}, status=404)
+    return JsonResponse({
+        'import_id': str(lead_import.pk),
+        'status': lead_import.status,
+        'succeeded': lead_import.succeeded,
+        'failed': lead_import.failed,
+        'zoho_job_ids': lead_import.zoho_job_ids,
+        'error': lead_import.error or None,
+        'created_at': lead_import.created_at.isoformat(),
+        'finished_at': lead_import.finished_at.isoformat() if lead_import.finished_at else None
+    })
+
+def lead_import_results(request, import_id):
+    """The per-row result CSV (row, status, record_id, errors), streamed from disk."""
+    lead_import = LeadImport.objects.filter(pk=import_id).first()
+    if not lead_import:
+        return JsonResponse({'error': 'Import not found'}, status=404)
+    if lead_import.status not in (LeadImport.STATUS_DONE, LeadImport.STATUS_FAILED) or not lead_import.result_path:
+        return JsonResponse({'error': 'Import not finished yet', 'status': lead_import.status}, status=409)
+    try:
+        result_file = open(lead_import.result_path, 'rb')
+    except FileNotFoundError:
+        return JsonResponse({'error': 'Result file is gone'}, status=410)
+    return FileResponse(result_file, as_attachment=True, filename=f'lead-import-{lead_import.pk}.csv',
+                        content_type='text/csv')
+
+def lead_job_status(request, job_id):
+    job = LeadJob.objects.filter(pk=job_id).first()
+    if not job:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    return JsonResponse({
+        'job_id': str(job.pk),
+        'status': job.status,
+        'attempts': job.attempts,
+        'result': job.result,
+        'created_at': job.created_at.isoformat(),
+        'updated_at': job.updated_at.isoformat()
+    })
+
+def rate_limit_status(request):
+    """Current Zoho API budget per account, as seen by this worker."""
+    levels = bucket_levels()
+    names = dict(ZohoAccount.objects.filter(pk__in=list(levels)).values_list('pk', 'account_name'))
+    return JsonResponse({
+        'accounts': [dict(level, account_id=pk, account=names.get(pk)) for pk, level in levels.items()]
+    })
+
+def circuit_status(request):
+    """Circuit breaker state per Zoho origin (api_domain / accounts server), as seen by this worker."""
+    return JsonResponse({
+        'circuits': [dict(state, origin=origin) for origin, state in breaker.states().items()]
+    })
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; every worker process reports its own numbers."""
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+def timing_summary(request):
+    """Latency percentiles per endpoint, per request phase and per Zoho api_domain, for this worker."""
+    return JsonResponse({
+        'endpoints': [dict(stats, endpoint=endpoint)
+                      for (endpoint,), stats in metrics.request_duration.summary().items()],
+        'phases': [dict(stats, endpoint=endpoint, phase=name)
+                   for (endpoint, name), stats in metrics.phase_duration.summary().items()],
+        'upstream': [dict(stats, api_domain=domain)
+                     for (domain,), stats in metrics.upstream_duration.summary().items()],
+    })
+
+def mirrored_lead_response(account, lead_data):
+    if lead_data:
+        return JsonResponse({
+            'status': 'success',
+            'account': account.account_name,
+            'source': 'mirror',
+            'data': lead_data
+        })
+    return JsonResponse({
+        'status': 'not_found',
+        'source': 'mirror',
+        'message': 'No lead found matching the provided criteria'
+    }, status=404)
+
 @csrf_exempt
 def get_lead(request):
     """
@@ -456,44 +512,29 @@ def get_lead(request):
     params = request.GET if request.method == 'GET' else json.loads(request.body or '{}')
     
     tenant_id = params.get('tenant_id')
-    if not tenant_id:
-        account = ZohoAccount.objects.filter(is_active=True, is_primary=True).first()
-    else:
-        account = ZohoAccount.objects.filter(tenant_id=tenant_id, is_active=True).first()
+    account = resolve_account(tenant_id)
 
     if not account:
         return JsonResponse({'error': 'Zoho account not found'}, status=400)
 
-    token = get_valid_token(account)
-    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
-    
-    lead_id = params.get('id')
-    email = params.get('email')
-    phone = params.get('phone')
-
-    lead_data = None
-    
-    # 1. Fetch by ID
-    if lead_id:
-        url = f"{account.api_domain}/crm/v2/Leads/{lead_id}"
-        resp = requests.get(url, headers=headers)
-        if resp.status_code == 200:
-            lead_data = resp.json().get('data', [None])[0]
-    
-    # 2. Search by Email or Phone if ID not found or not provided
-    if not lead_data and (email or phone):
-        criteria = []
-        if email: criteria.append(f"(Email:equals:{email})")
-        if phone: criteria.append(f"(Phone:equals:{phone})")
-        
-        # Combine criteria with OR if both provided
-        final_criteria = criteria[0] if len(criteria) == 1 else f"({'OR'.join(criteria)})"
-        
-        search_url = f"{account.api_domain}/crm/v2/Leads/search"
-        resp = requests.get(search_url, headers=headers, params={'criteria': final_criteria})
-        
-        if resp.status_code == 200:
-            lead_data = resp.json().get('data', [None])[0]
+    # Accounts with a lead mirror answer from it while it's fresh enough (?source=zoho skips it)
+    if params.get('source') != 'zoho':
+        try:
+            max_age = int(params['max_age']) if params.get('max_age') not in (None, '') else None
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'max_age must be a number of seconds'}, status=400)
+        answered, lead_data = lookup_mirrored_lead(account, params.get('id'), params.get('email'),
+                                                   params.get('phone'), max_age)
+        if answered:
+            return mirrored_lead_response(account, lead_data)
+
+    # By ID first, then by Email or Phone; answered from the lead cache when it was looked up lately
+    try:
+        lead_data = lookup_lead(account, params.get('id'), params.get('email'), params.get('phone'))
+    except CircuitOpen as e:
+        return circuit_open_response(e)
+    except (requests.RequestException, ValueError) as e:
+        return JsonResponse({'error': f'Zoho lookup failed: {e}'}, status=502)
 
     if lead_data:
         return JsonResponse({
@@ -507,54 +548,63 @@ def get_lead(request):
             'message': 'No lead found matching the provided criteria'
         }, status=404)
 
-# --- Zoho Bookings Helpers ---
+def _ndjson_pages(first, pages, limit):
+    sent = 0
+    try:
+        for page in chain([first], pages):
+            if limit is not None:
+                page = page[:limit - sent]
+            sent += len(page)
+            yield ''.join(json.dumps(lead) + '\n' for lead in page)
+            if limit is not None and sent >= limit:
+                break
+    except (requests.RequestException, ValueError) as e:
+        # Headers are long gone; the last line tells the client the export is incomplete
+        logger.warning("Lead export stopped after %s records: %s", sent, e)
+        yield json.dumps({'error': f'Zoho export failed: {e}', 'exported': sent}) + '\n'
+    finally:
+        pages.close()
+
+def export_leads(request):
+    """
+    Stream leads as NDJSON, one per line. Query: tenant_id, email, phone, criteria (Zoho
+    search criteria), modified_since (ISO 8601), fields (comma-separated), limit.
+    Without filters every lead is listed, least recently modified first.
+    """
+    tenant_id = request.GET.get('tenant_id')
+    account = resolve_account(tenant_id)
 
-def format_date_for_zoho(date_obj):
-    return date_obj.strftime("%d-%b-%Y")
+    if not account:
+        return JsonResponse({'error': 'Zoho account not found'}, status=400)
 
-def format_datetime_for_zoho(date_obj, time_24h):
-    return f"{date_obj.strftime('%d-%b-%Y')} {time_24h}:00"
+    modified_since = request.GET.get('modified_since')
+    if modified_since:
+        parsed = parse_datetime(modified_since)
+        if parsed is None:
+            return JsonResponse({'error': 'modified_since must be an ISO 8601 datetime'}, status=400)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        modified_since = parsed.isoformat(timespec='seconds')
+    try:
+        limit = int(request.GET['limit']) if request.GET.get('limit') else None
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number'}, status=400)
+    fields = [f.strip() for f in request.GET.get('fields', '').split(',') if f.strip()]
+
+    pages = iter_lead_pages(account, email=request.GET.get('email'), phone=request.GET.get('phone'),
+                            criteria=request.GET.get('criteria'), modified_since=modified_since, fields=fields)
+    # The first page is fetched up front, so a failing Zoho still gets a proper error status
+    try:
+        first = next(pages, [])
+    except CircuitOpen as e:
+        return circuit_open_response(e)
+    except (requests.RequestException, ValueError) as e:
+        return JsonResponse({'error': f'Zoho export failed: {e}'}, status=502)
 
-def get_available_slots(account, date_obj, service_id, staff_id):
-    token = get_valid_token(account)
-    headers = {'Authorization': f'Zoho-oauthtoken {token}'}
-    base_domain = account.api_domain
-    url = f"{base_domain}/bookings/v1/json/availableslots"
-    
-    params = {
-        "service_id": service_id,
-        "staff_id": staff_id,
-        "selected_date": format_date_for_zoho(date_obj),
-        "time_zone": account.timezone
-    }
-    
-    print(f"DEBUG: Fetching slots from {url} with params {params}")
-    resp = requests.get(url, headers=headers, params=params)
-    
-    if resp.status_code == 200:
-        data = resp.json()
-        print(f"DEBUG: Slots Raw Response: {json.dumps(data)}")
-        
-        return_value = data.get("response", {}).get("returnvalue", {})
-        
-        # Zoho's response structure is notoriously inconsistent.
-        # We check both the top-level status and the internal 'reponse' flag.
-        outer_status = data.get("response", {}).get("status")
-        inner_status = return_value.get("response") or return_value.get("reponse")
-        slot_data = return_value.get("data")
-        
-        # It's a success if outer status is success AND inner_status is either 'success' or True
-        is_success = outer_status == "success" and (inner_status == "success" or inner_status is True)
-        
-        if is_success and isinstance(slot_data, list):
-            print(f"DEBUG: Found {len(slot_data)} slots")
-            return slot_data
-        else:
-            print(f"DEBUG: No valid slots in response. Inner Status: {inner_status}, Data Type: {type(slot_data)}")
-            
-    return []
+    return StreamingHttpResponse(_ndjson_pages(first, pages, limit), content_type='application/x-ndjson')
 
 @csrf_exempt
+@idempotent('proxy_booking')
 def proxy_booking(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'Only POST allowed'}, status=405)
@@ -565,121 +615,33 @@ def proxy_booking(request):
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
 
     tenant_id = payload.get('tenant_id')
-    if not tenant_id:
-        # Fallback to primary account if tenant_id not specified
-        account = ZohoAccount.objects.filter(is_active=True, is_primary=True).first()
-    else:
-        account = ZohoAccount.objects.filter(tenant_id=tenant_id, is_active=True).first()
+    account = resolve_account(tenant_id)
 
     if not account:
         return JsonResponse({'error': 'Zoho account not found for this tenant'}, status=400)
 
-    service_id = payload.get('service_id') or account.bookings_service_id
-    staff_id = payload.get('staff_id') or account.bookings_staff_id
-    
-    if not service_id or not staff_id:
-        return JsonResponse({'error': 'Bookings Service ID or Staff ID not configured'}, status=400)
-
-    date_str = payload.get('date') # Expected YYYY-MM-DD
-    time_str = payload.get('time') # Expected HH:MM (24h)
-    
     try:
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        
-        # Parse time string - supports both "HH:MM" and "HH:MM AM/PM"
-        time_obj = None
-        for fmt in ["%H:%M", "%I:%M %p", "%I:%M%p"]:
-            try:
-                time_obj = datetime.strptime(time_str.strip(), fmt)
-                break
-            except ValueError:
-                continue
-        
-        if not time_obj:
-            return JsonResponse({'error': 'Time format not recognized. Use HH:MM or HH:MM AM/PM'}, status=400)
-
-        # Combine date and time for a full comparison
-        booking_datetime = date_obj.replace(hour=time_obj.hour, minute=time_obj.minute)
-        
-        # Standardize time_str to 24h for consistency in internal logic
-        time_str = booking_datetime.strftime("%H:%M")
-        
-        # Check if requested time is in the past
-        if booking_datetime < datetime.now():
-            return JsonResponse({
-                'error': f'Cannot book in the past. Requested: {booking_datetime.strftime("%Y-%m-%d %H:%M")}, Current: {datetime.now().strftime("%Y-%m-%d %H:%M")}'
-            }, status=400)
-    except Exception as e:
-        return JsonResponse({'error': f'Invalid date or time format: {str(e)}'}, status=400)
-
-    customer_name = payload.get('name')
-    customer_email = payload.get('email')
-    customer_phone = payload.get('phone')
-
-    # Collect all other fields to send as custom fields to Zoho Bookings
-    # We exclude the internal fields used by the proxy itself
-    excluded_fields = {'date', 'time', 'name', 'email', 'phone', 'tenant_id', 'service_id', 'staff_id'}
-    
-    # Custom fields in Zoho Bookings JSON API usually go inside any_additional_info
-    additional_info = {}
-    for key, value in payload.items():
-        if key not in excluded_fields:
-            additional_info[key] = value
-
-    customer_info = {
-        "name": customer_name,
-        "email": customer_email,
-        "phone_number": customer_phone,
-    }
-    
-    # Strategy: Send custom fields in ALL known Zoho formats to ensure one sticks.
-    if additional_info:
-        # 1. any_additional_info (Standard)
-        customer_info["any_additional_info"] = additional_info
-        
-        # 2. custom_fields (Legacy/Alternative)
-        customer_info["custom_fields"] = additional_info
-        
-        # 3. Root Level (Falback)
-        for k, v in additional_info.items():
-            if k not in customer_info:
-                customer_info[k] = v
+        booking = prepare_booking(payload, account)
+    except BookingRequestError as e:
+        return JsonResponse(e.body, status=e.status)
 
     # 1. Try to book
     token = get_valid_token(account)
     headers = {'Authorization': f'Zoho-oauthtoken {token}'}
+    booking_url = f"{account.api_domain}/bookings/v1/json/appointment"
     
-    base_domain = account.api_domain
-    booking_url = f"{base_domain}/bookings/v1/json/appointment"
-    
-    from_time = format_datetime_for_zoho(date_obj, time_str)
-    
-    
-    # --- PROXY FIX FOR MANDATORY FIELDS (State) ---
-    # Ensure "State" is also mapped to its numeric ID if present
-    # This ID was found via debugging network logs (Step 299)
-    if "State" in additional_info:
-        additional_info["407473000000047017"] = additional_info["State"]
-        
-    post_data = {
-        "service_id": service_id,
-        "staff_id": staff_id,
-        "from_time": from_time,
-        "customer_details": json.dumps(customer_info),
-        # CRITICAL FIX: Send custom fields as TOP-LEVEL parameters separate from customer_details
-        # This matches the behavior that finally worked in test_booking.py
-        "additional_fields": json.dumps(additional_info),
-        "custom_fields": json.dumps(additional_info)
-    }
-    
-    print(f"DEBUG: Attempting Zoho Booking...")
-    print(f"DEBUG: URL: {booking_url}")
-    print(f"DEBUG: Data: {post_data}")
+    logger.debug("Attempting Zoho booking at %s: %s", booking_url, LazyJson(booking['post_data']),
+                 extra={'sampled': True})
     
-    resp = requests.post(booking_url, headers=headers, data=post_data)
+    try:
+        with phase('book'):
+            resp = upstream.post(booking_url, account=account, headers=headers, data=booking['post_data'])
+    except CircuitOpen as e:
+        return circuit_open_response(e)
+    except requests.RequestException as e:
+        return JsonResponse({'error': f'Zoho booking request failed: {e}'}, status=502)
     
-    print(f"DEBUG: Zoho Response Status: {resp.status_code}")
-    print(f"DEBUG: Zoho Response Text: {resp.text}")
+    logger.debug("Zoho booking response [%s]: %s", resp.status_code, BodyPreview(resp), extra={'sampled': True})
 
     raw_zoho_resp = resp.text
     try:
@@ -688,82 +650,43 @@ def proxy_booking(request):
         return JsonResponse({'error': 'Invalid response from Zoho', 'raw': raw_zoho_resp}, status=500)
     
     if res_data.get("booking_id"):
+        invalidate_slots(account, booking['date_obj'], booking['staff_id'])
         return JsonResponse({
             'status': 'booking done',
             'booking_id': res_data.get("booking_id"),
             'details': res_data
         })
     
-    # 2. If booking failed, check why
-    zoho_msg = res_data.get("message", "Unknown error")
-    print(f"DEBUG: Booking failed. Zoho message: {zoho_msg}")
-    
-    # If the error is NOT about availability/taken slots, return the error immediately
-    taken_keywords = ["taken", "available", "booked", "busy", "exists"]
-    zoho_msg_lower = zoho_msg.lower()
-    is_taken_error = any(k in zoho_msg_lower for k in taken_keywords)
-    
-    if not is_taken_error:
-        # Check if it's a "Mandatory Field" error
-        import re
-        # Pattern: "Custom field [State''] fields are mandatory"
-        # Pattern: "'State' is mandatory"
-        mandatory_match = re.search(r"Custom field \[(.*?)'?"'\] fields are mandatory', zoho_msg)
-        if not mandatory_match:
-            mandatory_match = re.search(r"'(.*?)' is mandatory", zoho_msg)
-            
-        if mandatory_match:
-            field_name = mandatory_match.group(1).replace("'", "").strip()
-            return JsonResponse({
-                'status': 'missing_fields',
-                'message': f'Zoho requires a mandatory field: {field_name}',
-                'fields': {field_name: "REQUIRED"},
-                'raw_zoho_error': zoho_msg
-            }, status=400)
-
-        return JsonResponse({
-            'status': 'error',
-            'message': f'Zoho Booking failed: {zoho_msg}',
-            'details': res_data,
-            'raw_zoho_response': raw_zoho_resp
-        }, status=400)
+    # 2. If booking failed, check why; anything but a taken slot goes straight back
+    failure = booking_failure(res_data, raw_zoho_resp)
+    if failure:
+        body, status = failure
+        return JsonResponse(body, status=status)
 
     # 3. If slot IS taken, fetch alternative available slots
-    print(f"DEBUG: Slot taken/unavailable for {from_time}. Searching for alternative slots...")
+    logger.info("Slot %s unavailable; searching for alternative slots", booking['from_time'])
     
-    current_date = date_obj
-    for i in range(7): # Check up to 7 days ahead
-        slots = get_available_slots(account, current_date, service_id, staff_id)
-        if slots:
-            # --- SELF-CORRECTION LOGIC ---
-            # If our requested time is actually IN the available list,
-            # then the booking failed for a REASON OTHER THAN availability.
-            # We should return the original Zoho error.
-            # IMPORTANT: Only check this for the requested date (i == 0)
-            if i == 0:
-                r1 = booking_datetime.strftime("%I:%M %p")
-                r2 = r1.lstrip('0')
-                clean_slots = [s.strip() for s in slots]
-                if r1 in clean_slots or r2 in clean_slots or time_str in clean_slots:
-                    return JsonResponse({
-                        'status': 'error',
-                        'message': f'Zoho rejected the booking for a non-availability reason: {zoho_msg}',
-                        'details': res_data,
-                        'raw_zoho_response': raw_zoho_resp
-                    }, status=400)
-            
-            # If we are here, it means it's a real availability issue (truly not in the list or a different day)
-            return JsonResponse({
-                'status': 'slot unavailable',
-                'message': f'The requested slot was reported as unavailable. Here are available slots for {format_date_for_zoho(current_date)}',
-                'date': current_date.strftime("%Y-%m-%d"),
-                'available_slots': slots,
-                'zoho_debug_msg': zoho_msg
-            })
-        current_date += timedelta(days=1)
+    # Zoho says the slot is gone, so cached availability for that day is stale
+    invalidate_slots(account, booking['date_obj'], booking['staff_id'])
+    found = find_alternative_slots(account, booking, token)
+    body, status = slot_search_response(booking, res_data, raw_zoho_resp, found)
+    return JsonResponse(body, status=status)
 
-    return JsonResponse({
-        'status': 'error',
-        'message': 'No available slots found in the next 7 days.',
-        'zoho_error': res_data.get("message")
-    }, status=400)
+def available_slots(request):
+    """
+    Free booking slots for one or more days, served from the slot cache where possible.
+    Query: tenant_id, date (YYYY-MM-DD, default today), days (default 1), service_id, staff_id.
+    """
+    tenant_id = request.GET.get('tenant_id')
+    account = resolve_account(tenant_id)
+
+    if not account:
+        return JsonResponse({'error': 'Zoho account not found for this tenant'}, status=400)
+
+    try:
+        service_id, staff_id, date_obj, days = slot_query(request.GET, account)
+    except BookingRequestError as e:
+        return JsonResponse(e.body, status=e.status)
+
+    slot_days = get_slot_days(account, date_obj, days, service_id, staff_id)
+    return JsonResponse(slot_days_response(account, service_id, staff_id, slot_days))
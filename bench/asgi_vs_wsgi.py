@@ -0,0 +1,61 @@
+"""
+Compare proxy throughput under WSGI (gunicorn, threaded sync views) and ASGI
+(uvicorn, async views) against the local mock Zoho server.
+
+    pip install gunicorn uvicorn httpx
+    python bench/asgi_vs_wsgi.py --requests 2000 --concurrency 100 --latency 0.05
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.harness import (  # noqa: E402
+    SERVER_COMMANDS, free_port, mock_process, prepare_database, proxy_server, server_env, unique_lead_email,
+)
+from bench.loadgen import format_result, run_load  # noqa: E402
+
+
+def lead_request(i):
+    payload = {'Last_Name': f'Bench {i}', 'Email': unique_lead_email(), 'Company': 'Bench Inc'}
+    return 'POST', '/api/leads/', {'content': json.dumps(payload), 'headers': {'Content-Type': 'application/json'}}
+
+
+def run_server(command, env, port, args):
+    with proxy_server(command, env, port) as base_url:
+        # Warm the field cache and connection pools before measuring
+        run_load(base_url, lead_request, min(args.concurrency, 50), min(args.concurrency, 10))
+        return run_load(base_url, lead_request, args.requests, args.concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05, help='Mock Zoho latency per call, seconds')
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn threads for the WSGI run')
+    args = parser.parse_args()
+
+    results = []
+    with mock_process(['--latency', str(args.latency)]) as mock_url:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='zoho_bench_'), 'bench.sqlite3')
+        prepare_database(db_path, mock_url)
+
+        port = free_port()
+        results.append((f"WSGI gunicorn x{args.threads} threads", run_server(
+            SERVER_COMMANDS['wsgi'](port, args.threads), server_env(db_path, async_views=False), port, args)))
+
+        port = free_port()
+        results.append(("ASGI uvicorn async views", run_server(
+            SERVER_COMMANDS['asgi'](port, args.threads), server_env(db_path, async_views=True), port, args)))
+
+    print(f"POST /api/leads/ x{args.requests}, concurrency {args.concurrency}, mock latency {args.latency * 1000:.0f} ms")
+    for name, result in results:
+        print(format_result(name, result))
+
+
+if __name__ == '__main__':
+    main()
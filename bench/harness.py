@@ -0,0 +1,95 @@
+"""Process plumbing shared by the benchmark scripts: the mock, a throwaway database, the proxy server."""
+import itertools
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_COMMANDS = {
+    'wsgi': lambda port, threads: [sys.executable, '-m', 'gunicorn', 'zoho_proxy.wsgi:application',
+                                   '--workers', '1', '--threads', str(threads), '--bind', f'127.0.0.1:{port}'],
+    'asgi': lambda port, threads: [sys.executable, '-m', 'uvicorn', 'zoho_proxy.asgi:application', '--workers', '1',
+                                   '--host', '127.0.0.1', '--port', str(port), '--no-access-log'],
+}
+
+# Lead emails unique to this run (and to each request in it), so repeated runs against the
+# same database don't hit the proxy's unchanged-lead short-circuit
+RUN_ID = uuid.uuid4().hex[:8]
+_lead_numbers = itertools.count()
+
+
+def unique_lead_email():
+    return f'bench-{RUN_ID}-{next(_lead_numbers)}@example.com'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+@contextmanager
+def mock_process(mock_argv=()):
+    """Run bench/mock_zoho.py in its own process (so it doesn't share a GIL with the load); yields its url."""
+    port = free_port()
+    mock = subprocess.Popen([sys.executable, os.path.join(ROOT, 'bench', 'mock_zoho.py'),
+                             '--port', str(port), *mock_argv], stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        mock.terminate()
+        mock.wait(timeout=10)
+
+
+def prepare_database(db_path, mock_url):
+    """Migrate a fresh SQLite database and point the primary account at the mock."""
+    os.environ['BENCH_DB'] = db_path
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'bench.settings'
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.utils import timezone
+
+    from base.models import ZohoAccount
+
+    call_command('migrate', verbosity=0)
+    ZohoAccount.objects.create(
+        account_name='Benchmark Account', tenant_id='bench', access_token='mock-access-token',
+        refresh_token='mock-refresh-token', api_domain=mock_url, accounts_server=mock_url,
+        expiry_time=timezone.now() + timedelta(days=1), is_primary=True,
+        bookings_service_id='svc-1', bookings_staff_id='staff-1',
+    )
+
+
+def server_env(db_path, async_views):
+    return dict(os.environ, BENCH_DB=db_path, DJANGO_SETTINGS_MODULE='bench.settings', PYTHONPATH=ROOT,
+                ZOHO_ASYNC_VIEWS='1' if async_views else '0')
+
+
+@contextmanager
+def proxy_server(command, env, port):
+    """Run the proxy with `command` until the block exits; yields its base url."""
+    proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
@@ -0,0 +1,114 @@
+"""
+Offline load benchmark: drives the proxy's lead, lead lookup and booking endpoints against the
+local mock Zoho server and reports throughput and p50/p95/p99 latency per scenario.
+
+    pip install gunicorn httpx
+    python bench/load.py --requests 1000 --concurrency 50
+    python bench/load.py --scenario lead --server asgi --error-rate 0.02 --rate-limit-rate 0.01
+    python bench/load.py --url http://127.0.0.1:8000 --tenant-id my-tenant
+
+With --url the proxy (and whatever Zoho it points at) is used as is; otherwise the mock, a
+throwaway database and the proxy are started here. Mock options (latency, error injection)
+are the ones of bench/mock_zoho.py.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from contextlib import ExitStack
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.harness import (  # noqa: E402
+    RUN_ID, SERVER_COMMANDS, free_port, mock_process, prepare_database, proxy_server, server_env, unique_lead_email,
+)
+from bench.loadgen import format_result, run_load  # noqa: E402
+from bench.mock_zoho import add_mock_arguments, mock_arguments  # noqa: E402
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+# The mock's free slots per day, in the proxy's 24h input format
+SLOT_TIMES = ['09:00', '10:00', '11:00', '14:00', '15:00']
+
+
+def lead_email(i):
+    # Stable within a run, so get_lead finds the leads seeded under the same index
+    return f'bench-{RUN_ID}-seed{i}@example.com'
+
+
+def lead_request(tenant_id, i, email=None):
+    payload = {'tenant_id': tenant_id, 'Last_Name': f'Bench {i}', 'Email': email or unique_lead_email(),
+               'Company': 'Bench Inc'}
+    return 'POST', '/api/leads/', {'content': json.dumps(payload), 'headers': JSON_HEADERS}
+
+
+def get_lead_request(tenant_id, i, known_leads):
+    return 'GET', '/api/leads/get/', {'params': {'tenant_id': tenant_id, 'email': lead_email(i % known_leads)}}
+
+
+def booking_request(tenant_id, i):
+    # Distinct (day, slot) pairs, so most bookings succeed; repeats hit the taken-slot search
+    day = date.today() + timedelta(days=1 + i // len(SLOT_TIMES))
+    payload = {'tenant_id': tenant_id, 'date': day.isoformat(), 'time': SLOT_TIMES[i % len(SLOT_TIMES)],
+               'name': f'Bench {i}', 'email': lead_email(i), 'phone': f'555{i:07d}'}
+    return 'POST', '/api/bookings/', {'content': json.dumps(payload), 'headers': JSON_HEADERS}
+
+
+def scenario_builders(tenant_id, known_leads):
+    return {
+        'lead': ('POST /api/leads/', lambda i: lead_request(tenant_id, i)),
+        'get_lead': ('GET /api/leads/get/', lambda i: get_lead_request(tenant_id, i, known_leads)),
+        'booking': ('POST /api/bookings/', lambda i: booking_request(tenant_id, i)),
+    }
+
+
+def run_scenarios(base_url, args):
+    known_leads = max(1, min(args.requests, args.seed_leads))
+    builders = scenario_builders(args.tenant_id, known_leads)
+    # Lookups need leads to find; this also warms the field cache and connection pools
+    run_load(base_url, lambda i: lead_request(args.tenant_id, i, lead_email(i)), known_leads,
+             min(args.concurrency, 10))
+
+    results = []
+    for scenario in args.scenario or list(builders):
+        name, build = builders[scenario]
+        offset = known_leads if scenario == 'booking' else 0
+        results.append((name, run_load(base_url, lambda i: build(i + offset), args.requests, args.concurrency)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--scenario', action='append', choices=['lead', 'get_lead', 'booking'],
+                        help='Scenario to run; repeatable (default: all, in this order)')
+    parser.add_argument('--seed-leads', type=int, default=200, help='Leads created before measuring')
+    parser.add_argument('--server', choices=sorted(SERVER_COMMANDS), default='wsgi')
+    parser.add_argument('--threads', type=int, default=32, help='gunicorn threads for --server wsgi')
+    parser.add_argument('--url', help='Benchmark an already running proxy instead of starting one')
+    parser.add_argument('--tenant-id', default='bench')
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    with ExitStack() as stack:
+        base_url = args.url
+        if not base_url:
+            mock_url = stack.enter_context(mock_process(mock_arguments(args)))
+            db_path = os.path.join(tempfile.mkdtemp(prefix='zoho_bench_'), 'bench.sqlite3')
+            prepare_database(db_path, mock_url)
+            port = free_port()
+            base_url = stack.enter_context(proxy_server(
+                SERVER_COMMANDS[args.server](port, args.threads),
+                server_env(db_path, async_views=args.server == 'asgi'), port))
+        results = run_scenarios(base_url, args)
+
+    target = args.url or f"{args.server} proxy, mock latency {args.latency * 1000:.0f} ms"
+    print(f"{args.requests} requests per scenario, concurrency {args.concurrency} ({target})")
+    for name, result in results:
+        print(format_result(name, result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Closed-loop HTTP load generator: `concurrency` clients issuing requests back to back."""
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def _run(base_url, build_request, total, concurrency, timeout):
+    latencies = []
+    statuses = {}
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        async def client_loop():
+            for i in counter:
+                method, path, kwargs = build_request(i)
+                started = time.perf_counter()
+                try:
+                    resp = await client.request(method, path, **kwargs)
+                    status = resp.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'mean': statistics.fmean(latencies) if latencies else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'statuses': statuses,
+    }
+
+
+def run_load(base_url, build_request, total, concurrency, timeout=60.0):
+    """
+    Drive `total` requests at `concurrency`. `build_request(i)` returns (method, path, httpx kwargs).
+    Returns throughput (req/s) and latency percentiles (seconds).
+    """
+    return asyncio.run(_run(base_url, build_request, total, concurrency, timeout))
+
+
+def format_result(name, result):
+    statuses = ', '.join(f"{k}: {v}" for k, v in sorted(result['statuses'].items(), key=str))
+    return (f"{name:<28} {result['throughput']:>9.1f} req/s   "
+            f"p50 {result['p50'] * 1000:>7.1f} ms   p95 {result['p95'] * 1000:>7.1f} ms   "
+            f"p99 {result['p99'] * 1000:>7.1f} ms   [{statuses}]")
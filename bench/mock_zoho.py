@@ -0,0 +1,328 @@
+"""
+A local stand-in for the Zoho endpoints the proxy calls, for offline benchmarking.
+
+    python bench/mock_zoho.py --port 9100 --latency 0.05
+    python bench/mock_zoho.py --route-latency upsert_leads=0.2 --error-rate 0.02 --rate-limit-rate 0.01
+
+Point a ZohoAccount's api_domain and accounts_server at http://127.0.0.1:9100. Routes are
+named after their handler functions below (upsert_leads, available_slots, ...).
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+STANDARD_FIELDS = ['First_Name', 'Last_Name', 'Email', 'Company', 'Phone', 'Mobile', 'Lead_Source',
+                   'Lead_Status', 'Industry', 'Website', 'Description']
+
+
+class MockZohoState:
+    """
+    Shared by all handler threads. `route_latency` overrides `latency` per route name; errors
+    are injected at random: `rate_limit_rate` of calls get a 429 with Retry-After and
+    `error_rate` get `error_status`, limited to `error_routes` when given.
+    """
+
+    def __init__(self, latency=0.0, route_latency=None, jitter=0.0, error_rate=0.0, error_status=500,
+                 rate_limit_rate=0.0, error_routes=None, seed=None):
+        self.latency = latency
+        self.route_latency = dict(route_latency or {})
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rate_limit_rate = rate_limit_rate
+        self.error_routes = set(error_routes or ())
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.fields = set(STANDARD_FIELDS)
+        self.leads = {}
+        self.lead_ids = {}
+        self.booked = set()
+        self.ids = itertools.count(4876876000000100001)
+        self.request_count = 0
+        self.route_counts = {}
+        self.injected_errors = 0
+
+    def delay_for(self, route_name):
+        delay = self.route_latency.get(route_name, self.latency)
+        if self.jitter:
+            with self.lock:
+                delay += self.random.uniform(0, self.jitter)
+        return delay
+
+    def injected_error(self, route_name):
+        """(status, body, headers) to answer instead of the route, or None."""
+        if self.error_routes and route_name not in self.error_routes:
+            return None
+        with self.lock:
+            roll = self.random.random()
+            if roll < self.rate_limit_rate:
+                self.injected_errors += 1
+                return 429, {'code': 'TOO_MANY_REQUESTS', 'message': 'API limit exceeded'}, {'Retry-After': '1'}
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.injected_errors += 1
+                return self.error_status, {'code': 'INTERNAL_ERROR', 'message': 'Injected failure'}, {}
+        return None
+
+
+class MockZohoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode() if status != 204 else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(raw or b'{}')
+        return {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = self._body() if method == 'POST' else {}
+
+        route = ROUTES.get((method, url.path))
+        if route is None and method == 'GET' and url.path.startswith('/crm/v2/Leads/'):
+            route = get_lead_by_id
+        route_name = route.__name__ if route else 'unknown'
+        with self.state.lock:
+            self.state.request_count += 1
+            self.state.route_counts[route_name] = self.state.route_counts.get(route_name, 0) + 1
+        delay = self.state.delay_for(route_name)
+        if delay:
+            time.sleep(delay)
+
+        if route is None:
+            return self._send(404, {'code': 'INVALID_URL_PATTERN', 'message': 'Please check if the URL trying to access is a correct one'})
+        error = self.state.injected_error(route_name)
+        if error:
+            return self._send(*error)
+        status, payload = route(self.state, url.path, query, body)
+        self._send(status, payload)
+
+
+def oauth_token(state, path, query, body):
+    return 200, {'access_token': 'mock-access-token', 'expires_in': 3600, 'api_domain': 'http://mock'}
+
+
+def user_info(state, path, query, body):
+    return 200, {'Display_Name': 'Mock User', 'Email': 'mock@example.com'}
+
+
+def org_info(state, path, query, body):
+    return 200, {'org': [{'company_name': 'Mock Org'}]}
+
+
+def list_fields(state, path, query, body):
+    with state.lock:
+        return 200, {'fields': [{'api_name': name} for name in sorted(state.fields)]}
+
+
+def create_fields(state, path, query, body):
+    rows = []
+    with state.lock:
+        for field in body.get('fields', []):
+            state.fields.add(field['api_name'])
+            rows.append({'code': 'SUCCESS', 'status': 'success', 'details': {'api_name': field['api_name']}})
+    return 201, {'fields': rows}
+
+
+def upsert_leads(state, path, query, body):
+    rows = []
+    with state.lock:
+        for record in body.get('data', []):
+            key = (record.get('Email') or '').lower() or record.get('Phone')
+            lead_id = state.lead_ids.get(key)
+            action = 'update' if lead_id else 'insert'
+            if not lead_id:
+                lead_id = str(next(state.ids))
+                if key:
+                    state.lead_ids[key] = lead_id
+            state.leads[lead_id] = dict(state.leads.get(lead_id, {}), id=lead_id, **record)
+            rows.append({'code': 'SUCCESS', 'status': 'success', 'action': action,
+                         'message': 'record updated' if action == 'update' else 'record added',
+                         'details': {'id': lead_id}})
+    return 200, {'data': rows}
+
+
+def search_leads(state, path, query, body):
+    wanted = re.findall(r'\((\w+):equals:([^)]+)\)', query.get('criteria', ''))
+    with state.lock:
+        matches = [lead for lead in state.leads.values()
+                   if any(str(lead.get(field, '')).lower() == value.lower() for field, value in wanted)]
+    if not matches:
+        return 204, {}
+    return 200, {'data': matches, 'info': {'count': len(matches), 'more_records': False}}
+
+
+def get_lead_by_id(state, path, query, body):
+    with state.lock:
+        lead = state.leads.get(path.rsplit('/', 1)[-1])
+    if not lead:
+        return 204, {}
+    return 200, {'data': [lead]}
+
+
+def bookings_ok(returnvalue):
+    return {'response': {'status': 'success', 'returnvalue': returnvalue}}
+
+
+def list_services(state, path, query, body):
+    return 200, bookings_ok({'data': [{'id': 'svc-1', 'name': 'Consultation'}]})
+
+
+def list_staff(state, path, query, body):
+    return 200, bookings_ok({'data': [{'id': 'staff-1', 'name': 'Mock Staff'}]})
+
+
+def list_portals(state, path, query, body):
+    return 200, bookings_ok({'portals': [{'portal_id': 'portal-1', 'portal_name': 'Mock Portal'}]})
+
+
+def service_fields(state, path, query, body):
+    return 200, bookings_ok({'fields': [{'field_id': 'notes', 'display_name': 'Notes', 'is_mandatory': True}]})
+
+
+def available_slots(state, path, query, body):
+    day = query.get('selected_date')
+    slots = ['09:00 AM', '10:00 AM', '11:00 AM', '02:00 PM', '03:00 PM']
+    with state.lock:
+        free = [s for s in slots if (day, s) not in state.booked]
+    return 200, bookings_ok({'response': True, 'data': free or 'Slots Not Available'})
+
+
+def book_appointment(state, path, query, body):
+    day, _, clock = body.get('from_time', '').partition(' ')
+    slot = time.strftime('%I:%M %p', time.strptime(clock, '%H:%M:%S')) if clock else ''
+    with state.lock:
+        if (day, slot) in state.booked:
+            return 200, bookings_ok({'status': 'failure', 'message': 'Slot not available'})
+        state.booked.add((day, slot))
+        booking_id = f"#MOCK-{next(state.ids)}"
+    return 200, bookings_ok({'status': 'success', 'booking_id': booking_id, 'start_time': body.get('from_time')})
+
+
+ROUTES = {
+    ('POST', '/oauth/v2/token'): oauth_token,
+    ('GET', '/oauth/user/info'): user_info,
+    ('GET', '/crm/v2/org'): org_info,
+    ('GET', '/crm/v2/settings/fields'): list_fields,
+    ('POST', '/crm/v2/settings/fields'): create_fields,
+    ('POST', '/crm/v2/Leads/upsert'): upsert_leads,
+    ('GET', '/crm/v2/Leads/search'): search_leads,
+    ('GET', '/bookings/v1/json/services'): list_services,
+    ('GET', '/bookings/v1/json/staffs'): list_staff,
+    ('GET', '/bookings/v1/json/portals'): list_portals,
+    ('GET', '/bookings/v1/json/fields'): service_fields,
+    ('GET', '/bookings/v1/json/availableslots'): available_slots,
+    ('POST', '/bookings/v1/json/appointment'): book_appointment,
+}
+
+
+class MockZohoServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, state):
+        super().__init__(address, MockZohoHandler)
+        self.state = state
+
+
+def start_mock_server(port=0, latency=0.0, **options):
+    """
+    Start the mock in a background thread; returns the server (its url is `server.url`).
+    `options` are passed to MockZohoState (route_latency, error_rate, ...).
+    """
+    server = MockZohoServer(('127.0.0.1', port), MockZohoState(latency, **options))
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _route_latency(value):
+    name, _, seconds = value.partition('=')
+    try:
+        return name, float(seconds)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected ROUTE=SECONDS, got {value!r}")
+
+
+def add_mock_arguments(parser):
+    """Latency and error-injection options, shared with the benchmark scripts."""
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds added to every response')
+    parser.add_argument('--route-latency', type=_route_latency, action='append', default=[], metavar='ROUTE=SECONDS',
+                        help='Latency for one route (e.g. upsert_leads=0.2); repeatable')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of calls answered with 429')
+    parser.add_argument('--error-route', action='append', default=[], metavar='ROUTE',
+                        help='Only inject errors on this route; repeatable')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for jitter and error injection')
+
+
+def mock_arguments(args):
+    """The command line that reproduces the parsed mock options, for starting it as a subprocess."""
+    argv = ['--latency', str(args.latency), '--jitter', str(args.jitter), '--error-rate', str(args.error_rate),
+            '--error-status', str(args.error_status), '--rate-limit-rate', str(args.rate_limit_rate)]
+    for name, seconds in args.route_latency:
+        argv += ['--route-latency', f"{name}={seconds}"]
+    for name in args.error_route:
+        argv += ['--error-route', name]
+    if args.seed is not None:
+        argv += ['--seed', str(args.seed)]
+    return argv
+
+
+def state_from_args(args):
+    return MockZohoState(args.latency, route_latency=dict(args.route_latency), jitter=args.jitter,
+                         error_rate=args.error_rate, error_status=args.error_status,
+                         rate_limit_rate=args.rate_limit_rate, error_routes=args.error_route, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=9100)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockZohoServer(('127.0.0.1', args.port), state_from_args(args))
+    print(f"Mock Zoho listening on http://127.0.0.1:{args.port} (latency {args.latency}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"Served {server.state.request_count} requests ({server.state.injected_errors} injected errors): "
+          f"{server.state.route_counts}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""Settings for benchmark runs: a throwaway database and async views toggled from the environment."""
+import os
+
+from zoho_proxy.settings import *  # noqa: F401,F403
+
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['BENCH_DB'],
+        'OPTIONS': {'timeout': 30},
+    }
+}
+
+ZOHO_ASYNC_VIEWS = os.environ.get('ZOHO_ASYNC_VIEWS') == '1'
+
+# The mock has no API budget; pacing calls to Zoho's limits would only measure the rate limiter
+ZOHO_RATE_LIMIT_RATE = 100000
+ZOHO_RATE_LIMIT_BURST = 100000
+
+# One log line per request would mostly measure the terminal
+ZOHO_LOG_LEVEL = 'WARNING'
+LOGGING['loggers']['base']['level'] = ZOHO_LOG_LEVEL
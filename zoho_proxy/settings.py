@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'base.middleware.timing_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -129,4 +132,168 @@ ZOHO_REDIRECT_URI = 'http://127.0.0.1:8000/api/oauth/zoho/callback/'
 ZOHO_AUTH_URL = 'https://accounts.zoho.com/oauth/v2/auth'
 ZOHO_TOKEN_URL = 'https://accounts.zoho.com/oauth/v2/token'
 # Scopes for CRM leads, metadata, identity, and Bookings
-ZOHO_SCOPES = 'ZohoCRM.modules.leads.CREATE,ZohoCRM.modules.leads.READ,ZohoCRM.settings.fields.CREATE,ZohoCRM.settings.fields.READ,ZohoCRM.users.READ,ZohoCRM.org.READ,zohobookings.data.READ,zohobookings.data.CREATE'
+ZOHO_SCOPES = 'ZohoCRM.modules.leads.CREATE,ZohoCRM.modules.leads.READ,ZohoCRM.settings.fields.CREATE,ZohoCRM.settings.fields.READ,ZohoCRM.users.READ,ZohoCRM.org.READ,zohobookings.data.READ,zohobookings.data.CREATE,ZohoCRM.bulk.ALL,ZohoFiles.files.ALL'
+
+# Field metadata cache used by ensure_fields_exist (seconds / max cached modules)
+ZOHO_FIELD_CACHE_TTL = 600
+ZOHO_FIELD_CACHE_MAXSIZE = 256
+
+# OAuth token refresh: refresh this many seconds before expiry, serialised across
+# workers with a per-account file lock in ZOHO_LOCK_DIR
+ZOHO_TOKEN_REFRESH_MARGIN = 300
+ZOHO_LOCK_DIR = Path(tempfile.gettempdir()) / 'zoho_proxy_locks'
+
+# Pooled keep-alive sessions for Zoho upstream calls (one pool per domain)
+ZOHO_HTTP_POOL_SIZE = 20
+ZOHO_HTTP_CONNECT_TIMEOUT = 5
+ZOHO_HTTP_READ_TIMEOUT = 30
+ZOHO_HTTP_RETRIES = 2
+ZOHO_HTTP_BACKOFF = 0.3
+
+# Bulk lead ingestion: records per upsert call (Zoho caps this at 100) and per request
+ZOHO_UPSERT_BATCH_SIZE = 100
+ZOHO_BULK_MAX_RECORDS = 5000
+
+# Serve the proxy endpoints with the async views (base/async_views.py, needs httpx).
+# Only worth enabling under an ASGI server such as uvicorn.
+ZOHO_ASYNC_VIEWS = False
+ZOHO_ASYNC_POOL_SIZE = 200
+
+# Alternative-slot search after a taken booking: default/max days to search (per-request
+# `search_days`), days looked up at once per request, and threads shared by all searches
+ZOHO_SLOT_SEARCH_DAYS = 7
+ZOHO_SLOT_SEARCH_MAX_DAYS = 31
+ZOHO_SLOT_SEARCH_CONCURRENCY = 4
+ZOHO_SLOT_SEARCH_WORKERS = 16
+
+# Bookings availability cache (seconds / max cached days). Entries for a day are dropped
+# when this proxy books on it; bookings made elsewhere show up once the entry expires.
+ZOHO_SLOT_CACHE_TTL = 60
+ZOHO_SLOT_CACHE_MAXSIZE = 2048
+
+# Resolved tenant -> account cache (seconds / max cached tenants). Saving or deleting an
+# account clears it in every worker on the host via a version file in ZOHO_LOCK_DIR.
+ZOHO_ACCOUNT_CACHE_TTL = 300
+ZOHO_ACCOUNT_CACHE_MAXSIZE = 1024
+
+# Refreshed access tokens live in a token store and reach the DB from a background thread.
+# Set ZOHO_TOKEN_CACHE_ALIAS to a CACHES alias (e.g. a shared Redis or file cache) to share
+# tokens between workers; by default each process keeps its own.
+ZOHO_TOKEN_CACHE_ALIAS = None
+ZOHO_TOKEN_STORE_MAXSIZE = 1024
+ZOHO_BACKGROUND_WORKERS = 2
+
+# Field creation: per-field requests in flight when Zoho refuses a batched create, and how
+# long a field Zoho rejected is skipped before being tried again (seconds)
+ZOHO_FIELD_CREATE_CONCURRENCY = 4
+ZOHO_FIELD_FAILURE_TTL = 3600
+
+# Bookings field discovery (account/fields/<pk>/): parsed mandatory fields per service, the
+# endpoint/method that works per data center and the portal per account, and how long an
+# endpoint/method that rejects the call with a 400/404/405, or answers 5xx, is skipped (seconds)
+ZOHO_SERVICE_FIELDS_CACHE_TTL = 600
+ZOHO_FIELDS_PROBE_TTL = 86400
+ZOHO_FIELDS_PROBE_FAILURE_TTL = 600
+ZOHO_FIELDS_PROBE_ERROR_TTL = 60
+ZOHO_BOOKINGS_META_CACHE_MAXSIZE = 1024
+
+# Bulk imports (import_leads / POST /api/leads/import/) through the Bulk Write API: rows per
+# job (Zoho's limit is 25,000), job status polling interval and timeout (seconds), the unique
+# field existing leads are matched on, and where uploads and result files are kept
+ZOHO_BULK_WRITE_CHUNK = 25000
+ZOHO_BULK_POLL_INTERVAL = 10
+ZOHO_BULK_POLL_TIMEOUT = 3600
+ZOHO_BULK_FIND_BY = 'Email'
+ZOHO_IMPORT_DIR = BASE_DIR / 'imports'
+
+# Per-account pacing of Zoho API calls (token bucket): credits per second, burst size, the
+# longest a call waits for its turn (leads over budget are queued instead), and retries of
+# 429 answers after the Retry-After / X-RATELIMIT-RESET delay
+ZOHO_RATE_LIMIT_RATE = 10
+ZOHO_RATE_LIMIT_BURST = 20
+ZOHO_RATE_LIMIT_MAX_WAIT = 5.0
+ZOHO_RATE_LIMIT_RETRIES = 2
+
+# Circuit breaker per Zoho origin (api_domain / accounts server): it opens when, over the
+# last ZOHO_BREAKER_WINDOW seconds and at least ZOHO_BREAKER_MIN_CALLS calls, the share of
+# failed calls (no response or 5xx) or of calls slower than ZOHO_BREAKER_SLOW_CALL seconds
+# reaches its rate. While open, calls fail fast (leads are queued, other endpoints answer
+# 503); after ZOHO_BREAKER_OPEN_SECONDS, ZOHO_BREAKER_HALF_OPEN_PROBES calls test the way.
+ZOHO_BREAKER_WINDOW = 30
+ZOHO_BREAKER_MIN_CALLS = 10
+ZOHO_BREAKER_ERROR_RATE = 0.5
+ZOHO_BREAKER_SLOW_CALL = 5.0
+ZOHO_BREAKER_SLOW_RATE = 0.5
+ZOHO_BREAKER_OPEN_SECONDS = 30
+ZOHO_BREAKER_HALF_OPEN_PROBES = 1
+
+# Lead lookups (GET /api/leads/get/), including misses, are cached per tenant and id/Email/
+# Phone (seconds / max entries); upserts through the proxy drop the matching entries
+ZOHO_LEAD_CACHE_TTL = 30
+ZOHO_LEAD_CACHE_MAXSIZE = 4096
+
+# Single-lead upserts remember a hash of what they sent per tenant + Email/Phone: a repeat of
+# the same payload is answered without calling Zoho, and a changed one only sends the fields
+# that differ. Hashes older than this (seconds) are ignored, so edits made in Zoho itself
+# are overwritten by the next repeat after that. Off unless ZOHO_LEAD_FINGERPRINT_CACHE_ALIAS
+# names a CACHES alias shared by every web worker, process_lead_queue and import_leads
+# (Redis, Memcached or the database cache, not the per-process locmem default).
+ZOHO_LEAD_FINGERPRINT_TTL = 86400
+ZOHO_LEAD_FINGERPRINT_CACHE_ALIAS = None
+
+# process_lead_queue waits this long (seconds) before retrying a job that failed because Zoho
+# was unreachable, throttled or answered 5xx, doubling after each attempt up to the maximum
+ZOHO_LEAD_QUEUE_RETRY_BACKOFF = 5
+ZOHO_LEAD_QUEUE_RETRY_BACKOFF_MAX = 300
+
+# Lead mirror (accounts with lead_mirror_enabled, kept up to date by `manage.py sync_leads
+# --loop`): GET /api/leads/get/ answers from it while its last sync started at most this many
+# seconds ago (per request: ?max_age=, or ?source=zoho to bypass it)
+ZOHO_LEAD_MIRROR_MAX_AGE = 300
+
+# Lead export (GET /api/leads/export/): records per Zoho page (at most 200), and how many
+# exports can have their next page loading in the background at once
+ZOHO_EXPORT_PAGE_SIZE = 200
+ZOHO_EXPORT_PREFETCH_WORKERS = 8
+
+# Idempotency-Key on POST /api/leads/ and /api/bookings/: how long responses are replayed,
+# how long a duplicate waits for the original to finish, and after how long an unfinished
+# original is assumed dead (seconds). Expired keys: `python manage.py purge_idempotency_keys`.
+ZOHO_IDEMPOTENCY_TTL = 86400
+ZOHO_IDEMPOTENCY_WAIT = 30
+ZOHO_IDEMPOTENCY_LOCK_TIMEOUT = 120
+
+# Per-request phase timings (resolve, token, fields, upsert/book, slot_search, zoho...) are
+# logged by `base.timing`, aggregated per endpoint and api_domain (GET /api/timings/), and
+# returned in a Server-Timing header unless this is False
+ZOHO_SERVER_TIMING = True
+
+# Logging: records go through a queue to a background thread (requests never wait on log
+# I/O), tokens and lead contact details are redacted, and verbose Zoho request/response
+# bodies are kept for only ZOHO_LOG_BODY_SAMPLE_RATE of calls. ZOHO_LOG_JSON switches the
+# `key=value` lines to one JSON object per line.
+ZOHO_LOG_LEVEL = os.environ.get('ZOHO_LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO')
+ZOHO_LOG_BODY_SAMPLE_RATE = float(os.environ.get('ZOHO_LOG_BODY_SAMPLE_RATE', 1.0 if DEBUG else 0.01))
+ZOHO_LOG_JSON = os.environ.get('ZOHO_LOG_JSON', '') == '1'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sample': {'()': 'base.log.SamplingFilter', 'rate': ZOHO_LOG_BODY_SAMPLE_RATE},
+        'redact': {'()': 'base.log.RedactingFilter'},
+    },
+    'formatters': {
+        'structured': {'()': 'base.log.StructuredFormatter', 'json_lines': ZOHO_LOG_JSON},
+    },
+    'handlers': {
+        'queue': {
+            '()': 'base.log.QueueLogHandler',
+            'formatter': 'structured',
+            'filters': ['sample', 'redact'],
+        },
+    },
+    'loggers': {
+        'base': {'handlers': ['queue'], 'level': ZOHO_LOG_LEVEL, 'propagate': False},
+    },
+}